@@ -1,41 +1,48 @@
 from flask import Blueprint, request, jsonify
 from db import get_db_connection 
+from site_resolver import get_user_site
+from pagination import get_page_args
+from patient_repository import build_query, list_patients, row_key
+from streaming import get_stream_format, stream_query
+from data_versions import bump
+from site_counters import patient_status_changed
+from patient_transitions import apply_transition, summarize, validate_items
 
 patient_ecb = Blueprint("EmergencyCodeBreak",__name__)
 @patient_ecb.route('/patients/not_code_broken', methods=['GET'])
 def get_patients_not_code_broken():
     """
     Returns a list of patients who are not yet 'Code Broken' and have not completed treatment.
-    Optionally filtered by the 'sites' associated with the provided username.
+    Limited to the 'sites' associated with the provided username, which is required.
     Username is expected as a query parameter: /patients/not_code_broken?username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
     username = request.args.get('username')
+    if not username:
+        return jsonify({"message": "Username parameter is missing."}), 400
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
     conn = get_db_connection()
     if conn is None:
         return jsonify({"patients": []}), 500
 
     cursor = conn.cursor(dictionary=True)
-    site = None
 
     try:
-        if username:
-            cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-            site_data = cursor.fetchone()
-            if site_data and site_data['sites']:
-                site = site_data['sites']
-            else:
-                print(f"Warning: User '{username}' not found or has no associated site for code break eligibility.")
-                return jsonify({"patients": []}), 200
-
-        if site:
-            query = "SELECT id, patient_name FROM patients WHERE status != 'Code Broken' AND TRT_completion_date IS NULL AND Code_break IS NULL AND sites = %s"
-            cursor.execute(query, (site,))
-        else:
-            query = "SELECT id, patient_name FROM patients WHERE status != 'Code Broken' AND TRT_completion_date IS NULL AND Code_breakIS NULL"
-            cursor.execute(query)
-
-        eligible_patients = cursor.fetchall()
-        return jsonify({"eligible_patients": eligible_patients})
+        site = get_user_site(username)
+        if not site:
+            print(f"Warning: User '{username}' not found or has no associated site for code break eligibility.")
+            return jsonify({"patients": []}), 200
+
+        if stream_format:
+            query, params = build_query('code_break_eligible', site, page)
+            return stream_query(query, params, "eligible_patients", stream_format, page, row_key('code_break_eligible'))
+        eligible_patients, page_fields = list_patients(conn, 'code_break_eligible', site, page)
+        return jsonify({"eligible_patients": eligible_patients, **page_fields})
 
     except Exception as e:
         print(f"Error fetching eligible patients for code break: {e}")
@@ -65,7 +72,7 @@ def record_code_break():
     cursor = conn.cursor()
     try:
         # 1. Check if patient exists and is not already code broken
-        cursor.execute("SELECT status, Code_break FROM patients WHERE id = %s", (patient_id,))
+        cursor.execute("SELECT status, Code_break, sites FROM patients WHERE id = %s FOR UPDATE", (patient_id,))
         patient_data = cursor.fetchone()
 
         print(patient_data)
@@ -82,9 +89,12 @@ def record_code_break():
         """
         print("error after update")
         cursor.execute(update_query, ('Code Broken', Code_break, patient_id,))
+        updated = cursor.rowcount
+        patient_status_changed(cursor, patient_data[2], patient_data[0], 'Code Broken', updated)
+        bump(cursor, 'patients', patient_data[2])
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             return jsonify({"message": "No patient updated (might be already code broken or ID mismatch)"}), 200
 
         return jsonify({
@@ -100,3 +110,37 @@ def record_code_break():
     finally:
         cursor.close()
         conn.close()
+
+
+@patient_ecb.route('/record_code_breaks', methods=['POST'])
+def record_code_breaks():
+    """
+    Records emergency code breaks for a batch of patients in one transaction.
+    Expects JSON: { "username": "...", "items": [{ "patientId": "...", "date": "YYYY-MM-DD" }, ...] }
+    Only patients of the user's site are updated.
+    Returns one result per item plus succeeded/failed counts.
+    """
+    data = request.get_json() or {}
+    items = data.get('items')
+    error = validate_items(items)
+    if error:
+        return jsonify({"error": error}), 400
+    username = data.get('username')
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+    user_site = get_user_site(username)
+    if not user_site:
+        return jsonify({"message": f"User '{username}' not found or has no associated site."}), 401
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    try:
+        results = apply_transition(conn, 'code_break', items, user_site)
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        print(f"Error recording batch emergency code breaks: {e}")
+        return jsonify({"message": "Failed to record batch emergency code breaks", "error": str(e)}), 500
+    finally:
+        conn.close()
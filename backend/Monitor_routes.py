@@ -1,5 +1,13 @@
 from flask import Blueprint, jsonify, request
 from db import get_db_connection # Make sure this import path is correct for your project
+from site_resolver import get_user_site
+from session_tokens import current_session, require_session
+from pagination import get_page_args
+from patient_repository import build_query, list_patients, row_key
+from streaming import get_stream_format, stream_query
+from data_versions import bump, conditional, for_user_site
+from site_summary import build_site_summary
+from site_counters import patient_status_changed
 from datetime import datetime, timezone
 
 # Create a Blueprint for monitor-specific routes
@@ -9,29 +17,13 @@ def get_user_site_from_db(username):
     """
     Fetches the 'sites' associated with a given username from the users table.
     This is a helper function for both monitor and potentially other modules.
+    Lookups go through the shared site_resolver cache.
     """
-    conn = None
-    cursor = None
-    site = None
     try:
-        conn = get_db_connection()
-        if conn is None:
-            print("Database connection failed in get_user_site_from_db.")
-            return None
-
-        cursor = conn.cursor(dictionary=True) # Use dictionary=True for column names as keys
-        cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-        site_data = cursor.fetchone()
-        if site_data and 'sites' in site_data:
-            site = site_data['sites']
+        return get_user_site(username)
     except Exception as e:
         print(f"Error fetching user site for {username}: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
-    return site
+        return None
 
 @monitor_bp.route('/monitor/get_user_site', methods=['GET'])
 def get_user_site_route():
@@ -52,15 +44,23 @@ def get_user_site_route():
         return jsonify({"userSite": None, "message": f"User '{username}' not found or no site assigned."}), 404
 
 @monitor_bp.route('/monitor/patients', methods=['GET'])
+@conditional(for_user_site('patients'))
 def get_all_patients_for_monitor():
     """
     Returns a list of all active patients (is_deleted = 0) for the monitor's assigned site.
     The monitor's site is determined using the provided username.
     Expected query parameter: username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient_id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
     username = request.args.get('username')
     if not username:
         return jsonify({"message": "Username parameter is missing."}, 400)
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
 
     user_site = get_user_site_from_db(username)
     if user_site is None:
@@ -77,14 +77,11 @@ def get_all_patients_for_monitor():
 
         # Fetch patients for the assigned site where is_deleted is 0
         # Columns selected match the frontend's expectation for display
-        cursor.execute("""
-            SELECT id AS patient_id, sites AS site_id, status
-            FROM patients
-            WHERE sites = %s and status != 'Code Broken'
-            ORDER BY id
-        """, (user_site,))
-        patients_data = cursor.fetchall()
-        return jsonify({"patients": patients_data}), 200
+        if stream_format:
+            query, params = build_query('monitor_roster', user_site, page)
+            return stream_query(query, params, "patients", stream_format, page, row_key('monitor_roster'))
+        patients_data, page_fields = list_patients(conn, 'monitor_roster', user_site, page)
+        return jsonify({"patients": patients_data, **page_fields}), 200
     except Exception as e:
         print(f"Error fetching all patients for site {user_site}: {e}")
         return jsonify({"message": f"Failed to retrieve patient data: {str(e)}"}, 500)
@@ -119,22 +116,8 @@ def get_code_broken_patients_for_monitor():
             raise Exception("Database connection failed.")
         cursor = conn.cursor(dictionary=True)
 
-        # Fetch patients from the user's site where code_break is NOT NULL
-        # Assuming 'code_break' column in 'patients' table stores the reason/timestamp directly
-        # or you have a separate 'code_breaks' table.
-        # Based on your previous patient_bp code, it seems 'code_break' is a column in 'patients'.
-        # Let's assume it stores a reason string, and we'll add a 'break_timestamp' if not present,
-        # or adapt if it's just a boolean/flag.
-        # For this example, I'll assume `code_break` stores a string reason, and you might need
-        # a separate `code_break_timestamp` column if you need an exact timestamp.
-        # If `code_break` just stores 'True' or 'Yes', you'll need to adjust.
-        # I'll include a placeholder for `date_broken` for consistency with frontend.
-
-        cursor.execute("""
-            SELECT id as patient_id, status, code_break from patients where sites=%s 
-            and status="Code Broken"
-        """, (user_site,))
-        code_broken_data = cursor.fetchall()
+        # Fetch patients from the user's site whose code has been broken
+        code_broken_data, _ = list_patients(conn, 'code_broken', user_site)
         return jsonify({"code_broken_patients": code_broken_data}), 200
     except Exception as e:
         print(f"Error fetching code broken patients for site {user_site}: {e}")
@@ -145,21 +128,58 @@ def get_code_broken_patients_for_monitor():
         if conn and conn.is_connected():
             conn.close()
 
+@monitor_bp.route('/site_summary', methods=['GET'])
+@conditional(for_user_site('patients', 'packs', 'consignments'))
+def get_site_summary():
+    """
+    Returns everything the site dashboards show on load in one response:
+    { "site", "patient_counts": {status: n}, "total_patients",
+      "code_broken_patients": [...], "pending_shipments": [...],
+      "available_packs": {pack_type: n} }
+    Expected query parameter: username=<username>
+    """
+    username = request.args.get('username')
+    if not username:
+        return jsonify({"message": "Username parameter is missing."}), 400
+
+    user_site = get_user_site_from_db(username)
+    if user_site is None:
+        return jsonify({"message": f"User '{username}' not found or no site assigned."}), 404
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            raise Exception("Database connection failed.")
+        return jsonify(build_site_summary(conn, user_site)), 200
+    except Exception as e:
+        print(f"Error building site summary for site {user_site}: {e}")
+        return jsonify({"message": f"Failed to retrieve site summary: {str(e)}"}), 500
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
 @monitor_bp.route('/monitor/record_code_break', methods=['POST'])
+@require_session('Monitor')
 def record_code_break():
     """
     Records an emergency code break for a patient.
     Expects JSON payload: { "patientId": "...", "reason": "...", "brokenBy": "...", "userSite": "..." }
+    Monitors only. The user and site are the session's; brokenBy and userSite are
+    optional and must match them.
     Updates the 'code_break' column in the 'patients' table and potentially 'status'.
     """
     data = request.get_json()
+    session = current_session()
     patient_id = data.get('patientId')
     reason = data.get('reason')
-    broken_by = data.get('brokenBy') # This is the username performing the break
-    user_site = data.get('userSite') # Frontend sends userSite directly
+    broken_by = session['user'] # The username performing the break
+    user_site = session['site']
 
-    if not all([patient_id, reason, broken_by, user_site]):
-        return jsonify({"message": "Missing required fields (patientId, reason, brokenBy, userSite)"}), 400
+    if not all([patient_id, reason]):
+        return jsonify({"message": "Missing required fields (patientId, reason)"}), 400
+    if data.get('brokenBy', broken_by) != broken_by or data.get('userSite', user_site) != user_site:
+        return jsonify({"message": "brokenBy and userSite must match your session"}), 403
 
     conn = None
     cursor = None
@@ -171,7 +191,7 @@ def record_code_break():
 
         # 1. Verify patient exists, belongs to the specified site, and is not already code broken
         cursor.execute(
-            "SELECT id, code_break FROM patients WHERE id = %s AND sites = %s and status != 'Code Broken' ",
+            "SELECT id, code_break, status FROM patients WHERE id = %s AND sites = %s and status != 'Code Broken' FOR UPDATE",
             (patient_id, user_site)
         )
         patient_data = cursor.fetchone()
@@ -195,10 +215,12 @@ def record_code_break():
             WHERE id = %s
         """
         cursor.execute(sql_update_patient_for_code_break, ('Code Broken', reason, break_timestamp, patient_id))
-
+        updated = cursor.rowcount
+        patient_status_changed(cursor, user_site, patient_data[2], 'Code Broken', updated)
+        bump(cursor, 'patients', user_site)
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             return jsonify({"message": "No patient updated (unexpected error). Please check logs."}), 500
 
         return jsonify({
@@ -1,5 +1,12 @@
 from flask import Blueprint, request, jsonify
 from db import get_db_connection
+from site_resolver import get_user_site
+from pagination import get_page_args
+from patient_repository import build_query, list_patients, row_key
+from streaming import get_stream_format, stream_query
+from data_versions import bump
+from site_counters import patient_status_changed
+from patient_transitions import apply_transition, summarize, validate_items
 
 patient_tc = Blueprint('treatmentcom',__name__)
 @patient_tc.route('/patients/randomized_for_completion', methods=['GET'])
@@ -7,36 +14,36 @@ def get_randomized_patients_for_completion():
     """
     Returns a list of patients with 'Randomized' status who have an assigned pack
     and have not yet completed treatment.
-    Optionally filtered by the 'sites' associated with the provided username.
+    Limited to the 'sites' associated with the provided username, which is required.
     Username is expected as a query parameter: /patients/randomized_for_completion?username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
     username = request.args.get('username')
+    if not username:
+        return jsonify({"message": "Username parameter is missing."}), 400
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
     conn = get_db_connection()
     if conn is None:
         return jsonify({"patients": []}), 500
 
     cursor = conn.cursor(dictionary=True)
-    site = None
 
     try:
-        if username:
-            cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-            site_data = cursor.fetchone()
-            if site_data and site_data['sites']:
-                site = site_data['sites']
-            else:
-                print(f"Warning: User '{username}' not found or has no associated site for treatment completion.")
-                return jsonify({"patients": []}), 200
-
-        if site:
-            query = "SELECT id, patient_name FROM patients WHERE status = 'Randomized' AND assigned_pack_id IS NOT NULL AND TRT_Completion_Date IS NULL AND sites = %s"
-            cursor.execute(query, (site,))
-        else:
-            query = "SELECT id, patient_name FROM patients WHERE status = 'Randomized' AND assigned_pack_id IS NOT NULL AND TRT_TRT_Completion_Date IS NULL"
-            cursor.execute(query)
-
-        eligible_patients = cursor.fetchall()
-        return jsonify({"eligible_patients": eligible_patients})
+        site = get_user_site(username)
+        if not site:
+            print(f"Warning: User '{username}' not found or has no associated site for treatment completion.")
+            return jsonify({"patients": []}), 200
+
+        if stream_format:
+            query, params = build_query('randomized_for_completion', site, page)
+            return stream_query(query, params, "eligible_patients", stream_format, page, row_key('randomized_for_completion'))
+        eligible_patients, page_fields = list_patients(conn, 'randomized_for_completion', site, page)
+        return jsonify({"eligible_patients": eligible_patients, **page_fields})
 
     except Exception as e:
         print(f"Error fetching eligible patients for treatment completion: {e}")
@@ -66,7 +73,7 @@ def complete_treatment():
     cursor = conn.cursor()
     try:
         # 1. Check if patient exists and is 'Randomized' and has an assigned pack
-        cursor.execute("SELECT status, assigned_pack_id, TRT_Completion_Date FROM patients WHERE id = %s", (patient_id,))
+        cursor.execute("SELECT status, assigned_pack_id, TRT_Completion_Date, sites FROM patients WHERE id = %s FOR UPDATE", (patient_id,))
         patient_data = cursor.fetchone()
 
         if not patient_data:
@@ -83,9 +90,12 @@ def complete_treatment():
         WHERE id = %s
         """
         cursor.execute(update_query, ('Treatment Completed', TRT_Completion_Date, patient_id))
+        updated = cursor.rowcount
+        patient_status_changed(cursor, patient_data[3], 'Randomized', 'Treatment Completed', updated)
+        bump(cursor, 'patients', patient_data[3])
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             return jsonify({"message": "No patient updated (might be already completed or ID mismatch)"}), 200
 
         return jsonify({
@@ -100,4 +110,38 @@ def complete_treatment():
         return jsonify({"message": "Failed to record treatment completion", "error": str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+@patient_tc.route('/complete_treatments', methods=['POST'])
+def complete_treatments():
+    """
+    Records treatment completion for a batch of patients in one transaction.
+    Expects JSON: { "username": "...", "items": [{ "patientId": "...", "date": "YYYY-MM-DD" }, ...] }
+    Only patients of the user's site are updated.
+    Returns one result per item plus succeeded/failed counts.
+    """
+    data = request.get_json() or {}
+    items = data.get('items')
+    error = validate_items(items)
+    if error:
+        return jsonify({"error": error}), 400
+    username = data.get('username')
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+    user_site = get_user_site(username)
+    if not user_site:
+        return jsonify({"message": f"User '{username}' not found or has no associated site."}), 401
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    try:
+        results = apply_transition(conn, 'treatment_completion', items, user_site)
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        print(f"Error recording batch treatment completion: {e}")
+        return jsonify({"message": "Failed to record batch treatment completion", "error": str(e)}), 500
+    finally:
+        conn.close()
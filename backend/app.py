@@ -1,10 +1,11 @@
+import os
+
 from flask import Flask, jsonify
 from flask_cors import CORS
 
 # Import blueprints from your route files
 from auth_routes import auth_bp
 from patient_routes import patient_bp
-from ScreenFailure import patient_sf
 from depot_routes import depot_bp
 from randomisation import patient_rd
 from TreatmentCompletion import patient_tc
@@ -15,17 +16,25 @@ from secret_code_site_gen import secret_site
 
 
 # Import get_db_connection from the new db.py file
-from db import get_db_connection
+from db import get_db_connection, init_app as init_db, pool_stats
+from session_tokens import init_app as init_sessions
+from site_resolver import cache_stats as user_site_cache_stats
+from sequences import sequence_stats
+from password_hashing import hashing_stats
+from site_counters import counter_stats, start_reconciler
 
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
+init_db(app) # Release each request's pooled connection at teardown
+init_sessions(app) # Verify the signed session token on every request
+# The counter reconciler is started per serving process (warmup.warm_worker under
+# gunicorn, or below), never at import: a preloading master imports this module too
 
 # Register Blueprints
 # Blueprints help organize routes into modular components
 app.register_blueprint(auth_bp)
 app.register_blueprint(patient_bp)
-app.register_blueprint(patient_sf)
 app.register_blueprint(depot_bp)
 app.register_blueprint(patient_rd)
 app.register_blueprint(patient_tc)
@@ -38,6 +47,17 @@ def home():
     """Basic home route to confirm the backend is running."""
     return "Flask backend is running!"
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Returns this worker's connection pool and cache counters, used for sizing and tuning."""
+    return jsonify({
+        "db_pool": pool_stats(),
+        "user_site_cache": user_site_cache_stats(),
+        "sequences": sequence_stats(),
+        "site_counters": counter_stats(),
+        "password_hashing": hashing_stats()
+    }), 200
+
 if __name__ == '__main__':
     # To run this Flask app:
     # 1. Save this file as app.py
@@ -45,4 +65,8 @@ if __name__ == '__main__':
     # 3. Install dependencies: pip install Flask mysql-connector-python bcrypt flask-cors
     # 4. Run from your terminal: python app.py
     # The app will run on http://127.0.0.1:5000/
+    # For production use the multi-process launcher instead: gunicorn -c gunicorn.conf.py
+    # The debug reloader runs this file twice; reconcile only in the process that serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_reconciler() # Periodic counter repair when RTSM_COUNTER_RECONCILE_INTERVAL is set
     app.run(debug=True) # debug=True for development, set to False for production
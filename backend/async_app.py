@@ -0,0 +1,288 @@
+import asyncio
+import decimal
+import json
+import os
+import uuid
+from datetime import date
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import http_date
+
+from app import app as flask_app
+from async_db import AsyncDatabase
+from consignment_state import pending_query
+from data_versions import etag_for, etag_matches, scope, versions_query
+from db import pool_stats
+from pagination import get_page_args, page_result
+from password_hashing import hashing_stats
+from patient_repository import build_query, row_key
+from sequences import sequence_stats
+from session_tokens import TOKEN_CONFIG, bearer_token, verify_token
+from site_counters import counter_stats, read_counts_query, split_counts, start_reconciler
+from site_resolver import USER_QUERY, cache_stats as user_site_cache_stats, cached_user, prime
+
+# Async serving mode.
+# The dashboard reads that clients poll (patient lists, site summary, pending
+# shipments, site lists) are served by coroutines over an async MySQL pool,
+# so concurrency comes from the event loop instead of the number of threads.
+# Everything else (writes, streamed responses, login) is passed to the Flask
+# app unchanged through a2wsgi's WSGI adapter, so every blueprint endpoint is
+# available on the same port. The adapter runs those requests on a pool of
+# RTSM_THREADS threads (default 4, as for the gthread workers, so the pool
+# size set in gunicorn.conf.py still covers them); asgiref's adapter would run
+# them all on one thread, one request at a time. Native handlers return the same response
+# shapes and ETags as the blueprint routes; a missing username or unknown
+# user is always a 400/404 here. Session tokens are verified the same way as
+# session_tokens.load_session does for the Flask app.
+#
+# Run with an ASGI server, e.g.
+#   pip install -r requirements-async.txt
+#   uvicorn async_app:app --host 127.0.0.1 --port 5000
+# or `python async_app.py`.
+
+# Patient list endpoints served natively: path -> (named query, response list key)
+PATIENT_LISTS = {
+    '/patients': ('site_roster', 'patients'),
+    '/code_not_broken': ('code_not_broken', 'patients'),
+    '/monitor/patients': ('monitor_roster', 'patients'),
+    '/monitor/code_broken_by_site': ('code_broken', 'code_broken_patients'),
+    '/patients/enrolled': ('enrolled_unrandomized', 'enrolled_patients'),
+    '/patients/randomized_for_completion': ('randomized_for_completion', 'eligible_patients'),
+    '/patients/not_code_broken': ('code_break_eligible', 'eligible_patients'),
+}
+
+# CORS(app) on the Flask side allows every origin; native responses do the same
+_CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+# Native routes reachable without a session token when tokens are required
+PUBLIC_PATHS = {'/sites', '/depot_sites', '/metrics'}
+
+# Threads serving the requests passed to the Flask app
+WSGI_THREADS = int(os.environ.get('RTSM_THREADS', 4))
+
+
+class AsyncRequest:
+    """The parts of an HTTP request the native handlers read."""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'').decode('latin-1')
+        self.args = dict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        self.session = None
+
+    @property
+    def full_path(self):
+        # Same form as Flask's request.full_path, so ETags match across modes
+        return f"{self.path}?{self.query_string}"
+
+    def wants_stream(self):
+        return bool(self.args.get('stream')) or 'application/x-ndjson' in self.headers.get('accept', '')
+
+
+def _json_default(value):
+    # Mirrors Flask's default JSON provider
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class AsyncApp:
+    """ASGI application: native async handlers for hot reads, the Flask app for the rest."""
+
+    def __init__(self, wsgi_app, db=None):
+        self.db = db or AsyncDatabase()
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=WSGI_THREADS)
+        self.routes = {path: self.patient_list for path in PATIENT_LISTS}
+        self.routes.update({
+            '/site_summary': self.site_summary,
+            '/pending_shipments': self.pending_shipments,
+            '/sites': self.sites,
+            '/depot_sites': self.sites,
+            '/metrics': self.metrics,
+        })
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] in self.routes:
+            request = AsyncRequest(scope)
+            if not request.wants_stream():
+                return await self._respond(request, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.db.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def authenticate(self, request):
+        """Verifies the bearer token onto request.session; returns a 401 response or None."""
+        token = bearer_token(request.headers.get('authorization'))
+        if token is not None:
+            request.session = verify_token(token)
+            if request.session is None:
+                return 401, {"message": "Invalid or expired session token"}, {}
+        elif TOKEN_CONFIG['required'] and request.path not in PUBLIC_PATHS:
+            return 401, {"message": "Authentication required"}, {}
+        return None
+
+    async def _respond(self, request, send):
+        try:
+            status, body, headers = self.authenticate(request) or await self.routes[request.path](request)
+        except Exception as e:
+            print(f"Error handling {request.path} in async mode: {e}")
+            status, body, headers = 500, {"message": "Request failed", "error": str(e)}, {}
+
+        payload = b'' if status == 304 else json.dumps(body, default=_json_default).encode('utf-8')
+        raw_headers = list(_CORS_HEADERS)
+        if status != 304:
+            raw_headers.append((b'content-type', b'application/json'))
+            raw_headers.append((b'content-length', str(len(payload)).encode('latin-1')))
+        raw_headers.extend((name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items())
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    # --- shared lookups -------------------------------------------------
+
+    async def user_site(self, request, username):
+        """Async counterpart of site_resolver.get_user_site: token, then cache, then one query."""
+        if request.session is not None:
+            return request.session['site'] if username == request.session['user'] else None
+        if not username:
+            return None
+        user = cached_user(username)
+        if user is None:
+            _, rows = await self.db.fetchall(USER_QUERY, (username,))
+            if not rows:
+                return None
+            user = (rows[0][0], rows[0][1])
+            prime(username, *user)
+        return user[0]
+
+    async def conditional(self, request, scopes, handler):
+        """Async counterpart of data_versions.conditional: 304 when If-None-Match matches."""
+        if not scopes:
+            status, body = await handler()
+            return status, body, {}
+        _, rows = await self.db.fetchall(*versions_query(scopes))
+        versions = dict(rows)
+        etag = etag_for(request.full_path, {name: versions.get(name, 0) for name in scopes})
+        if etag_matches(etag, request.headers.get('if-none-match')):
+            return 304, None, {'ETag': etag}
+        status, body = await handler()
+        return status, body, ({'ETag': etag} if status == 200 else {})
+
+    async def list_patients(self, name, site, page=None):
+        query, params = build_query(name, site, page)
+        rows = await self.db.fetchdicts(query, params)
+        return page_result(rows, page, row_key(name))
+
+    # --- handlers -------------------------------------------------------
+
+    async def patient_list(self, request):
+        name, list_key = PATIENT_LISTS[request.path]
+        username = request.args.get('username')
+        if not username:
+            return 400, {"message": "Username parameter is missing."}, {}
+        try:
+            page = get_page_args(request.args)
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+
+        site = await self.user_site(request, username)
+        if site is None:
+            return 404, {list_key: [], "message": f"User '{username}' not found or has no associated site."}, {}
+
+        async def handler():
+            rows, page_fields = await self.list_patients(name, site, page)
+            return 200, {list_key: rows, **page_fields}
+
+        return await self.conditional(request, [scope('patients', site)], handler)
+
+    async def site_summary(self, request):
+        username = request.args.get('username')
+        if not username:
+            return 400, {"message": "Username parameter is missing."}, {}
+        site = await self.user_site(request, username)
+        if site is None:
+            return 404, {"message": f"User '{username}' not found or no site assigned."}, {}
+
+        async def handler():
+            # The three reads are independent, so they run concurrently on separate connections
+            (_, counter_rows), (_, pending_rows), (code_broken, _) = await asyncio.gather(
+                self.db.fetchall(*read_counts_query(site)),
+                self.db.fetchall(*pending_query(site)),
+                self.list_patients('code_broken', site),
+            )
+            status_counts, pack_counts = split_counts(counter_rows)
+            return 200, {
+                "site": site,
+                "patient_counts": status_counts,
+                "total_patients": sum(status_counts.values()),
+                "code_broken_patients": code_broken,
+                "pending_shipments": [row[0] for row in pending_rows],
+                "available_packs": pack_counts,
+            }
+
+        scopes = [scope(table, site) for table in ('patients', 'packs', 'consignments')]
+        return await self.conditional(request, scopes, handler)
+
+    async def pending_shipments(self, request):
+        site = request.args.get('site')
+        if request.session is not None:
+            if site and site != request.session['site']:
+                return 403, {"message": "Cannot list shipments for another site"}, {}
+            site = request.session['site']
+        if not site:
+            return 400, {"message": "Site parameter is required"}, {}
+
+        async def handler():
+            _, rows = await self.db.fetchall(*pending_query(site))
+            return 200, {"shipments": [row[0] for row in rows]}
+
+        return await self.conditional(request, [scope('consignments', site)], handler)
+
+    async def sites(self, request):
+        query = "SELECT site_name FROM sites"
+        if request.path == '/depot_sites':
+            query += " where sites != 'Depot'"
+
+        async def handler():
+            _, rows = await self.db.fetchall(query)
+            return 200, {"sites": [row[0] for row in rows]}
+
+        return await self.conditional(request, [scope('sites')], handler)
+
+    async def metrics(self, request):
+        return 200, {
+            "db_pool": pool_stats(),
+            "async_db": self.db.stats(),
+            "user_site_cache": user_site_cache_stats(),
+            "sequences": sequence_stats(),
+            "site_counters": counter_stats(),
+            "password_hashing": hashing_stats()
+        }, {}
+
+
+app = AsyncApp(flask_app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    start_reconciler()
+    uvicorn.run(app, host=os.environ.get('RTSM_HOST', '127.0.0.1'), port=int(os.environ.get('RTSM_PORT', 5000)))
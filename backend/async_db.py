@@ -0,0 +1,69 @@
+import os
+
+from db import DB_CONFIG
+
+# Database access for the async serving mode (async_app.py).
+# Queries are awaited on an aiomysql pool, so a waiting query parks a
+# coroutine instead of a worker thread and one process can keep hundreds of
+# reads in flight. Connections run in autocommit mode: every read sees the
+# latest committed data instead of a snapshot left open on a pooled session.
+
+ASYNC_POOL_CONFIG = {
+    'minsize': int(os.environ.get('RTSM_ASYNC_POOL_MIN', 1)),
+    'maxsize': int(os.environ.get('RTSM_ASYNC_POOL_SIZE', 20)),
+}
+
+
+class AsyncDatabase:
+    """A bounded aiomysql connection pool with the two calls the async handlers need."""
+
+    def __init__(self, db_config=DB_CONFIG, minsize=ASYNC_POOL_CONFIG['minsize'], maxsize=ASYNC_POOL_CONFIG['maxsize']):
+        self.db_config = db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._pool = None
+        self._queries = 0
+
+    async def start(self):
+        # aiomysql is only needed when the async mode is used: pip install -r requirements-async.txt
+        import aiomysql
+        self._pool = await aiomysql.create_pool(
+            host=self.db_config['host'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            db=self.db_config['database'],
+            minsize=self.minsize,
+            maxsize=self.maxsize,
+            autocommit=True,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    async def fetchall(self, sql, params=()):
+        """Runs a query and returns (column names, rows as tuples)."""
+        self._queries += 1
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                columns = [column[0] for column in cursor.description] if cursor.description else []
+                return columns, await cursor.fetchall()
+
+    async def fetchdicts(self, sql, params=()):
+        """Runs a query and returns its rows as dicts."""
+        columns, rows = await self.fetchall(sql, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def stats(self):
+        pool = self._pool
+        return {
+            'driver': 'aiomysql',
+            'minsize': self.minsize,
+            'maxsize': self.maxsize,
+            'open': pool.size if pool is not None else 0,
+            'idle': pool.freesize if pool is not None else 0,
+            'queries': self._queries,
+        }
@@ -1,11 +1,22 @@
 from flask import Blueprint, request, jsonify
-import bcrypt
 # Import get_db_connection from the new db.py file
-from db import get_db_connection
+from db import get_db_connection, get_pooled_connection
+from consignment_state import pending_for_site
+from data_versions import conditional, for_site_param, for_tables
+from password_hashing import HashingOverloaded, RETRY_AFTER_SECONDS, check_password, hash_password, needs_rehash, record_rehash
+from session_tokens import current_session, issue_token, require_session
+from site_resolver import get_user_site as resolve_user_site, invalidate as invalidate_user_site, prime as prime_user_site
 
 # Create a Blueprint for authentication-related routes
 auth_bp = Blueprint('auth', __name__)
 
+
+def hashing_busy():
+    """503 returned while the password hashing queue is full."""
+    response = jsonify({"message": "Server is busy, please try again shortly"})
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register_user():
     """
@@ -21,6 +32,13 @@ def register_user():
     if not all([username, password, secret_code, site]): # Ensure site is also present
         return jsonify({"message": "Missing username, password, secret code, or site"}), 400
 
+    # Hash first (in the hashing pool, off this request thread) so no pooled
+    # connection is held while bcrypt runs
+    try:
+        hashed_password = hash_password(password)
+    except HashingOverloaded:
+        return hashing_busy()
+
     conn = get_db_connection()
     if conn is None:
         return jsonify({"message": "Database connection failed"}), 500
@@ -44,10 +62,7 @@ def register_user():
         if existing_user:
             return jsonify({"message": "Username already exists"}), 409
 
-        # 3. Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-        # 4. Insert new user into the database, including the site
+        # 3. Insert new user into the database, including the site
         insert_query = "INSERT INTO users (username, password, role, sites) VALUES (%s, %s, %s, %s)"
         cursor.execute(insert_query, (username, hashed_password, role, site))
         conn.commit()
@@ -67,6 +82,8 @@ def login_user():
     """
     Handles user login.
     Expects JSON: { "username": "...", "password": "..." }
+    The password is checked with no database connection held: bcrypt can take
+    up to the hashing timeout, and a burst of logins would otherwise drain the pool.
     """
     data = request.get_json()
     username = data.get('username')
@@ -75,26 +92,15 @@ def login_user():
     if not all([username, password]):
         return jsonify({"message": "Missing username or password"}), 400
 
-    conn = get_db_connection()
+    # 1. Retrieve user by username, on a short checkout released straight away
+    conn = get_pooled_connection()
     if conn is None:
         return jsonify({"message": "Database connection failed"}), 500
 
     cursor = conn.cursor(dictionary=True)
     try:
-        # 1. Retrieve user by username
         cursor.execute("SELECT id, username, password, role, sites FROM users WHERE username = %s", (username,))
         user = cursor.fetchone()
-    
-        if not user:
-            return jsonify({"message": "Invalid username or password"}), 401
-
-        # 2. Verify password
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
-            return jsonify({"message": "Invalid username or password"}), 401
-
-        # Login successful
-        return jsonify({"message": "Login successful", "username": user['username'], "role": user['role'], "site": user['sites']}), 200
-
     except Exception as e: # Catch a broader exception
         print(f"Error during login: {e}")
         return jsonify({"message": "Login failed", "error": str(e)}), 500
@@ -102,7 +108,52 @@ def login_user():
         cursor.close()
         conn.close()
 
+    if not user:
+        return jsonify({"message": "Invalid username or password"}), 401
+
+    try:
+        # 2. Verify password
+        if not check_password(password, user['password']):
+            return jsonify({"message": "Invalid username or password"}), 401
+    except HashingOverloaded:
+        return hashing_busy()
+
+    # Bring the stored hash up to the configured bcrypt cost; a busy pool or a
+    # failed write only postpones this to a later login
+    if needs_rehash(user['password']):
+        try:
+            store_rehash(user, hash_password(password))
+        except HashingOverloaded:
+            pass
+
+    # Login successful; warm the site cache for the dashboard calls that follow
+    prime_user_site(user['username'], user['sites'], user['role'])
+    # Signed session token: later requests send it as "Authorization: Bearer <token>"
+    token, expires_at = issue_token(user['username'], user['role'], user['sites'])
+    return jsonify({"message": "Login successful", "username": user['username'], "role": user['role'], "site": user['sites'],
+                    "token": token, "expires_at": expires_at}), 200
+
+
+def store_rehash(user, hashed_password):
+    """Replaces the user's stored hash on its own short checkout, unless the password changed meanwhile."""
+    conn = get_pooled_connection()
+    if conn is None:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                       (hashed_password, user['id'], user['password']))
+        conn.commit()
+        record_rehash()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error storing rehashed password for {user['username']}: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
 @auth_bp.route('/sites', methods=['GET'])
+@conditional(for_tables('sites'))
 def get_sites():
     """
     Fetches all available sites from the database.
@@ -131,17 +182,22 @@ def get_sites():
         conn.close()
 
 @auth_bp.route('/update_user_site', methods=['POST'])
+@require_session()
 def update_user_site():
     """
-    Updates the site for a given user.
-    Expects JSON: { "username": "...", "site": "..." }
+    Updates the site of the signed-in user.
+    Expects JSON: { "site": "...", "username": "..." }
+    username is optional and must be the session's user.
     """
-    data = request.get_json()
-    username = data.get('username')
+    data = request.get_json() or {}
+    session = current_session()
+    username = data.get('username') or session['user']
     site = data.get('site')
 
-    if not all([username, site]):
+    if not site:
         return jsonify({"message": "Missing username or site"}), 400
+    if username != session['user']:
+        return jsonify({"message": "Cannot update another user's site"}), 403
 
     conn = get_db_connection()
     if conn is None:
@@ -152,11 +208,14 @@ def update_user_site():
         update_query = "UPDATE users SET sites = %s WHERE username = %s"
         cursor.execute(update_query, (site, username))
         conn.commit()
+        invalidate_user_site(username)
 
         if cursor.rowcount == 0:
             return jsonify({"message": "User not found or site already set"}), 404
-        
-        return jsonify({"message": "User site updated successfully"}), 200
+
+        # The caller's token carries the old site, so a replacement is returned
+        token, expires_at = issue_token(username, session['role'], site)
+        return jsonify({"message": "User site updated successfully", "token": token, "expires_at": expires_at}), 200
 
     except Exception as e:
         conn.rollback()
@@ -168,14 +227,20 @@ def update_user_site():
 # In your auth.py or a new blueprint file
 
 @auth_bp.route('/pending_shipments', methods=['GET'])
+@conditional(for_site_param('consignments'))
 def get_pending_shipments():
     """
-    Fetches shipments that are pending arrival for a given site.
+    Fetches shipments that are pending arrival for the caller's site.
     Expects query parameter: ?site=SITE_NAME
+    With a session token the site is the session's; a different site is refused.
     Returns JSON: { "shipments": ["SHP001", "SHP002"] }
     """
     site = request.args.get('site')
-    print(site)
+    session = current_session()
+    if session is not None:
+        if site and site != session['site']:
+            return jsonify({"message": "Cannot list shipments for another site"}), 403
+        site = session['site']
     if not site:
         return jsonify({"message": "Site parameter is required"}), 400
 
@@ -183,24 +248,13 @@ def get_pending_shipments():
     if conn is None:
         return jsonify({"message": "Database connection failed"}), 500
 
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
     try:
-        # IMPORTANT: Adjust this query based on your actual database schema
-        # This example assumes a 'consignments' table with 'consignment_id', 'centerId', and 'status'
-        # You'll need to define what 'pending' means in your status column.
-        query = """
-            SELECT consignment_id 
-            FROM consignments 
-            WHERE center_id = %s AND status = 'Raised' and
-            consignment_id not in (select shipment_id from shipments)
-        """
-        cursor.execute(query, (site,))
-        
-        shipment_records = cursor.fetchall()
-        
-        # Extract shipment IDs into a list
-        shipments = [record['consignment_id'] for record in shipment_records]
-        
+        # Pending means the consignment is still Raised or InTransit; its state is
+        # updated when the arrival is recorded, so this is an indexed lookup on
+        # (center_id, status) that does not grow with shipment history.
+        shipments = pending_for_site(cursor, site)
+
         return jsonify({"shipments": shipments}), 200
 
     except Exception as e:
@@ -223,23 +277,14 @@ def get_user_site():
     if not username:
         return jsonify({"message": "Username parameter is required"}), 400
 
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({"message": "Database connection failed"}), 500
-
-    cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-        user_data = cursor.fetchone()
+        site = resolve_user_site(username)
 
-        if user_data and user_data['sites']:
-            return jsonify({"site": user_data['sites']}), 200
+        if site:
+            return jsonify({"site": site}), 200
         else:
             return jsonify({"message": "User or site not found"}), 404
 
     except Exception as e:
         print(f"Error fetching user site: {e}")
-        return jsonify({"message": "Failed to fetch user site", "error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        return jsonify({"message": "Failed to fetch user site", "error": str(e)}), 500
\ No newline at end of file
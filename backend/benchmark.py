@@ -0,0 +1,619 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Every request of a run must verify against the same signing key
+os.environ.setdefault('RTSM_TOKEN_SECRET', 'rtsm-benchmark')
+
+import mysql.connector
+
+import db
+from db import DB_CONFIG, POOL_CONFIG, ConnectionPool, get_pooled_connection
+from migrations import migrate
+from pack_loader import load_packs
+from randomization_schedule import generate_schedules
+from session_tokens import TOKEN_CONFIG, issue_token
+
+# Endpoint benchmarks.
+# Replays realistic traffic against the Flask app in-process (Flask test
+# client, real MySQL) and reports, for every blueprint route it exercised,
+# p50/p95/p99 latency, throughput and the number of SQL statements each
+# request executed, plus the throughput of each scenario. Within a phase the
+# requests of each route are sent as their own sub-phase, one route after
+# another, so every route's throughput is timed on its own. Scenarios run in
+# order on one disposable database, so later ones work on the data earlier
+# ones created:
+#
+#   enrollment_burst      investigators of every site register patients at once
+#   randomization_storm   those patients are randomized, singly and in batches
+#   dashboard_polling     every role's dashboard polls its lists, with ETags
+#   depot_resupply        the depot raises single and bulk consignments, then dispatches
+#   mass_receipt          sites receive every pending shipment, singly and in batches
+#   study_closeout        screen failures, treatment completions and code breaks
+#
+# The database (default rtsm_bench) is dropped and recreated, migrated and
+# seeded at the start of the run and dropped at the end unless --keep is
+# given; it must not be the application's database. Results are written as
+# JSON so that two runs can be diffed:
+#
+#   python benchmark.py --out before.json
+#   python benchmark.py --out after.json --concurrency 32
+#   python benchmark.py --compare before.json after.json
+#
+# Requests carry session tokens like the frontend does; --no-tokens sends
+# only usernames with tokens made optional (RTSM_REQUIRE_TOKEN=0), which
+# exercises the users lookup path instead. Routes restricted to a role
+# (depot and monitor writes) then answer 401.
+
+DEFAULT_DATABASE = os.environ.get('RTSM_BENCH_DATABASE', 'rtsm_bench')
+
+# Connections beyond the request threads, the same rule as gunicorn.conf.py:
+# each of the `concurrency` clients is a request thread, so the pool gets one
+# connection per client plus this headroom unless --pool-size is given
+POOL_HEADROOM = 2
+
+SCALE = {
+    'sites': 10,
+    'patients_per_site': 50,
+    'depot_packs': 2000,
+    'polling_rounds': 5,
+    'concurrency': 16,
+    'seed': 1,
+}
+
+# Share of a site's enrolled patients that are randomized; the rest are screen failed at closeout
+RANDOMIZED_SHARE = 0.8
+# Patients per /randomize_patients, /complete_treatments, ... request
+BATCH_SIZE = 10
+ARMS = ('PLACEBO', '10_MG')
+STUDY_DATE = '2024-06-01'
+
+_tally = threading.local()
+
+
+def _count_statement():
+    _tally.queries = getattr(_tally, 'queries', 0) + 1
+
+
+class CountingCursor:
+    """Cursor proxy that counts statements sent to the server on the current thread."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        _count_statement()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        _count_statement()
+        return self._cursor.executemany(*args, **kwargs)
+
+
+class CountingConnection:
+    """Connection proxy whose cursors count their statements."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs))
+
+
+class CountingPool(ConnectionPool):
+    """The application's pool, handing out counting connections."""
+
+    def _open(self):
+        return CountingConnection(super()._open())
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize_samples(samples, seconds):
+    """
+    [(latency seconds, queries, status)] and the wall-clock seconds of the
+    route's sub-phases -> the statistics reported for one route.
+    """
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    statuses = defaultdict(int)
+    for _, _, status in samples:
+        statuses[str(status)] += 1
+    return {
+        'requests': len(samples),
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'errors': sum(1 for _, _, status in samples if status >= 400),
+        'status_counts': dict(sorted(statuses.items())),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'queries_per_request': round(sum(sample[1] for sample in samples) / len(samples), 2) if samples else 0.0,
+    }
+
+
+def op(method, path, user, json_body=None, query=None, poll=False):
+    """One request of a scenario. poll=True sends the ETag of the user's last response to the same URL."""
+    return {'method': method, 'path': path, 'user': user, 'json': json_body, 'query': query or {}, 'poll': poll}
+
+
+class Benchmark:
+    """Runs scenarios against one disposable database and collects per-route samples."""
+
+    def __init__(self, database, scale, use_tokens=True, pool_size=None):
+        self.database = database
+        self.scale = scale
+        self.pool_size = pool_size or scale['concurrency'] + POOL_HEADROOM
+        self.use_tokens = use_tokens
+        self.rng = random.Random(scale['seed'])
+        self.sites = [f"S{number:02d}" for number in range(1, scale['sites'] + 1)]
+        self.users = {}   # username -> (role, site)
+        self.tokens = {}
+        self.etags = {}
+        self._etag_lock = threading.Lock()
+        self._local = threading.local()
+        self.app = None
+
+    # --- database lifecycle --------------------------------------------
+
+    def _server_connection(self):
+        config = {key: value for key, value in DB_CONFIG.items() if key != 'database'}
+        return mysql.connector.connect(**config)
+
+    def create_database(self):
+        if self.database == DB_CONFIG['database']:
+            raise SystemExit(f"Refusing to benchmark against the application database '{self.database}'")
+        conn = self._server_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.database}`")
+            cursor.execute(f"CREATE DATABASE `{self.database}`")
+        finally:
+            cursor.close()
+            conn.close()
+
+        # Everything from here on, including the app's own connections, uses the benchmark database
+        DB_CONFIG['database'] = self.database
+        db._pool = CountingPool(DB_CONFIG, self.pool_size, POOL_CONFIG['checkout_timeout'])
+        migrate()
+
+    def drop_database(self):
+        conn = self._server_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.database}`")
+        finally:
+            cursor.close()
+            conn.close()
+
+    def query(self, sql, params=()):
+        conn = get_pooled_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def seed(self):
+        """Sites, one investigator and monitor per site, a depot user, kits and randomization schedules."""
+        self.users['depot'] = ('Depot', 'Depot')
+        for site in self.sites:
+            self.users[f"inv_{site}"] = ('Investigator', site)
+            self.users[f"mon_{site}"] = ('Monitor', site)
+
+        kits_per_arm = -(-self.scale['patients_per_site'] // len(ARMS))
+        manifest = [
+            {'pack_number': f"K-{site}-{arm}-{number:05d}", 'pack_type': arm, 'depot': site}
+            for site in self.sites for arm in ARMS for number in range(kits_per_arm)
+        ]
+        manifest += [
+            {'pack_number': f"K-DEPOT-{number:06d}", 'pack_type': ARMS[number % len(ARMS)], 'depot': 'Depot'}
+            for number in range(self.scale['depot_packs'])
+        ]
+
+        conn = get_pooled_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                "INSERT INTO sites (sites, site_name, site_activation, site_act_date) VALUES (%s, %s, 'Active', '2020-01-01')",
+                [(site, site) for site in ['Depot'] + self.sites]
+            )
+            # Nobody logs in during the run, so the password column only needs a value
+            cursor.executemany(
+                "INSERT INTO users (username, password, role, sites) VALUES (%s, '!', %s, %s)",
+                [(username, role, site) for username, (role, site) in self.users.items()]
+            )
+            conn.commit()
+            load_packs(conn, manifest)
+            generate_schedules(conn, self.sites, slot_count=self.scale['patients_per_site'], seed=self.scale['seed'])
+        finally:
+            cursor.close()
+            conn.close()
+
+        for username, (role, site) in self.users.items():
+            self.tokens[username], _ = issue_token(username, role, site)
+
+    # --- request execution -------------------------------------------
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def _send(self, request):
+        headers = {}
+        if self.use_tokens and request['user']:
+            headers['Authorization'] = f"Bearer {self.tokens[request['user']]}"
+        etag_key = (request['user'], request['path'], tuple(sorted(request['query'].items())))
+        if request['poll']:
+            with self._etag_lock:
+                etag = self.etags.get(etag_key)
+            if etag:
+                headers['If-None-Match'] = etag
+
+        _tally.queries = 0
+        started = time.perf_counter()
+        response = self._client().open(
+            request['path'], method=request['method'], json=request['json'],
+            query_string=request['query'], headers=headers
+        )
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        queries = _tally.queries
+
+        if request['poll'] and response.headers.get('ETag'):
+            with self._etag_lock:
+                self.etags[etag_key] = response.headers['ETag']
+        return f"{request['method']} {request['path']}", elapsed, queries, response.status_code
+
+    def run_phase(self, requests, pool):
+        """
+        Sends a list of requests with `concurrency` clients, one route at a
+        time in order of first appearance; returns (samples by route, seconds by route).
+        """
+        by_route = defaultdict(list)
+        for request in requests:
+            by_route[f"{request['method']} {request['path']}"].append(request)
+        samples = defaultdict(list)
+        seconds = {}
+        for route, route_requests in by_route.items():
+            started = time.perf_counter()
+            outcomes = list(pool.map(self._send, route_requests))
+            seconds[route] = time.perf_counter() - started
+            for _, elapsed, queries, status in outcomes:
+                samples[route].append((elapsed, queries, status))
+        return samples, seconds
+
+    def run_scenario(self, name, scenario):
+        """Runs every phase of a scenario and returns its report, its samples and its seconds by route."""
+        samples = defaultdict(list)
+        route_seconds = defaultdict(float)
+        with ThreadPoolExecutor(max_workers=self.scale['concurrency']) as pool:
+            for requests in scenario(self):
+                if not requests:
+                    continue
+                phase_samples, phase_seconds = self.run_phase(requests, pool)
+                for route, route_samples in phase_samples.items():
+                    samples[route].extend(route_samples)
+                    route_seconds[route] += phase_seconds[route]
+        total = sum(len(route_samples) for route_samples in samples.values())
+        seconds = sum(route_seconds.values())
+        print(f"{name}: {total} requests in {seconds:.2f}s")
+        return {
+            'requests': total,
+            'seconds': round(seconds, 3),
+            'throughput_rps': round(total / seconds, 2) if seconds else 0.0,
+            'routes': {
+                route: summarize_samples(route_samples, route_seconds[route])
+                for route, route_samples in sorted(samples.items())
+            },
+        }, samples, route_seconds
+
+    # --- data the scenarios build on ---------------------------------
+
+    def patients(self, site, status):
+        rows = self.query("SELECT id FROM patients WHERE sites = %s AND status = %s ORDER BY id", (site, status))
+        return [row[0] for row in rows]
+
+    def site_user(self, site):
+        return f"inv_{site}"
+
+
+# --- scenarios -----------------------------------------------------------
+# Each scenario is a generator of phases: a phase is a list of requests sent
+# concurrently, and the next phase is built once the previous one finished.
+
+def enrollment_burst(bench):
+    requests = [
+        op('POST', '/register_patient', bench.site_user(site), {
+            'informedConsentDate': '2024-01-10', 'enrollmentDate': '2024-01-15',
+            'dateOfBirth': f"{1950 + number % 50}-05-05", 'gender': 'F' if number % 2 else 'M',
+            'username': bench.site_user(site),
+        })
+        for number in range(bench.scale['patients_per_site']) for site in bench.sites
+    ]
+    yield requests
+
+
+def randomization_storm(bench):
+    requests = []
+    for site in bench.sites:
+        user = bench.site_user(site)
+        enrolled = bench.patients(site, 'Enrolled')
+        chosen = enrolled[:int(len(enrolled) * RANDOMIZED_SHARE)]
+        # Half one by one, as the investigator form does, half through the batch endpoint
+        singles, batched = chosen[:len(chosen) // 2], chosen[len(chosen) // 2:]
+        requests += [op('POST', '/randomize_patient', user, {'patientId': patient_id, 'username': user}) for patient_id in singles]
+        requests += [
+            op('POST', '/randomize_patients', user, {'patientIds': batched[start:start + BATCH_SIZE], 'username': user})
+            for start in range(0, len(batched), BATCH_SIZE)
+        ]
+        # The enrolled list is refreshed after randomizing
+        requests += [op('GET', '/patients/enrolled', user, query={'username': user}) for _ in range(len(singles) // 5 + 1)]
+        requests.append(op('GET', '/packs/available', user))
+    bench.rng.shuffle(requests)
+    yield requests
+
+
+def dashboard_polling(bench):
+    investigator_lists = ['/patients', '/site_summary', '/patients/enrolled', '/patients/randomized_for_completion',
+                          '/patients/not_code_broken', '/code_not_broken', '/get_user_site']
+    monitor_lists = ['/monitor/patients', '/monitor/code_broken_by_site', '/monitor/get_user_site', '/site_summary']
+    for _ in range(bench.scale['polling_rounds']):
+        requests = []
+        for site in bench.sites:
+            investigator, monitor = f"inv_{site}", f"mon_{site}"
+            requests += [op('GET', path, investigator, query={'username': investigator}, poll=True) for path in investigator_lists]
+            requests.append(op('GET', '/pending_shipments', investigator, query={'site': site}, poll=True))
+            requests += [op('GET', path, monitor, query={'username': monitor}, poll=True) for path in monitor_lists]
+        requests += [op('GET', '/sites', 'depot', poll=True), op('GET', '/depot_sites', 'depot', poll=True)]
+        bench.rng.shuffle(requests)
+        yield requests
+
+
+def depot_resupply(bench):
+    depot_packs = [row[0] for row in bench.query(
+        "SELECT pack_number FROM packs WHERE centre = 'Depot' AND status = 'A' ORDER BY pack_number LIMIT %s",
+        (2 * len(bench.sites),)
+    )]
+    # Single kits first (specific packs), then bulk resupplies by type, which lock whatever is left
+    yield [
+        op('POST', '/raise_consignment', 'depot', {'packId': pack_id, 'centerId': bench.sites[index % len(bench.sites)], 'username': 'depot'})
+        for index, pack_id in enumerate(depot_packs)
+    ]
+    yield [
+        op('POST', '/raise_bulk_consignment', 'depot', {
+            'centerId': site, 'packs': {arm: 10 for arm in ARMS}, 'dispatch': True, 'username': 'depot',
+        })
+        for site in bench.sites for _ in range(2)
+    ]
+    raised = bench.query("SELECT consignment_id FROM consignments WHERE status = 'Raised' ORDER BY consignment_id")
+    yield [op('POST', '/dispatch_consignment', 'depot', {'consignmentId': row[0]}) for row in raised]
+
+
+def mass_receipt(bench):
+    requests = []
+    for site in bench.sites:
+        user = bench.site_user(site)
+        pending = [row[0] for row in bench.query(
+            "SELECT consignment_id FROM consignments WHERE center_id = %s AND status IN ('Raised', 'InTransit') ORDER BY consignment_id",
+            (site,)
+        )]
+        singles, batched = pending[:2], pending[2:]
+        requests += [
+            op('POST', '/record_medical_arrival', user, {
+                'shipmentId': shipment_id, 'status': 'Arrived', 'arrivalDate': STUDY_DATE, 'username': user,
+            })
+            for shipment_id in singles
+        ]
+        requests += [
+            op('POST', '/record_shipment_receipts', user, {
+                'username': user, 'arrivalDate': STUDY_DATE,
+                'shipments': [
+                    {'shipmentId': shipment_id, 'status': 'Damaged' if index % 10 == 9 else 'Arrived'}
+                    for index, shipment_id in enumerate(batched[start:start + BATCH_SIZE])
+                ],
+            })
+            for start in range(0, len(batched), BATCH_SIZE)
+        ]
+        requests.append(op('GET', '/pending_shipments', user, query={'site': site}))
+    bench.rng.shuffle(requests)
+    yield requests
+
+
+def study_closeout(bench):
+    requests = []
+    for site in bench.sites:
+        user, monitor = bench.site_user(site), f"mon_{site}"
+        enrolled = bench.patients(site, 'Enrolled')
+        randomized = bench.patients(site, 'Randomized')
+
+        half = len(enrolled) // 2
+        requests += [
+            op('POST', '/record_screen_failure', user, {'patientId': patient_id, 'username': user, 'screenFailureDate': STUDY_DATE})
+            for patient_id in enrolled[:half]
+        ]
+        if enrolled[half:]:
+            requests.append(op('POST', '/record_screen_failures', user, {
+                'username': user, 'items': [{'patientId': patient_id, 'date': STUDY_DATE} for patient_id in enrolled[half:]],
+            }))
+
+        # A few code breaks (emergency form, monitor form, batch); the rest complete treatment
+        code_break_singles, monitor_breaks = randomized[:2], randomized[2:4]
+        code_break_batch, completions = randomized[4:8], randomized[8:]
+        requests += [
+            op('POST', '/record_code_break', user, {'patientId': patient_id, 'codeBreakDate': STUDY_DATE})
+            for patient_id in code_break_singles
+        ]
+        requests += [
+            op('POST', '/monitor/record_code_break', monitor, {
+                'patientId': patient_id, 'reason': 'Benchmark', 'brokenBy': monitor, 'userSite': site,
+            })
+            for patient_id in monitor_breaks
+        ]
+        if code_break_batch:
+            requests.append(op('POST', '/record_code_breaks', user, {
+                'username': user, 'items': [{'patientId': patient_id, 'date': STUDY_DATE} for patient_id in code_break_batch],
+            }))
+        half = len(completions) // 2
+        requests += [
+            op('POST', '/complete_treatment', user, {'patientId': patient_id, 'completionDate': STUDY_DATE})
+            for patient_id in completions[:half]
+        ]
+        requests += [
+            op('POST', '/complete_treatments', user, {
+                'username': user, 'items': [{'patientId': patient_id, 'date': STUDY_DATE} for patient_id in completions[half:][start:start + BATCH_SIZE]],
+            })
+            for start in range(0, len(completions) - half, BATCH_SIZE)
+        ]
+    bench.rng.shuffle(requests)
+    yield requests
+
+
+SCENARIOS = {
+    'enrollment_burst': enrollment_burst,
+    'randomization_storm': randomization_storm,
+    'dashboard_polling': dashboard_polling,
+    'depot_resupply': depot_resupply,
+    'mass_receipt': mass_receipt,
+    'study_closeout': study_closeout,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(database, scale, scenario_names, use_tokens=True, keep=False, pool_size=None):
+    """Creates and seeds the database, runs the scenarios in order and returns the report."""
+    bench = Benchmark(database, scale, use_tokens, pool_size)
+    TOKEN_CONFIG['required'] = use_tokens
+    bench.create_database()
+    try:
+        bench.seed()
+        # Imported once the benchmark database is in place, so nothing the app sets up can reach another one
+        from app import app
+        bench.app = app
+
+        report = {
+            'run': {
+                'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'database': database,
+                'tokens': use_tokens,
+                'pool_size': bench.pool_size,
+                'scale': scale,
+                'scenarios': scenario_names,
+            },
+            'scenarios': {},
+        }
+        all_samples = defaultdict(list)
+        all_seconds = defaultdict(float)
+        for name in scenario_names:
+            # Scenarios depend on the data earlier ones created, so they always run in SCENARIOS order
+            report['scenarios'][name], samples, seconds = bench.run_scenario(name, SCENARIOS[name])
+            for route, route_samples in samples.items():
+                all_samples[route].extend(route_samples)
+                all_seconds[route] += seconds[route]
+
+        report['routes'] = {
+            route: summarize_samples(samples, all_seconds[route]) for route, samples in sorted(all_samples.items())
+        }
+        routes = {
+            f"{method} {rule.rule}" for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+            for method in rule.methods - {'HEAD', 'OPTIONS'}
+        }
+        report['unexercised_routes'] = sorted(routes - set(all_samples))
+        report['db_pool'] = db.pool_stats()
+        return report
+    finally:
+        if not keep:
+            bench.drop_database()
+
+
+def compare(before_path, after_path):
+    """Prints the per-route change in latency, throughput and queries per request between two result files."""
+    with open(before_path) as f:
+        before = json.load(f)['routes']
+    with open(after_path) as f:
+        after = json.load(f)['routes']
+
+    print(f"{'route':45} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'req/s':>19} {'queries/req':>13}")
+    for route in sorted(set(before) | set(after)):
+        old, new = before.get(route), after.get(route)
+        if old is None or new is None:
+            print(f"{route:45} {'only in ' + (after_path if old is None else before_path)}")
+            continue
+        cells = [f"{old[key]:>7.1f} -> {new[key]:<7.1f}" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        # Result files written before per-route throughput was measured do not have it
+        if 'throughput_rps' in old and 'throughput_rps' in new:
+            cells.append(f"{old['throughput_rps']:>8.1f} -> {new['throughput_rps']:<8.1f}")
+        else:
+            cells.append(f"{'-':>19}")
+        cells.append(f"{old['queries_per_request']:>5} -> {new['queries_per_request']:<5}")
+        print(f"{route:45} {' '.join(cells)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the RTSM endpoints against a disposable database.")
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help="Database created for the run (dropped afterwards)")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help="Run only these scenarios (repeatable); the scenarios they build on should be included")
+    for key, value in SCALE.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=int, default=value)
+    parser.add_argument('--pool-size', type=int,
+                        help=f"Connections in the app's pool (default: concurrency + {POOL_HEADROOM}, as in production)")
+    parser.add_argument('--no-tokens', action='store_true', help="Send usernames only, without session tokens")
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark database after the run")
+    parser.add_argument('--out', default='benchmark_results.json', help="Where to write the JSON results")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Diff two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        raise SystemExit(0)
+
+    scale = {key: getattr(args, key) for key in SCALE}
+    names = [name for name in SCENARIOS if not args.scenario or name in args.scenario]
+    report = run(args.database, scale, names, use_tokens=not args.no_tokens, keep=args.keep, pool_size=args.pool_size)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'route':45} {'requests':>8} {'errors':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for route, stats in report['routes'].items():
+        print(f"{route:45} {stats['requests']:>8} {stats['errors']:>8} {stats['throughput_rps']:>9} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['queries_per_request']:>8}")
+    if report['unexercised_routes']:
+        print("Not exercised: " + ', '.join(report['unexercised_routes']))
+    print(f"Results written to {args.out}")
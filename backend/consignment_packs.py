@@ -0,0 +1,73 @@
+from collections import Counter
+
+from pack_allocation import lock_available_packs
+
+# Consignment line items.
+# A consignment is a header row in `consignments` plus one row per kit in
+# `consignment_items`, so a single site resupply can carry any number of
+# packs. consignments.pack_id is kept for single-kit consignments raised
+# through /raise_consignment; every consignment, single or bulk, has its
+# kits listed in consignment_items.
+
+# Largest number of kits accepted in one bulk consignment
+MAX_CONSIGNMENT_PACKS = 1000
+
+# Packs on their way to a site carry status 'B' and the destination centre
+IN_TRANSIT_PACK_STATUS = 'B'
+
+
+def lock_depot_packs(cursor, depot, pack_ids):
+    """
+    Locks the listed packs and returns ({pack_number: pack_type} of those
+    available at the depot, [pack numbers that are not]).
+    """
+    placeholders = ', '.join(['%s'] * len(pack_ids))
+    cursor.execute(
+        f"SELECT pack_number, pack_type FROM packs WHERE pack_number IN ({placeholders}) "
+        f"AND centre = %s AND status = 'A' FOR UPDATE",
+        (*pack_ids, depot)
+    )
+    available = {row[0]: row[1] for row in cursor.fetchall()}
+    return available, [pack_id for pack_id in pack_ids if pack_id not in available]
+
+
+def lock_depot_packs_by_type(cursor, depot, type_counts):
+    """
+    Locks the requested number of available packs of each type at the depot.
+    Returns ({pack_number: pack_type}, {pack_type: shortfall}).
+    """
+    available, shortfall = {}, {}
+    for pack_type, count in sorted(type_counts.items()):
+        packs = lock_available_packs(cursor, depot, count, pack_type)
+        if len(packs) < count:
+            # Packs skipped because another transaction held them may come back
+            # if it rolls back: wait for those locks once before reporting a
+            # shortfall. Packs this transaction already locked are returned again.
+            packs = lock_available_packs(cursor, depot, count, pack_type, skip_locked=False)
+        available.update(dict(packs))
+        if len(packs) < count:
+            shortfall[pack_type] = count - len(packs)
+    return available, shortfall
+
+
+def ship_packs(cursor, center_id, pack_ids):
+    """Moves locked depot packs to the destination site as in transit, in one UPDATE."""
+    placeholders = ', '.join(['%s'] * len(pack_ids))
+    cursor.execute(
+        f"UPDATE packs SET centre = %s, status = %s WHERE pack_number IN ({placeholders}) AND status = 'A'",
+        (center_id, IN_TRANSIT_PACK_STATUS, *pack_ids)
+    )
+    return cursor.rowcount
+
+
+def add_items(cursor, consignment_id, pack_ids):
+    """Records the kits of a consignment."""
+    cursor.executemany(
+        "INSERT INTO consignment_items (consignment_id, pack_id) VALUES (%s, %s)",
+        [(consignment_id, pack_id) for pack_id in pack_ids]
+    )
+
+
+def type_counts(packs):
+    """{pack_number: pack_type} -> {pack_type: number of packs}."""
+    return dict(Counter(packs.values()))
@@ -0,0 +1,64 @@
+# Consignment lifecycle.
+# consignments.status carries the state of each consignment, so "what is
+# still on its way to a site" is an indexed lookup on (center_id, status)
+# instead of an anti-join against the whole shipments history.
+#
+#   Raised -> InTransit -> Received | Damaged | Quarantined
+#
+# A Raised consignment may also be received directly (the depot did not
+# record the dispatch).
+
+RAISED = 'Raised'
+IN_TRANSIT = 'InTransit'
+RECEIVED = 'Received'
+DAMAGED = 'Damaged'
+QUARANTINED = 'Quarantined'
+
+PENDING_STATES = (RAISED, IN_TRANSIT)
+
+# Shipment arrival status (as sent by the arrival forms) -> consignment state
+ARRIVAL_STATES = {
+    'Arrived': RECEIVED,
+    'Damaged': DAMAGED,
+    'Quarantined': QUARANTINED,
+}
+
+# Shipment arrival status -> status of the kits it carried
+ARRIVAL_PACK_STATUS = {
+    'Arrived': 'A',
+    'Damaged': 'D',
+    'Quarantined': 'Q',
+}
+
+
+def transition(cursor, consignment_id, new_state, from_states=PENDING_STATES, depot=None):
+    """
+    Moves a consignment to new_state inside the caller's transaction, but only
+    if it is currently in one of from_states and, when depot is given, ships
+    from that depot. Returns True if it moved.
+    """
+    placeholders = ', '.join(['%s'] * len(from_states))
+    depot_filter = '' if depot is None else ' AND depot_id = %s'
+    params = (new_state, consignment_id, *from_states) + (() if depot is None else (depot,))
+    cursor.execute(
+        f"UPDATE consignments SET status = %s WHERE consignment_id = %s AND status IN ({placeholders}){depot_filter}",
+        params
+    )
+    return cursor.rowcount == 1
+
+
+def pending_query(site):
+    """Returns (sql, params) listing the consignments still on their way to the site, oldest first."""
+    placeholders = ', '.join(['%s'] * len(PENDING_STATES))
+    # Length first: legacy three-digit ids are older than the six-digit ones (see sequences.py)
+    return (
+        f"SELECT consignment_id FROM consignments WHERE center_id = %s AND status IN ({placeholders}) "
+        f"ORDER BY CHAR_LENGTH(consignment_id), consignment_id",
+        (site, *PENDING_STATES)
+    )
+
+
+def pending_for_site(cursor, site):
+    """Returns the ids of consignments still on their way to the site."""
+    cursor.execute(*pending_query(site))
+    return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,140 @@
+import hashlib
+import re
+from functools import wraps
+
+from flask import make_response, request
+
+from db import get_db_connection
+from session_tokens import current_session
+from site_resolver import get_user_site
+
+# Per-site, per-table change versions for conditional GETs.
+# Every route that writes patients, packs, consignments or sites bumps the
+# matching version in the same transaction as its change. Read endpoints
+# derive an ETag from the versions they depend on and answer If-None-Match
+# with 304 after a single primary-key lookup, without running their query.
+#
+# A scope is "<table>:<site>" for per-site data or "<table>" for global data.
+
+_BUMP = """
+    INSERT INTO data_versions (scope, version) VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+
+def scope(table, site=None):
+    return table if site is None else f"{table}:{site}"
+
+
+def bump(cursor, table, *sites):
+    """
+    Increments the version of a table for each given site (or the global
+    version if no site is given) inside the caller's transaction.
+    """
+    scopes = [scope(table, site) for site in sites if site] if sites else [scope(table)]
+    for name in dict.fromkeys(scopes):
+        cursor.execute(_BUMP, (name,))
+
+
+def current_versions(scopes):
+    """Returns {scope: version} for the given scopes; unknown scopes are version 0."""
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("Database connection failed.")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(*versions_query(scopes))
+        versions = dict(cursor.fetchall())
+    finally:
+        cursor.close()
+    return {name: versions.get(name, 0) for name in scopes}
+
+
+def versions_query(scopes):
+    """Returns (sql, params) reading the versions of the given scopes."""
+    placeholders = ', '.join(['%s'] * len(scopes))
+    return f"SELECT scope, version FROM data_versions WHERE scope IN ({placeholders})", tuple(scopes)
+
+
+def etag_for(full_path, versions):
+    """ETag for a URL (including pagination and format arguments) at the given data versions."""
+    fingerprint = full_path + '|' + '|'.join(f"{name}={versions[name]}" for name in sorted(versions))
+    return '"' + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+# One member of an If-None-Match list: "*" or an optionally weak quoted entity-tag
+_ENTITY_TAG = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def _opaque_tag(tag):
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def etag_matches(etag, if_none_match):
+    """
+    True if the If-None-Match header value matches the ETag (RFC 9110 13.1.2):
+    "*" matches any current representation, and the entity-tags of the
+    comma-separated list are compared weakly, so W/"x" matches "x".
+    """
+    tags = _ENTITY_TAG.findall(if_none_match or '')
+    if '*' in tags:
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in tags}
+
+
+def compute_etag(scopes):
+    """ETag for the current request: the data versions plus the full URL (pagination, format)."""
+    return etag_for(request.full_path, current_versions(scopes))
+
+
+def for_user_site(*tables):
+    """Scopes for the site of the ?username= user, e.g. for_user_site('patients')."""
+    def scopes():
+        site = get_user_site(request.args.get('username'))
+        return [scope(table, site) for table in tables] if site else None
+    return scopes
+
+
+def for_site_param(*tables):
+    """Scopes for the session's site, or the ?site= query parameter without a session."""
+    def scopes():
+        session = current_session()
+        site = session['site'] if session is not None else request.args.get('site')
+        return [scope(table, site) for table in tables] if site else None
+    return scopes
+
+
+def for_tables(*tables):
+    """Global scopes, for data that is not split by site."""
+    return lambda: [scope(table) for table in tables]
+
+
+def conditional(scopes_for_request):
+    """
+    Decorator for GET routes. scopes_for_request() returns the scopes the
+    response depends on (or None to skip conditional handling, e.g. when the
+    user has no site). Matching If-None-Match requests get 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                scopes = scopes_for_request()
+                etag = compute_etag(scopes) if scopes else None
+            except Exception as e:
+                print(f"Error computing ETag for {request.path}: {e}")
+                etag = None
+            if etag is None:
+                return view(*args, **kwargs)
+
+            if etag_matches(etag, request.headers.get('If-None-Match')):
+                response = make_response('', 304)
+                response.headers['ETag'] = etag
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.headers['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -1,5 +1,11 @@
+import os
+import queue
+import threading
+import time
+
 import mysql.connector
 from mysql.connector import Error
+from flask import g, has_app_context
 
 # Database Configuration
 DB_CONFIG = {
@@ -9,11 +15,267 @@ DB_CONFIG = {
     'database': 'travelagencydb'
 }
 
-def get_db_connection():
-    """Establishes and returns a database connection."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+# Connection pool configuration (one pool per worker process).
+# pool_size: maximum number of open connections this worker may hold.
+# checkout_timeout: seconds a request waits for a free connection before giving up.
+POOL_CONFIG = {
+    'pool_size': int(os.environ.get('RTSM_DB_POOL_SIZE', 10)),
+    'checkout_timeout': float(os.environ.get('RTSM_DB_CHECKOUT_TIMEOUT', 5)),
+}
+
+
+class ConnectionPool:
+    """
+    A bounded pool of MySQL connections.
+    Connections are opened lazily up to pool_size, validated when borrowed
+    and kept open when released so later requests skip the TCP/auth handshake.
+    """
+
+    def __init__(self, db_config, pool_size, checkout_timeout):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._reconnects = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        # Server-side prepared statements, per open connection: {id(conn): {sql: (sql, cursor)}}
+        self._statements = {}
+        self._statement_hits = 0
+        self._statement_prepares = 0
+
+    def _open(self):
+        return mysql.connector.connect(**self.db_config)
+
+    def _validate(self, conn):
+        """Returns a usable connection, reconnecting it if the server dropped it."""
+        if conn.is_connected():
+            return conn
+        with self._lock:
+            self._reconnects += 1
+            # Statements prepared on the old session are gone
+            self._statements.pop(id(conn), None)
+        conn.reconnect(attempts=1)
+        return conn
+
+    def acquire(self):
+        """Borrows a connection, waiting up to checkout_timeout for one to be released."""
+        started = time.monotonic()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._created < self.pool_size
+                    if can_open:
+                        self._created += 1
+                if can_open:
+                    try:
+                        conn = self._open()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+            conn = self._validate(conn)
+        except Exception:
+            if conn is not None:
+                self._discard(conn)
+            with self._lock:
+                self._checkout_failures += 1
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
         return conn
-    except Error as e:
+
+    def release(self, conn):
+        """Returns a connection to the pool, discarding any uncommitted work."""
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+            conn.rollback()
+        except Exception as e:
+            print(f"Discarding pooled MySQL connection: {e}")
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+            self._statements.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def prepared_statement(self, conn, sql):
+        """
+        Returns (canonical sql, prepared cursor) for `sql` on this connection.
+        The statement is parsed and planned by the server the first time it
+        runs on a connection; later requests that borrow the same connection
+        reuse it. mysql-connector re-prepares whenever a prepared cursor is
+        given a different string object than the one it last ran, even an
+        equal one, so callers must execute the canonical sql returned here.
+        """
+        with self._lock:
+            statements = self._statements.setdefault(id(conn), {})
+            statement = statements.get(sql)
+            if statement is not None:
+                self._statement_hits += 1
+                return statement
+            self._statement_prepares += 1
+        statement = (sql, conn.cursor(prepared=True))
+        with self._lock:
+            statements[sql] = statement
+        return statement
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'checkout_failures': self._checkout_failures,
+                'reconnects': self._reconnects,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 3),
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'prepared_statements': sum(len(s) for s in self._statements.values()),
+                'statement_prepares': self._statement_prepares,
+                'statement_cache_hits': self._statement_hits,
+            }
+
+
+class PooledConnection:
+    """
+    Wraps a pooled connection so that close() hands it back to the pool.
+    Request-scoped connections ignore close(); they are released at teardown.
+    """
+
+    def __init__(self, pool, conn, request_scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def is_connected(self):
+        return self._conn is not None and self._conn.is_connected()
+
+    def execute_prepared(self, sql, params=()):
+        """Runs `sql` on the cached server-side prepared cursor for this connection and returns the cursor."""
+        canonical_sql, cursor = self._pool.prepared_statement(self._conn, sql)
+        cursor.execute(canonical_sql, params)
+        return cursor
+
+    def close(self):
+        if self._request_scoped or self._conn is None:
+            return
+        self._pool.release(self._conn)
+        self._conn = None
+
+    def _release(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns this worker's connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, POOL_CONFIG['pool_size'], POOL_CONFIG['checkout_timeout'])
+    return _pool
+
+
+def _reset_pool_after_fork():
+    # A forked worker must not reuse sockets opened by its parent (e.g. a
+    # preloading master); it drops them without closing and opens its own.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def open_connection():
+    """
+    Opens a connection outside the pool, for work that must not wait for a
+    checkout while the calling request already holds a pooled connection.
+    The caller owns it and must close it.
+    """
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+def get_pooled_connection():
+    """Borrows a connection from the pool; close() returns it. Returns None on failure."""
+    pool = get_pool()
+    try:
+        return PooledConnection(pool, pool.acquire())
+    except Exception as e:
         print(f"Error connecting to MySQL: {e}")
         return None
+
+
+def get_db_connection():
+    """
+    Returns the database connection for the current request.
+    Every call made while handling one Flask request shares the same pooled
+    connection, which is released at teardown. Outside a request (scripts
+    such as table_setup.py) a plain pooled connection is returned.
+    """
+    if not has_app_context():
+        return get_pooled_connection()
+
+    conn = g.get('db_conn')
+    if conn is None:
+        pool = get_pool()
+        try:
+            conn = PooledConnection(pool, pool.acquire(), request_scoped=True)
+        except Exception as e:
+            print(f"Error connecting to MySQL: {e}")
+            return None
+        g.db_conn = conn
+    return conn
+
+
+def release_db_connection(exception=None):
+    """Teardown handler: returns the request's connection to the pool."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn._release()
+
+
+def pool_stats():
+    """Returns the pool size, wait time and checkout-failure counters for this worker."""
+    return get_pool().stats()
+
+
+def init_app(app):
+    """Registers the teardown that releases request-scoped connections."""
+    app.teardown_appcontext(release_db_connection)
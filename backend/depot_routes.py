@@ -1,22 +1,40 @@
 from flask import Blueprint, request, jsonify
 import uuid
+from datetime import date
 from db import get_db_connection # Import from the shared db.py file
+from sequences import is_depot, next_consignment_id
+from consignment_state import RAISED, IN_TRANSIT, ARRIVAL_STATES, transition
+from shipment_receipts import MAX_RECEIPT_BATCH, receive_shipments
+from data_versions import bump, conditional, for_tables
+from session_tokens import current_session, require_session
+from site_counters import packs_available_changed
+from consignment_packs import (
+    MAX_CONSIGNMENT_PACKS, add_items, lock_depot_packs, lock_depot_packs_by_type, ship_packs, type_counts
+)
 
 # Create a Blueprint for depot-related routes
 depot_bp = Blueprint('depot', __name__)
 
 @depot_bp.route('/raise_consignment', methods=['POST'])
+@require_session('Depot')
 def raise_consignment():
     """
     Handles raising a new consignment.
-    Expects JSON: { "packId": "...", "centerId": "..." }
+    Expects JSON: { "packId": "...", "centerId": "...", "depotId": "..." }
+    Depot users only. The packs leave the depot of the caller's session, which must be
+    a configured depot; depotId is optional and must name that depot.
     """
     data = request.get_json()
     pack_id = data.get('packId')
     center_id = data.get('centerId') # Assuming centerId is provided by frontend
+    depot_id = current_session()['site']
 
     if not all([pack_id, center_id]):
         return jsonify({"error": "Missing pack ID or center ID"}), 400
+    if data.get('depotId', depot_id) != depot_id:
+        return jsonify({"error": "Cannot raise consignments from another depot"}), 403
+    if not is_depot(depot_id):
+        return jsonify({"error": f"Unknown depot '{depot_id}'"}), 400
 
     conn = get_db_connection()
     if conn is None:
@@ -24,39 +42,28 @@ def raise_consignment():
 
     cursor = conn.cursor()
     try:
-        check_pack = 'select pack_number from packs where pack_number = %s and centre="Depot" and status = "A" '
-        cursor.execute(check_pack,(pack_id,))
+        check_pack = 'select pack_number, pack_type from packs where pack_number = %s and centre = %s and status = "A" FOR UPDATE'
+        cursor.execute(check_pack,(pack_id,depot_id,))
         pack_available = cursor.fetchone()
         if pack_available is not None:
-            check_consignment = 'SELECT MAX(CAST(SUBSTRING(consignment_id, 8, 3) AS UNSIGNED)) AS max_id_number FROM consignments'
-            cursor.execute(check_consignment)
-            check_consignment = cursor.fetchone()
-            print(check_consignment)
-            consignment_id= check_consignment[0] # Renamed to avoid confusion with new_patient_id string
-            # Generate Unique patient Name
-            if consignment_id is None:
-                consignment_id = "CON-BYL" + "00" + str(1)
-            else:
-                next_id_num = str(consignment_id+1)
-                if len(next_id_num) == 1:
-                    pat_id_padded = '00' + next_id_num
-                elif len(next_id_num) == 2:
-                    pat_id_padded = '0' + next_id_num
-                else:
-                    pat_id_padded = next_id_num
-                consignment_id = "CON-BYL" + pat_id_padded
-                
+            # Next consignment id for this depot from its sequence (no table scan)
+            consignment_id = next_consignment_id(depot_id)
+
             raise_date = data.get('raiseDate', str(uuid.uuid4())[:10]) # Use provided date or generate current date
-            # Assuming status is 'Raised' initially
-            status = "Raised"
+            # Every consignment starts its lifecycle as 'Raised'
+            status = RAISED
 
             insert_query = """
-            INSERT INTO consignments (consignment_id, pack_id, center_id, status, raise_date)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO consignments (consignment_id, pack_id, center_id, depot_id, status, raise_date)
+            VALUES (%s, %s, %s, %s, %s, %s)
             """
-            cursor.execute(insert_query, (consignment_id, pack_id, center_id, status, raise_date))
+            cursor.execute(insert_query, (consignment_id, pack_id, center_id, depot_id, status, raise_date))
             update_packs = 'update packs set centre = %s ,status="B" where pack_number= %s'
             cursor.execute(update_packs,(center_id,pack_id,))
+            add_items(cursor, consignment_id, [pack_id])
+            packs_available_changed(cursor, depot_id, pack_available[1], -1)
+            bump(cursor, 'consignments', center_id)
+            bump(cursor, 'packs', depot_id, center_id)
             conn.commit()
             return jsonify({
                 "message": "Consignment raised successfully",
@@ -76,94 +83,231 @@ def raise_consignment():
         cursor.close()
         conn.close()
 
+@depot_bp.route('/raise_bulk_consignment', methods=['POST'])
+@require_session('Depot')
+def raise_bulk_consignment():
+    """
+    Raises one consignment carrying many kits from a depot to a site.
+    Expects JSON: { "centerId": "...", "depotId": "...", "packIds": ["...", ...] }
+              or: { "centerId": "...", "depotId": "...", "packs": { "<pack_type>": <count>, ... } }
+    Depot users only. The kits leave the depot of the caller's session, which must be a
+    configured depot; depotId is optional and must name that depot. With "dispatch": true
+    the consignment is marked as in transit straight away.
+    Either every requested kit is reserved or nothing is: unavailable packs are reported
+    and the consignment is not raised.
+    """
+    data = request.get_json() or {}
+    session = current_session()
+    center_id = data.get('centerId')
+    depot_id = session['site']
+    pack_ids = data.get('packIds')
+    requested_types = data.get('packs')
+
+    if not center_id:
+        return jsonify({"error": "Missing center ID"}), 400
+    if data.get('depotId', depot_id) != depot_id:
+        return jsonify({"error": "Cannot raise consignments from another depot"}), 403
+    if not is_depot(depot_id):
+        return jsonify({"error": f"Unknown depot '{depot_id}'"}), 400
+    if bool(pack_ids) == bool(requested_types):
+        return jsonify({"error": "Provide either packIds or packs (counts per pack type)"}), 400
+    if pack_ids is not None:
+        if not isinstance(pack_ids, list) or not all(isinstance(p, str) and p for p in pack_ids):
+            return jsonify({"error": "packIds must be a list of pack numbers"}), 400
+        pack_ids = list(dict.fromkeys(pack_ids))
+        requested = len(pack_ids)
+    else:
+        if not isinstance(requested_types, dict) or not all(isinstance(n, int) and n > 0 for n in requested_types.values()):
+            return jsonify({"error": "packs must map pack types to positive counts"}), 400
+        requested = sum(requested_types.values())
+    if requested > MAX_CONSIGNMENT_PACKS:
+        return jsonify({"error": f"At most {MAX_CONSIGNMENT_PACKS} packs can be sent in one consignment"}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    cursor = conn.cursor()
+    try:
+        # 1. Lock the kits at the depot with one selection
+        if pack_ids is not None:
+            packs, unavailable = lock_depot_packs(cursor, depot_id, pack_ids)
+            if unavailable:
+                conn.rollback()
+                return jsonify({
+                    "message": "Some packs are not available in this depot",
+                    "unavailable_pack_ids": unavailable,
+                    "status": "Failed"
+                }), 409
+        else:
+            packs, shortfall = lock_depot_packs_by_type(cursor, depot_id, requested_types)
+            if shortfall:
+                conn.rollback()
+                return jsonify({
+                    "message": "Not enough available packs in this depot",
+                    "shortfall": shortfall,
+                    "status": "Failed"
+                }), 409
+
+        # 2. Header, line items and the pack move, all in this transaction
+        consignment_id = next_consignment_id(depot_id)
+        status = IN_TRANSIT if data.get('dispatch') else RAISED
+        raise_date = data.get('raiseDate', str(date.today()))
+        shipped = list(packs)
+        cursor.execute(
+            "INSERT INTO consignments (consignment_id, pack_id, center_id, depot_id, status, raise_date, raised_by_user_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (consignment_id, None, center_id, depot_id, status, raise_date, session['user'])
+        )
+        add_items(cursor, consignment_id, shipped)
+        ship_packs(cursor, center_id, shipped)
+        counts = type_counts(packs)
+        for pack_type, count in sorted(counts.items()):
+            packs_available_changed(cursor, depot_id, pack_type, -count)
+        bump(cursor, 'consignments', center_id)
+        bump(cursor, 'packs', depot_id, center_id)
+        conn.commit()
+        return jsonify({
+            "message": "Consignment raised successfully",
+            "consignment_id": consignment_id,
+            "status": status,
+            "pack_ids": shipped,
+            "pack_counts": counts
+        }), 201
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error raising bulk consignment: {e}")
+        return jsonify({"message": "Failed to raise consignment", "error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
 @depot_bp.route('/record_medical_arrival', methods=['POST'])
 def record_medical_arrival():
     """
     Records the arrival of a medical shipment.
     Expects JSON: { "shipmentId": "...", "status": "...", "arrivalDate": "...", "notes": "..." }
     Status can be 'Arrived', 'Damaged', 'Quarantined'.
+    With a session token only shipments addressed to the session's site are accepted.
     """
     data = request.get_json()
     shipment_id = data.get('shipmentId')
     status = data.get('status')
     arrival_date = data.get('arrivalDate')
-    notes = data.get('notes', '') # Notes are optional
-    username = data.get('username')
+    session = current_session()
+    username, site = (session['user'], session['site']) if session is not None else (data.get('username'), None)
 
     if not all([shipment_id, status, arrival_date]):
         return jsonify({"error": "Missing shipment ID, status, or arrival date"}), 400
 
-    if status not in ['Arrived', 'Damaged', 'Quarantined']:
+    if status not in ARRIVAL_STATES:
         return jsonify({"error": "Invalid shipment status. Must be 'Arrived', 'Damaged', or 'Quarantined'"}), 400
 
     conn = get_db_connection()
     if conn is None:
         return jsonify({"message": "Database connection failed"}), 500
 
-    cursor = conn.cursor()
     try:
-        # Check if shipment already exists (optional, depends on desired behavior)
-        # For simplicity, we'll assume new records for each arrival event.
-        # If you need to update an existing shipment, you'd use UPDATE here.
-        check_consignment = 'select * from consignments where consignment_id = %s'
-        cursor.execute(check_consignment,(shipment_id,))
-        consignment_data = cursor.fetchone()
-        consignmnet_number = consignment_data[0] #checking shipment id is in  consignmnet table or not
-        
-    
-        check_shipments = 'select * from shipments where shipment_id = %s'
-        cursor.execute(check_shipments,(shipment_id,))
-        data = cursor.fetchone() #checking the shipment is duplicate / already arrived?
-        
-        get_pack_id = 'select pack_id from consignments where consignment_id=%s'
-        cursor.execute(get_pack_id,(consignmnet_number,))
-        pack_id = cursor.fetchone()
-        pack_id = pack_id[0]
-        if data is None and consignment_data is not None:
-            insert_query = """
-            INSERT INTO shipments (shipment_id, status, arrival_date, notes,received_by_user_id)
-            VALUES (%s, %s, %s, %s,%s)
-            """
-            cursor.execute(insert_query, (shipment_id, status, arrival_date, notes,username))
-            print("shipments")
-            if status == 'Arrived':
-                p_status = 'A'
-            elif status == 'Damanged':
-                p_status = 'D'
-            else:
-                p_status ='Q'
-            cursor.execute("Update packs set status=%s where pack_number = %s",(p_status,pack_id,))
-            conn.commit()
-
+        result = receive_shipments(conn, [data], username, site)[0]
+        if result['status'] == 'Received':
             return jsonify({
                 "message": "Medical shipment arrival recorded successfully",
                 "shipment_id": shipment_id,
                 "status": status
             }), 201
-        elif data is not None:
-            status = "Duplicate"
-            return jsonify({
-                "message" : " Shipment has already received ",
-                "shipment_id" : shipment_id,
-                "status" : status
-            })
-        else:
-            status = 'Invalid'
-            return jsonify({
-                "message" : "Invalid Shipment Id",
-                "shipment_id" :shipment_id,
-                "status" : status
-                
-            })
+        return jsonify({
+            "message": result['message'],
+            "shipment_id": shipment_id,
+            "status": result['status']
+        })
 
     except Exception as e:
-        conn.rollback()
         print(f"Error recording medical arrival: {e}")
         return jsonify({"message": "Failed to record medical arrival", "error": str(e)}), 500
+    finally:
+        conn.close()
+
+@depot_bp.route('/record_shipment_receipts', methods=['POST'])
+def record_shipment_receipts():
+    """
+    Records the arrival of many shipments (each a whole consignment) in one call.
+    Expects JSON: { "username": "...", "arrivalDate": "...",
+                    "shipments": [{ "shipmentId": "...", "status": "...", "arrivalDate": "...", "notes": "..." }, ...] }
+    arrivalDate at the top level is used for shipments that do not give their own.
+    Returns one result per shipment: 'Received', 'Duplicate' or 'Invalid'.
+    With a session token only shipments addressed to the session's site are accepted.
+    """
+    data = request.get_json() or {}
+    session = current_session()
+    username, site = (session['user'], session['site']) if session is not None else (data.get('username'), None)
+    shipments = data.get('shipments')
+    if not isinstance(shipments, list) or not shipments:
+        return jsonify({"error": "shipments must be a non-empty list"}), 400
+    if len(shipments) > MAX_RECEIPT_BATCH:
+        return jsonify({"error": f"At most {MAX_RECEIPT_BATCH} shipments can be received per request"}), 400
+    default_date = data.get('arrivalDate')
+    if default_date:
+        shipments = [dict(item, arrivalDate=item.get('arrivalDate') or default_date) if isinstance(item, dict) else item
+                     for item in shipments]
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    try:
+        results = receive_shipments(conn, shipments, username, site)
+        received = sum(1 for result in results if result['status'] == 'Received')
+        return jsonify({"results": results, "received": received, "failed": len(results) - received}), 200
+    except Exception as e:
+        print(f"Error recording shipment receipts: {e}")
+        return jsonify({"message": "Failed to record shipment receipts", "error": str(e)}), 500
+    finally:
+        conn.close()
+
+@depot_bp.route('/dispatch_consignment', methods=['POST'])
+@require_session('Depot')
+def dispatch_consignment():
+    """
+    Marks a raised consignment as shipped from the depot.
+    Expects JSON: { "consignmentId": "..." }
+    Depot users only; consignments raised by another depot are reported as not found.
+    """
+    data = request.get_json()
+    depot_id = current_session()['site']
+    consignment_id = data.get('consignmentId')
+
+    if not consignment_id:
+        return jsonify({"error": "Missing consignment ID"}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    cursor = conn.cursor()
+    try:
+        if not transition(cursor, consignment_id, IN_TRANSIT, from_states=(RAISED,), depot=depot_id):
+            conn.rollback()
+            cursor.execute("SELECT status FROM consignments WHERE consignment_id = %s AND depot_id = %s", (consignment_id, depot_id))
+            current = cursor.fetchone()
+            if current is None:
+                return jsonify({"message": "Consignment not found", "consignment_id": consignment_id}), 404
+            return jsonify({"message": f"Consignment is in '{current[0]}' state, not 'Raised'", "consignment_id": consignment_id}), 409
+        cursor.execute("SELECT center_id FROM consignments WHERE consignment_id = %s", (consignment_id,))
+        bump(cursor, 'consignments', cursor.fetchone()[0])
+        conn.commit()
+        return jsonify({"message": "Consignment dispatched", "consignment_id": consignment_id, "status": IN_TRANSIT}), 200
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error dispatching consignment: {e}")
+        return jsonify({"message": "Failed to dispatch consignment", "error": str(e)}), 500
     finally:
         cursor.close()
         conn.close()
+
 @depot_bp.route('/depot_sites', methods=['GET'])
+@conditional(for_tables('sites'))
 def get_sites():
     """
     Fetches all available sites from the database.
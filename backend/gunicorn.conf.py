@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+
+# Production launcher for the RTSM backend:
+#   pip install gunicorn
+#   gunicorn -c gunicorn.conf.py
+#
+# The master imports the app once (preload_app) and forks the workers from
+# it. Each worker opens its own connection pool (db.py drops any connection
+# inherited through fork) and warms it, together with the user/site cache,
+# before it accepts traffic.
+#
+# Signals to the master:
+#   HUP   graceful reload: re-reads this file, starts fresh workers and lets
+#         the old ones drain in-flight requests for up to graceful_timeout.
+#         With preload_app the new workers fork from the already loaded code,
+#         so deploy new code with USR2 (start a new master) followed by QUIT
+#         to the old master, or set RTSM_PRELOAD=0 to reload code on HUP.
+#   TERM  graceful shutdown (drain), INT/QUIT immediate shutdown.
+#   TTIN / TTOU  add / remove one worker.
+
+bind = os.environ.get('RTSM_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('RTSM_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('RTSM_THREADS', 4))
+worker_class = 'gthread'
+
+# Seconds a worker may spend on one request before the master restarts it
+timeout = int(os.environ.get('RTSM_TIMEOUT', 30))
+# Seconds old workers get to finish in-flight requests on HUP/TERM
+graceful_timeout = int(os.environ.get('RTSM_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('RTSM_KEEPALIVE', 5))
+
+# Recycle each worker after this many requests (jittered so they do not all
+# restart together); 0 disables recycling
+max_requests = int(os.environ.get('RTSM_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('RTSM_MAX_REQUESTS_JITTER', max_requests // 10))
+
+preload_app = os.environ.get('RTSM_PRELOAD', '1') != '0'
+wsgi_app = 'app:app'
+
+# RTSM_ASYNC=1 serves async_app (async dashboard reads) with uvicorn workers
+if os.environ.get('RTSM_ASYNC') == '1':
+    wsgi_app = 'async_app:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Every request thread needs a connection, and the counter reconciler thread
+# (site_counters.start_reconciler) checks one out of the same pool while the
+# request threads are busy. Size the per-worker pool to the threads plus
+# headroom for the reconciler and one spare, unless it is configured
+# explicitly. This runs before the app is imported.
+POOL_HEADROOM = 2
+os.environ.setdefault('RTSM_DB_POOL_SIZE', str(threads + POOL_HEADROOM))
+
+# Each worker starts its own bcrypt process pool (password_hashing.py); share
+# the CPUs between the workers rather than giving every worker its own pair
+os.environ.setdefault('RTSM_HASH_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+
+accesslog = os.environ.get('RTSM_ACCESS_LOG', '-')
+errorlog = os.environ.get('RTSM_ERROR_LOG', '-')
+
+
+def post_worker_init(worker):
+    """Runs in each worker after the app is loaded and before it accepts requests."""
+    from warmup import warm_worker
+    summary = warm_worker(threads)
+    worker.log.info(f"Worker {worker.pid} warmed up: {summary}")
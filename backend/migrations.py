@@ -0,0 +1,408 @@
+from db import get_db_connection
+from sequences import CONSIGNMENT_ID_FORMATS
+
+# Versioned schema migrations.
+# Each migration runs once, in order, and is recorded in schema_version.
+# Migrations are written to be safe to re-run (CREATE ... IF NOT EXISTS and
+# guarded ALTERs), because MySQL commits DDL immediately and a run that is
+# interrupted half way must be able to simply start again.
+# To change the schema, append a new function to MIGRATIONS; never edit one
+# that has already shipped.
+
+MIGRATION_LOCK = 'rtsm_schema_migrations'
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def _add_index(cursor, table, index, columns, unique=False):
+    if not _index_exists(cursor, table, index):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {index} ({columns})")
+
+
+def _m001_baseline(cursor):
+    """Baseline tables and the default Admin user."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS patients (id VARCHAR(50),
+        patient_name VARCHAR(50),
+        status VARCHAR(50) NOT NULL,
+        enrollment_date DATE NOT NULL,
+        informed_consent_date DATE,
+        date_of_birth DATE NOT NULL,
+        gender VARCHAR(10),
+        treatment VARCHAR(50),
+        screen_failure_date DATE,
+        Sites VARCHAR(10), -- Using VARCHAR as it appears to be a site code
+        assigned_pack_id VARCHAR(50),
+        TRT_Completion_Date DATE,
+        Code_break DATE
+    );""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS consignments (
+            consignment_id VARCHAR(50) PRIMARY KEY,
+            pack_id VARCHAR(50),
+            center_id VARCHAR(50),
+            status VARCHAR(50),
+            raise_date DATE,
+            raised_by_user_id VARCHAR(50),
+            created_at DATETIME
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS packs (
+        pack_number VARCHAR(50) PRIMARY KEY,
+        patient_id VARCHAR(50),
+        centre VARCHAR(50),
+        status VARCHAR(50),
+        allocation_date DATE,
+        pack_type VARCHAR(50)
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS shipments (
+        shipment_id VARCHAR(50) PRIMARY KEY,
+        tracking_number VARCHAR(50),
+        status VARCHAR(50),
+        arrival_date DATE,
+        notes TEXT,
+        received_by_user_id VARCHAR(50),
+        created_at DATETIME
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sites (
+        sites VARCHAR(50) PRIMARY KEY,
+        site_name VARCHAR(50),
+        site_activation VARCHAR(50),
+        site_act_date DATE
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_secret_code (
+        id INT NOT NULL AUTO_INCREMENT Primary Key,
+        role VARCHAR(50),
+        secret_code VARCHAR(50),
+        created_at DATETIME
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INT NOT NULL AUTO_INCREMENT Primary Key,
+        username VARCHAR(50) UNIQUE,
+        password VARCHAR(255),
+        name VARCHAR(50),
+        role VARCHAR(50),
+        sites VARCHAR(50)
+    );""")
+    # username is UNIQUE, so databases set up by the old script keep their single Admin row
+    cursor.execute("INSERT IGNORE INTO users(username,password,role) values('Admin','$2b$12$tg8lY9DpUv5ZI4QONnCgleYR8KBd2xLNPsP9SF54J3AjBwuS.2RzS','Admin')")
+
+
+def _m002_sequences(cursor):
+    """Sequences table for patient and consignment ids, seeded from existing rows."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sequences (
+        name VARCHAR(100) PRIMARY KEY,
+        last_value BIGINT UNSIGNED NOT NULL
+    );""")
+    # Only numeric ids and names are cast: the old enrollment code fell back to
+    # "<site>-<uuid>" names, and casting those fails in strict SQL mode
+    cursor.execute("""
+    INSERT IGNORE INTO sequences (name, last_value)
+    SELECT 'patient_id', COALESCE(MAX(CAST(SUBSTRING(id, 4) AS UNSIGNED)), 0)
+    FROM patients WHERE id REGEXP '^PAT[0-9]+$'
+    """)
+    cursor.execute("""
+    INSERT IGNORE INTO sequences (name, last_value)
+    SELECT CONCAT('patient_name:', sites), COALESCE(MAX(CAST(SUBSTRING(patient_name, CHAR_LENGTH(sites) + 1) AS UNSIGNED)), 0)
+    FROM patients
+    WHERE sites IS NOT NULL
+      AND LEFT(patient_name, CHAR_LENGTH(sites)) = sites
+      AND SUBSTRING(patient_name, CHAR_LENGTH(sites) + 1) REGEXP '^[0-9]+$'
+    GROUP BY sites
+    """)
+    cursor.execute("""
+    INSERT IGNORE INTO sequences (name, last_value)
+    SELECT 'consignment:CON-BYL', COALESCE(MAX(CAST(SUBSTRING(consignment_id, 8) AS UNSIGNED)), 0)
+    FROM consignments WHERE consignment_id REGEXP '^CON-BYL[0-9]+$'
+    """)
+
+
+def _m003_pack_random_key(cursor):
+    """Pre-shuffled allocation queue for packs: random_key plus (centre, status, random_key) index."""
+    if not _column_exists(cursor, 'packs', 'random_key'):
+        cursor.execute("ALTER TABLE packs ADD COLUMN random_key DOUBLE NOT NULL DEFAULT (RAND())")
+        cursor.execute("UPDATE packs SET random_key = RAND()")
+    _add_index(cursor, 'packs', 'idx_packs_allocation', 'centre, status, random_key')
+
+
+def _m004_randomization_schedule(cursor):
+    """Block-randomization schedule tables."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS randomization_arms (
+        arm_code TINYINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        pack_type VARCHAR(50) NOT NULL UNIQUE
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS randomization_schedule (
+        site VARCHAR(50) NOT NULL,
+        stratum VARCHAR(50) NOT NULL,
+        slot INT UNSIGNED NOT NULL,
+        arm_code TINYINT UNSIGNED NOT NULL,
+        patient_id VARCHAR(50),
+        assigned_at DATETIME,
+        PRIMARY KEY (site, stratum, slot),
+        INDEX idx_schedule_next (site, stratum, patient_id, slot)
+    );""")
+
+
+def _renumber_duplicate_patients(cursor):
+    """
+    Gives every patient that shares its id with an earlier enrolled patient a
+    fresh id from the patient_id sequence. Its pack and randomization slot
+    follow it, and each change is kept in patient_id_changes.
+    Returns [(old id, new id, patient name)].
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS patient_id_changes (
+        old_id VARCHAR(50) NOT NULL,
+        new_id VARCHAR(50) NOT NULL PRIMARY KEY,
+        patient_name VARCHAR(50),
+        changed_at DATETIME NOT NULL
+    );""")
+    cursor.execute("SELECT id FROM patients WHERE id IS NOT NULL GROUP BY id HAVING COUNT(*) > 1 ORDER BY id")
+    duplicates = [row[0] for row in cursor.fetchall()]
+
+    changes = []
+    for old_id in duplicates:
+        # The earliest enrolled patient keeps the id
+        cursor.execute("""
+            SELECT patient_name, Sites, assigned_pack_id FROM patients WHERE id = %s
+            ORDER BY enrollment_date, patient_name
+        """, (old_id,))
+        for name, site, pack_id in cursor.fetchall()[1:]:
+            cursor.execute("UPDATE sequences SET last_value = LAST_INSERT_ID(last_value + 1) WHERE name = 'patient_id'")
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            new_id = f"PAT{cursor.fetchone()[0]:03d}"
+            cursor.execute("""
+                UPDATE patients SET id = %s
+                WHERE id = %s AND patient_name <=> %s AND Sites <=> %s AND assigned_pack_id <=> %s
+                LIMIT 1
+            """, (new_id, old_id, name, site, pack_id))
+            if pack_id is not None:
+                cursor.execute("UPDATE packs SET patient_id = %s WHERE pack_number = %s AND patient_id = %s", (new_id, pack_id, old_id))
+                # The slot of this patient's arm; slots of the same arm are interchangeable
+                cursor.execute("""
+                    UPDATE randomization_schedule SET patient_id = %s
+                    WHERE patient_id = %s AND site <=> %s AND arm_code = (
+                        SELECT a.arm_code FROM randomization_arms a JOIN packs p ON p.pack_type = a.pack_type
+                        WHERE p.pack_number = %s
+                    )
+                    ORDER BY slot DESC LIMIT 1
+                """, (new_id, old_id, site, pack_id))
+            cursor.execute(
+                "INSERT INTO patient_id_changes (old_id, new_id, patient_name, changed_at) VALUES (%s, %s, %s, NOW())",
+                (old_id, new_id, name)
+            )
+            changes.append((old_id, new_id, name))
+    return changes
+
+
+def _m005_patients_primary_key(cursor):
+    """Primary key on patients.id, renumbering duplicate ids first."""
+    if not _index_exists(cursor, 'patients', 'PRIMARY'):
+        # Concurrent enrollments under the old id generator could hand out the same id twice
+        for old_id, new_id, name in _renumber_duplicate_patients(cursor):
+            print(f"Patient {name} shared id {old_id} with another patient; renumbered to {new_id} (see patient_id_changes).")
+        cursor.execute("ALTER TABLE patients MODIFY id VARCHAR(50) NOT NULL, ADD PRIMARY KEY (id)")
+
+
+def _m006_route_indexes(cursor):
+    """Composite indexes matching the predicates of the patient, pack and consignment routes."""
+    # Site rosters ordered by id (/patients, /monitor/patients)
+    _add_index(cursor, 'patients', 'idx_patients_site_id', 'Sites, id')
+    # Enrolled/randomized/code-broken lists filter on site + status (+ pack)
+    _add_index(cursor, 'patients', 'idx_patients_site_status', 'Sites, status, assigned_pack_id')
+    # Treatment completion and code break eligibility filter on the NULL date columns
+    _add_index(cursor, 'patients', 'idx_patients_site_completion', 'Sites, TRT_Completion_Date, Code_break')
+    _add_index(cursor, 'patients', 'idx_patients_pack', 'assigned_pack_id')
+    _add_index(cursor, 'consignments', 'idx_consignments_center_status', 'center_id, status')
+
+
+def _m007_pack_lot(cursor):
+    """Lot number on packs, filled in by the kit manifest loader."""
+    if not _column_exists(cursor, 'packs', 'lot'):
+        cursor.execute("ALTER TABLE packs ADD COLUMN lot VARCHAR(50)")
+
+
+def _m008_unique_secret_codes(cursor):
+    """Unique secret codes (keeping the oldest copy of any duplicate) and a batch id per insert."""
+    if not _index_exists(cursor, 'user_secret_code', 'uq_secret_code'):
+        cursor.execute("""
+        DELETE newer FROM user_secret_code newer
+        JOIN user_secret_code older ON older.secret_code = newer.secret_code AND older.id < newer.id
+        """)
+        _add_index(cursor, 'user_secret_code', 'uq_secret_code', 'secret_code', unique=True)
+    if not _column_exists(cursor, 'user_secret_code', 'batch_id'):
+        cursor.execute("ALTER TABLE user_secret_code ADD COLUMN batch_id VARCHAR(36)")
+
+
+def _m009_consignment_state(cursor):
+    """Consignment lifecycle state: mark consignments that already have a shipment record as arrived."""
+    cursor.execute("""
+    UPDATE consignments c
+    JOIN shipments s ON s.shipment_id = c.consignment_id
+    SET c.status = CASE s.status
+        WHEN 'Arrived' THEN 'Received'
+        WHEN 'Damaged' THEN 'Damaged'
+        ELSE 'Quarantined'
+    END
+    WHERE c.status IN ('Raised', 'InTransit')
+    """)
+
+
+def _m010_data_versions(cursor):
+    """Per-site and per-table change versions used for ETags."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope VARCHAR(100) PRIMARY KEY,
+        version BIGINT UNSIGNED NOT NULL
+    );""")
+
+
+def _m011_site_counters(cursor):
+    """Per-site patient status and available pack counters, seeded from current data."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS site_counters (
+        site VARCHAR(50) NOT NULL,
+        counter VARCHAR(100) NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (site, counter)
+    );""")
+    cursor.execute("DELETE FROM site_counters")
+    cursor.execute("""
+    INSERT INTO site_counters (site, counter, value)
+    SELECT sites, CONCAT('patients:', status), COUNT(*)
+    FROM patients WHERE sites IS NOT NULL AND status IS NOT NULL
+    GROUP BY sites, status""")
+    cursor.execute("""
+    INSERT INTO site_counters (site, counter, value)
+    SELECT centre, CONCAT('packs_available:', pack_type), COUNT(*)
+    FROM packs WHERE status = 'A' AND centre IS NOT NULL AND pack_type IS NOT NULL
+    GROUP BY centre, pack_type""")
+
+
+def _m012_consignment_items(cursor):
+    """Consignment line items (one row per kit), backfilled from consignments.pack_id."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS consignment_items (
+        consignment_id VARCHAR(50) NOT NULL,
+        pack_id VARCHAR(50) NOT NULL,
+        PRIMARY KEY (consignment_id, pack_id),
+        KEY idx_consignment_items_pack (pack_id)
+    );""")
+    cursor.execute("""
+    INSERT IGNORE INTO consignment_items (consignment_id, pack_id)
+    SELECT consignment_id, pack_id FROM consignments WHERE pack_id IS NOT NULL""")
+
+
+def _m013_consignment_depot(cursor):
+    """Depot each consignment ships from, backfilled from the id prefix of each configured depot."""
+    if not _column_exists(cursor, 'consignments', 'depot_id'):
+        cursor.execute("ALTER TABLE consignments ADD COLUMN depot_id VARCHAR(50)")
+    prefixes = [(fmt['prefix'].format(depot=depot), depot) for depot, fmt in CONSIGNMENT_ID_FORMATS.items()]
+    # Longest prefix first, so a prefix that extends another claims its ids
+    for prefix, depot in sorted(prefixes, key=lambda item: -len(item[0])):
+        cursor.execute(
+            "UPDATE consignments SET depot_id = %s WHERE depot_id IS NULL AND LEFT(consignment_id, CHAR_LENGTH(%s)) = %s",
+            (depot, prefix, prefix)
+        )
+
+
+MIGRATIONS = [
+    (1, _m001_baseline),
+    (2, _m002_sequences),
+    (3, _m003_pack_random_key),
+    (4, _m004_randomization_schedule),
+    (5, _m005_patients_primary_key),
+    (6, _m006_route_indexes),
+    (7, _m007_pack_lot),
+    (8, _m008_unique_secret_codes),
+    (9, _m009_consignment_state),
+    (10, _m010_data_versions),
+    (11, _m011_site_counters),
+    (12, _m012_consignment_items),
+    (13, _m013_consignment_depot),
+]
+
+
+def current_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn=None):
+    """
+    Applies every migration newer than the database's schema_version.
+    Returns the list of versions applied. Concurrent runners are serialised
+    with a named lock, so starting several workers at once is safe.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if conn is None:
+            raise Exception("Database connection failed.")
+
+    cursor = conn.cursor()
+    applied = []
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise Exception("Timed out waiting for the schema migration lock.")
+        try:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT NOT NULL PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at DATETIME NOT NULL
+            );""")
+            version = current_version(cursor)
+            for number, migration in MIGRATIONS:
+                if number <= version:
+                    continue
+                description = (migration.__doc__ or migration.__name__).strip()
+                print(f"Applying migration {number}: {description}")
+                migration(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, NOW())",
+                    (number, description[:255])
+                )
+                conn.commit()
+                applied.append(number)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+    return applied
+
+
+if __name__ == '__main__':
+    applied = migrate()
+    if applied:
+        print(f"Schema migrated to version {applied[-1]}.")
+    else:
+        print("Schema is up to date.")
@@ -0,0 +1,80 @@
+# Pack allocation engine used by randomisation.
+#
+# Every pack carries a random_key assigned when it is inserted, and packs are
+# indexed on (centre, status, random_key). Taking the available pack with the
+# lowest key therefore walks a pre-shuffled queue through the index: one row is
+# read no matter how many packs the site holds. FOR UPDATE SKIP LOCKED lets
+# concurrent randomizations at the same site each lock a different pack instead
+# of queueing behind one another or allocating the same pack twice.
+
+_SELECT_PACK = """
+    SELECT pack_number, pack_type
+    FROM packs
+    WHERE centre = %s AND status = 'A' {type_filter}
+    ORDER BY random_key
+    LIMIT {limit}
+    FOR UPDATE {skip_locked}
+"""
+
+_ASSIGN_PACK = """
+    UPDATE packs
+    SET status = 'Allocated', patient_id = %s, allocation_date = CURDATE()
+    WHERE pack_number = %s AND status = 'A'
+"""
+
+
+def lock_available_packs(cursor, site, count=1, pack_type=None, skip_locked=True):
+    """
+    Locks up to `count` available packs at the site and returns them as
+    (pack_number, pack_type) tuples. Must run inside the caller's transaction;
+    the locks are held until it commits or rolls back. With skip_locked=False,
+    packs locked by other transactions are waited for instead of skipped.
+    """
+    params = [site]
+    type_filter = ''
+    if pack_type:
+        type_filter = 'AND pack_type = %s'
+        params.append(pack_type)
+    cursor.execute(
+        _SELECT_PACK.format(type_filter=type_filter, limit=int(count), skip_locked='SKIP LOCKED' if skip_locked else ''),
+        tuple(params)
+    )
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def assign_pack(cursor, pack_number, patient_id):
+    """Marks a locked pack as allocated to the patient."""
+    cursor.execute(_ASSIGN_PACK, (patient_id, pack_number))
+    return cursor.rowcount == 1
+
+
+def allocate_pack(cursor, site, patient_id, pack_type=None):
+    """
+    Selects one eligible pack at the site and assigns it to the patient inside
+    the caller's transaction. Returns (pack_number, pack_type), or None if the
+    site has no available pack.
+    """
+    packs = lock_available_packs(cursor, site, 1, pack_type)
+    if not packs:
+        return None
+    pack_number, allocated_type = packs[0]
+    assign_pack(cursor, pack_number, patient_id)
+    return pack_number, allocated_type
+
+
+def assign_packs(cursor, assignments):
+    """
+    Marks several locked packs as allocated with one UPDATE.
+    assignments is [(pack_number, patient_id)]. Returns the number of packs updated.
+    """
+    if not assignments:
+        return 0
+    cases = ' '.join(['WHEN %s THEN %s'] * len(assignments))
+    placeholders = ', '.join(['%s'] * len(assignments))
+    params = [value for pair in assignments for value in pair] + [pack_number for pack_number, _ in assignments]
+    cursor.execute(
+        f"UPDATE packs SET status = 'Allocated', allocation_date = CURDATE(), patient_id = CASE pack_number {cases} END "
+        f"WHERE pack_number IN ({placeholders}) AND status = 'A'",
+        tuple(params)
+    )
+    return cursor.rowcount
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import io
+import json
+import time
+from collections import Counter
+
+from data_versions import bump
+from db import get_db_connection
+from site_counters import packs_available_changed, reconcile_site
+
+# Bulk kit-manifest loader.
+# A manifest lists one kit per row with pack_number, pack_type, depot and lot
+# (CSV with a header row, or a JSON array of objects). Kits are loaded in
+# chunks with a single multi-row INSERT IGNORE per chunk; kits that are
+# already in the packs table are skipped by the database and counted from
+# the rows it reports as inserted.
+
+LOAD_BATCH_SIZE = 5000
+DEFAULT_DEPOT = 'Depot'
+
+# Report at most this many pack numbers per problem category; counts are always exact
+MAX_REPORTED = 100
+
+_INSERT_PACKS = "INSERT IGNORE INTO packs (pack_number, centre, status, pack_type, lot) VALUES (%s, %s, %s, %s, %s)"
+
+
+def _normalise(record):
+    """Maps a manifest row onto (pack_number, depot, status, pack_type, lot), or None if invalid."""
+    record = {str(k).strip().lower(): v for k, v in record.items()}
+    pack_number = str(record.get('pack_number') or '').strip()
+    pack_type = str(record.get('pack_type') or '').strip()
+    if not pack_number or not pack_type:
+        return None
+    depot = str(record.get('depot') or DEFAULT_DEPOT).strip()
+    lot = str(record.get('lot') or '').strip() or None
+    return (pack_number, depot, 'A', pack_type, lot)
+
+
+def read_manifest(source, fmt=None):
+    """
+    Yields manifest rows as dicts from a path, a text stream or a list of dicts.
+    fmt is 'csv' or 'json'; for paths it defaults to the file extension.
+    """
+    if isinstance(source, list):
+        yield from source
+        return
+    if isinstance(source, str):
+        fmt = fmt or ('json' if source.lower().endswith('.json') else 'csv')
+        with open(source, newline='', encoding='utf-8') as f:
+            yield from read_manifest(f, fmt)
+        return
+    if fmt == 'json':
+        data = json.load(source)
+        yield from (data.get('packs', []) if isinstance(data, dict) else data)
+    else:
+        yield from csv.DictReader(source)
+
+
+def read_uploaded_manifest(file_storage):
+    """Reads a manifest uploaded through the admin endpoint (werkzeug FileStorage)."""
+    fmt = 'json' if (file_storage.filename or '').lower().endswith('.json') else 'csv'
+    return read_manifest(io.TextIOWrapper(file_storage.stream, encoding='utf-8', newline=''), fmt)
+
+
+def _report(problems, pack_number):
+    if len(problems) < MAX_REPORTED:
+        problems.append(pack_number)
+
+
+def load_packs(conn, records, batch_size=LOAD_BATCH_SIZE, progress=None):
+    """
+    Loads manifest records into the packs table. Each chunk is committed on
+    its own, so a failure part-way leaves earlier chunks loaded and the
+    returned counts say how far the load got. progress(processed, inserted)
+    is called after every chunk.
+    """
+    summary = {
+        'processed': 0,
+        'inserted': 0,
+        'invalid': 0,
+        'duplicates_in_manifest': 0,
+        'already_loaded': 0,
+        'invalid_rows': [],
+        'duplicate_pack_numbers': [],
+    }
+    seen = set()
+    cursor = conn.cursor()
+
+    def flush(chunk):
+        cursor.executemany(_INSERT_PACKS, chunk)
+        inserted = cursor.rowcount
+        depots = sorted({row[1] for row in chunk})
+        if inserted == len(chunk):
+            # Loaded packs are available at their depot
+            for (depot, pack_type), count in sorted(Counter((row[1], row[3]) for row in chunk).items()):
+                packs_available_changed(cursor, depot, pack_type, count)
+        else:
+            summary['already_loaded'] += len(chunk) - inserted
+            if inserted:
+                # Only some kits were new; recount the depots this chunk touched
+                for depot in depots:
+                    reconcile_site(cursor, depot)
+        if inserted:
+            bump(cursor, 'packs', *depots)
+        conn.commit()
+        summary['inserted'] += inserted
+        if progress:
+            progress(summary['processed'], summary['inserted'])
+
+    try:
+        chunk = []
+        for record in records:
+            summary['processed'] += 1
+            row = _normalise(record)
+            if row is None:
+                summary['invalid'] += 1
+                _report(summary['invalid_rows'], summary['processed'])
+                continue
+            if row[0] in seen:
+                summary['duplicates_in_manifest'] += 1
+                _report(summary['duplicate_pack_numbers'], row[0])
+                continue
+            seen.add(row[0])
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return summary
+
+
+if __name__ == '__main__':
+    # Example: python pack_loader.py kits.csv
+    # CSV header: pack_number,pack_type,depot,lot  (depot defaults to "Depot", lot is optional)
+    parser = argparse.ArgumentParser(description="Bulk-load a kit manifest into the packs table.")
+    parser.add_argument('manifest', help="Path to a CSV or JSON kit manifest")
+    parser.add_argument('--format', choices=['csv', 'json'], default=None)
+    parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("Database connection failed")
+
+    started = time.monotonic()
+    summary = load_packs(
+        conn, read_manifest(args.manifest, args.format), args.batch_size,
+        progress=lambda processed, inserted: print(f"{processed} rows read, {inserted} packs loaded", end='\r')
+    )
+    conn.close()
+    print()
+    print(json.dumps(summary, indent=2))
+    print(f"Loaded {summary['inserted']} packs in {time.monotonic() - started:.1f}s")
@@ -1,15 +1,30 @@
+import argparse
+
 from db import get_db_connection
+from pack_loader import load_packs
+
+# Seeds demo inventory at the central depot: the first half of the kits are
+# PLACEBO and the rest 10_MG. Real studies should load their kit manifest with
+# pack_loader.py (or the /admin/load_packs endpoint) instead.
+parser = argparse.ArgumentParser(description="Seed demo packs at the depot.")
+parser.add_argument('--count', type=int, default=500, help="Number of kits to create")
+parser.add_argument('--prefix', default='BYL', help="Pack number prefix")
+parser.add_argument('--depot', default='Depot')
+parser.add_argument('--types', default='PLACEBO,10_MG', help="Comma-separated pack types, split evenly")
+args = parser.parse_args()
+
+pack_types = [t.strip() for t in args.types.split(',') if t.strip()]
+share = -(-args.count // len(pack_types))
+manifest = (
+    {
+        'pack_number': f"{args.prefix}{i:03d}",
+        'pack_type': pack_types[(i - 1) // share],
+        'depot': args.depot,
+    }
+    for i in range(1, args.count + 1)
+)
 
 conn = get_db_connection()
-cursor = conn.cursor()
-pack = 'PLACEBO'
-for i in range(1,501):
-    i = str(i)
-    if len(i)==1:
-        i = '00'+i
-    elif len(i)==2:
-        i = '0'+i
-    if i == '250':
-        pack = '10_MG'
-    cursor.execute("insert into packs(pack_number,centre,status,pack_type) values(%s,%s,%s,%s)",('BYL'+i,"Depot","A",pack))
-conn.commit()
+summary = load_packs(conn, manifest)
+conn.close()
+print(f"Loaded {summary['inserted']} packs ({summary['already_loaded']} already present).")
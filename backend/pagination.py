@@ -0,0 +1,60 @@
+from flask import request
+
+# Keyset (cursor) pagination for patient lists.
+# Pagination is opt-in: a request without `limit` or `after` gets the whole
+# list as before, just in a stable order. With `limit`, rows are returned in
+# id order and the response carries `next_cursor`, the id to pass as `after`
+# to fetch the following page (null on the last page). Each page is an index
+# range scan starting at `after`, so its cost does not depend on page depth.
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+
+def get_page_args(args=None):
+    """
+    Returns (limit, after) from the query string (or the given mapping), or
+    None when the request does not ask for pagination. Raises ValueError for a
+    malformed limit.
+    """
+    args = request.args if args is None else args
+    limit = args.get('limit')
+    after = args.get('after')
+    if limit is None and after is None:
+        return None
+    limit = int(limit) if limit else DEFAULT_PAGE_LIMIT
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_LIMIT), after or None
+
+
+def keyset_query(query, params, page, column='id'):
+    """
+    Appends the keyset predicate, ordering and look-ahead limit to a query that
+    already has a WHERE clause. Returns the new (query, params).
+    """
+    if page is None:
+        return f"{query} ORDER BY {column}", tuple(params)
+    limit, after = page
+    params = tuple(params)
+    if after is not None:
+        query = f"{query} AND {column} > %s"
+        params = params + (after,)
+    # One extra row tells us whether another page follows. The limit is bound
+    # as a parameter so every page size shares one prepared statement.
+    return f"{query} ORDER BY {column} LIMIT %s", params + (limit + 1,)
+
+
+def page_result(rows, page, key='id'):
+    """
+    Trims the look-ahead row and returns (rows, extra response fields).
+    The extra fields are empty when the request is not paginated.
+    """
+    if page is None:
+        return rows, {}
+    limit = page[0]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][key]
+    return rows, {"next_cursor": next_cursor, "limit": limit}
@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+# Password hashing off the request threads.
+# bcrypt at cost 12 burns a few hundred milliseconds of CPU per call; run
+# inline, a burst of logins at shift change holds the GIL and every request
+# thread of the worker with it. Hashes and checks are instead sent to a small
+# process pool per worker, and at most max_pending of them may be queued or
+# running at once. Beyond that a call fails fast with HashingOverloaded and
+# the route answers 503 with Retry-After, so the other endpoints keep serving.
+#
+# workers: hashing processes per web worker (0 runs bcrypt on the calling thread).
+#   The host runs web workers x this many hashing processes in total, so the
+#   multi-worker launcher (gunicorn.conf.py) defaults it to CPUs / web workers,
+#   at least 1; the default of 2 applies to a single `python app.py` process.
+# max_pending: hashes queued or running before new ones are rejected.
+# timeout: seconds a request waits for its hash before giving up.
+# rounds: bcrypt cost for new hashes; stored hashes with another cost are
+#   rehashed on the next successful login.
+HASH_CONFIG = {
+    'workers': int(os.environ.get('RTSM_HASH_WORKERS', 2)),
+    'max_pending': int(os.environ.get('RTSM_HASH_QUEUE', 16)),
+    'timeout': float(os.environ.get('RTSM_HASH_TIMEOUT', 10)),
+    'rounds': int(os.environ.get('RTSM_BCRYPT_ROUNDS', 12)),
+}
+
+RETRY_AFTER_SECONDS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_CONFIG['max_pending'])
+_stats_lock = threading.Lock()
+_stats = {'hashed': 0, 'checked': 0, 'rejected': 0, 'timeouts': 0, 'rehashed': 0}
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full or a hash does not finish in time."""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: the hashing processes must not inherit the worker's
+                # threads, pooled sockets or held locks
+                _executor = ProcessPoolExecutor(
+                    max_workers=HASH_CONFIG['workers'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _executor
+
+
+def start_pool():
+    """Starts the hashing processes now instead of on the first login; returns how many."""
+    if HASH_CONFIG['workers'] <= 0:
+        return 0
+    executor = _get_executor()
+    for future in [executor.submit(int) for _ in range(HASH_CONFIG['workers'])]:
+        future.result()
+    return HASH_CONFIG['workers']
+
+
+def _reset_executor_after_fork():
+    # The parent's pool processes belong to the parent; a forked worker starts its own
+    global _executor, _executor_lock, _slots
+    _executor = None
+    _executor_lock = threading.Lock()
+    _slots = threading.BoundedSemaphore(HASH_CONFIG['max_pending'])
+
+
+os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _run(func, *args):
+    """Runs func in the hashing pool, bounded by max_pending and timeout."""
+    if not _slots.acquire(blocking=False):
+        _count('rejected')
+        raise HashingOverloaded("Too many password operations in progress")
+    if HASH_CONFIG['workers'] <= 0:
+        try:
+            return func(*args)
+        finally:
+            _slots.release()
+
+    slots = _slots
+    try:
+        future = _get_executor().submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the hash finishes, even if this request stops waiting
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=HASH_CONFIG['timeout'])
+    except FutureTimeout:
+        future.cancel()
+        _count('timeouts')
+        raise HashingOverloaded("Password operation timed out")
+
+
+def hash_password(password):
+    """Returns the bcrypt hash of the password at the configured cost."""
+    hashed = _run(_hashpw, password.encode('utf-8'), HASH_CONFIG['rounds'])
+    _count('hashed')
+    return hashed
+
+
+def check_password(password, hashed):
+    """True when the password matches the stored bcrypt hash."""
+    matches = _run(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+    _count('checked')
+    return matches
+
+
+def hash_rounds(hashed):
+    """The cost factor of a stored hash ("$2b$12$..." -> 12), or None if unreadable."""
+    parts = hashed.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed):
+    """True when the stored hash was made at a cost other than the configured one."""
+    return hash_rounds(hashed) != HASH_CONFIG['rounds']
+
+
+def record_rehash():
+    _count('rehashed')
+
+
+def hashing_stats():
+    """Returns this worker's hashing counters and queue settings."""
+    with _stats_lock:
+        return {**_stats, **HASH_CONFIG}
@@ -0,0 +1,65 @@
+from pagination import keyset_query, page_result
+
+# Named patient list queries shared by the patient, randomisation, treatment
+# completion, code break and monitor routes.
+# Each entry is (selected columns, filter, row key used as the page cursor).
+# The site filter and keyset pagination are appended by build_query, so the
+# same name always yields the same few SQL strings, which are executed
+# through server-side prepared statements cached on the pooled connection.
+
+PATIENT_COLUMNS = """id, patient_name, status, enrollment_date, informed_consent_date,
+       date_of_birth, gender, treatment, screen_failure_date, sites,
+       assigned_pack_id, TRT_Completion_Date, code_break"""
+
+PATIENT_QUERIES = {
+    # /patients
+    'site_roster': (PATIENT_COLUMNS, "1 = 1", 'id'),
+    # /code_not_broken
+    'code_not_broken': (PATIENT_COLUMNS, "code_break IS NULL", 'id'),
+    # /monitor/patients
+    'monitor_roster': ("id AS patient_id, sites AS site_id, status", "status != 'Code Broken'", 'patient_id'),
+    # /monitor/code_broken_by_site
+    'code_broken': ("id AS patient_id, status, code_break", "status = 'Code Broken'", 'patient_id'),
+    # /patients/enrolled
+    'enrolled_unrandomized': ("id, patient_name", "status = 'Enrolled' AND assigned_pack_id IS NULL", 'id'),
+    # /patients/randomized_for_completion
+    'randomized_for_completion': (
+        "id, patient_name",
+        "status = 'Randomized' AND assigned_pack_id IS NOT NULL AND TRT_Completion_Date IS NULL",
+        'id'
+    ),
+    # /patients/not_code_broken
+    'code_break_eligible': (
+        "id, patient_name",
+        "status != 'Code Broken' AND TRT_Completion_Date IS NULL AND Code_break IS NULL",
+        'id'
+    ),
+}
+
+
+def row_key(name):
+    """Returns the response field that carries the page cursor for a named query."""
+    return PATIENT_QUERIES[name][2]
+
+
+def build_query(name, site=None, page=None):
+    """Returns (sql, params) for a named query, optionally restricted to a site and paginated."""
+    columns, where, _ = PATIENT_QUERIES[name]
+    query = f"SELECT {columns} FROM patients WHERE {where}"
+    params = ()
+    if site is not None:
+        query += " AND sites = %s"
+        params = (site,)
+    return keyset_query(query, params, page)
+
+
+def list_patients(conn, name, site=None, page=None):
+    """
+    Runs a named query on a server-side prepared statement and returns
+    (rows as dicts, pagination fields for the response).
+    """
+    query, params = build_query(name, site, page)
+    cursor = conn.execute_prepared(query, params)
+    columns = cursor.column_names
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return page_result(rows, page, row_key(name))
@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
-import uuid # For generating unique patient IDs
 from db import get_db_connection # Import from the new db.py file
+from site_resolver import get_user_site, invalidate as invalidate_user_site
+from session_tokens import current_session, require_session
+from sequences import next_patient_id, next_patient_name
+from pagination import get_page_args
+from patient_repository import build_query, list_patients, row_key
+from streaming import get_stream_format, stream_query
+from data_versions import bump, conditional, for_user_site, for_tables
+from site_counters import patient_status_changed
+from patient_transitions import apply_transition, summarize, validate_items
 from datetime import datetime, timezone # For accurate timestamps
 from datetime import date, datetime
 
@@ -9,14 +17,22 @@ from datetime import date, datetime
 patient_bp = Blueprint('patient', __name__)
 
 @patient_bp.route('/patients', methods=['GET'])
+@conditional(for_user_site('patients'))
 def get_patients():
     """
     Returns a list of all registered patients from the database,
     optionally filtered by the 'sites' associated with the provided username.
     Only active (is_deleted = 0) patients are returned.
     Username is expected as a query parameter: /patients?username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
     username = request.args.get('username')
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
 
     conn = get_db_connection()
     if conn is None:
@@ -28,31 +44,22 @@ def get_patients():
 
     try:
         if username:
-            # Fetch the site associated with the username from the users table
-            # Use a separate cursor if needed or ensure the current one doesn't interfere
-            site_cursor = conn.cursor(dictionary=True)
-            site_cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-            site_data = site_cursor.fetchone()
-            site_cursor.close() # Close this cursor immediately
-
-            if site_data and site_data['sites']:
-                user_site = site_data['sites']
-            else:
+            # Resolve the site associated with the username (cached)
+            user_site = get_user_site(username)
+            if not user_site:
                 print(f"Warning: User '{username}' not found or has no associated site.")
                 # For a general 'get_patients' endpoint, returning an empty list for no site might be acceptable
                 # or you could return a 404 if you strictly require a site.
                 return jsonify({"patients": [], "message": f"User '{username}' not found or has no associated site."}), 200
+        else:
+            # Without a username there is no site to list
+            return jsonify({"patients": []}), 200
 
-        # Base query to select all necessary patient fields and filter by is_deleted = 0
-        base_query = """
-        SELECT id, patient_name, status, enrollment_date, informed_consent_date, 
-               date_of_birth, gender, treatment, screen_failure_date, sites,
-               assigned_pack_id, TRT_Completion_Date, code_break 
-        FROM patients where sites = %s
-        """
-        cursor.execute(base_query,(user_site,))
-        patients = cursor.fetchall()
-        return jsonify({"patients": patients}), 200
+        if stream_format:
+            query, params = build_query('site_roster', user_site, page)
+            return stream_query(query, params, "patients", stream_format, page, row_key('site_roster'))
+        patients, page_fields = list_patients(conn, 'site_roster', user_site, page)
+        return jsonify({"patients": patients, **page_fields}), 200
 
     except Exception as e:
         print(f"Error fetching patient data in get_patients: {e}")
@@ -85,52 +92,12 @@ def register_patient():
     try:
         # --- Get the site of the registering user ---
         registering_username = data.get('username')
-        user_site = None
-        user_cursor = conn.cursor(dictionary=True)
-        user_cursor.execute("SELECT sites FROM users WHERE username = %s", (registering_username,))
-        user_site_data = user_cursor.fetchone()
-        if user_site_data and user_site_data['sites']:
-            user_site = user_site_data['sites']
-        user_cursor.close()
+        user_site = get_user_site(registering_username)
 
         if not user_site:
             return jsonify({"error": f"Registering user '{registering_username}' not found or has no associated site."}), 400
         # --- End Get site ---
 
-        # Generate Unique patient ID (e.g., PAT001, PAT002...)
-        # This assumes 'id' column stores 'PAT' followed by a number.
-        # It's safer to query MAX(id) directly and handle string parsing in Python.
-        cursor.execute("SELECT id FROM patients ORDER BY id DESC LIMIT 1")
-        last_patient_id = cursor.fetchone()
-        
-        if last_patient_id:
-            # Extract number part, convert to int, increment, then re-pad
-            last_id_num = int(last_patient_id[0][3:]) # Assuming format PATXXX
-            new_id_num = last_id_num + 1
-            new_patient_id = f"PAT{new_id_num:03d}" # Pad with leading zeros to 3 digits
-        else:
-            new_patient_id = "PAT001" # First patient
-
-        # Generate Unique patient Name (e.g., SITE_CODE_001, SITE_CODE_002)
-        # This logic needs to be careful to get the max based on the current site
-        cursor.execute("SELECT patient_name FROM patients WHERE sites = %s ORDER BY patient_name DESC LIMIT 1", (user_site,))
-        last_patient_name_for_site = cursor.fetchone()
-
-        if last_patient_name_for_site:
-            # Example: Assuming patient_name is like "SITE5001001", extract the number part after site code
-            try:
-                # Find the index where the site code ends and the number begins
-                num_part_start_index = len(user_site)
-                last_name_num = int(last_patient_name_for_site[0][num_part_start_index:])
-                new_name_num = last_name_num + 1
-                new_patient_name = f"{user_site}{new_name_num:03d}" # Pad with leading zeros to 3 digits
-            except ValueError:
-                # Fallback if parsing fails (e.g., inconsistent naming convention)
-                print(f"Warning: Could not parse last patient name for site {user_site}: {last_patient_name_for_site[0]}. Generating unique name with UUID.")
-                new_patient_name = f"{user_site}-{str(uuid.uuid4())[:8]}" # Use UUID fallback
-        else:
-            new_patient_name = f"{user_site}001" # First patient for this site
-        cursor = conn.cursor()
         cursor.execute("select site_act_date from sites where sites = %s",(user_site,))
         site_data = cursor.fetchone()
         site_act_date = site_data[0]
@@ -183,6 +150,14 @@ def register_patient():
         treatment = "Pending" # Initial treatment status
         screen_failure_date = None # Initialize as None for new enrollments
 
+        # Allocate the patient ID (PAT001, PAT002, ...) and per-site patient name
+        # (e.g., SITE5001, SITE5002) from the sequences table. Values come from a
+        # block reserved by this worker, so no scan of the patients table is needed
+        # and concurrent enrollments can never receive the same ID.
+        # IDs are only allocated once the request has passed validation.
+        new_patient_id = next_patient_id()
+        new_patient_name = next_patient_name(user_site)
+
         # Insert new patient into the patients table, including the 'sites' column
         insert_query = """
         INSERT INTO patients (
@@ -194,6 +169,8 @@ def register_patient():
             new_patient_id, new_patient_name, status, enrollment_date,
             informed_consent_date, date_of_birth, gender, treatment, screen_failure_date, user_site
         ))
+        patient_status_changed(cursor, user_site, None, status)
+        bump(cursor, 'patients', user_site)
         conn.commit()
 
         return jsonify({
@@ -247,19 +224,13 @@ def record_screen_failure():
     cursor = conn.cursor()
     try:
         # Get the site of the user performing the action
-        user_cursor = conn.cursor(dictionary=True)
-        user_cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-        site_data = user_cursor.fetchone()
-        user_cursor.close()
-
-        if not site_data or not site_data['sites']:
+        user_site = get_user_site(username)
+        if not user_site:
             return jsonify({"message": f"User '{username}' not found or has no associated site."}), 401
 
-        user_site = site_data['sites']
-
         # Check if patient exists, belongs to the user's site, and is currently 'Enrolled'
         cursor.execute(
-            "SELECT id FROM patients WHERE id = %s AND sites = %s AND status = 'Enrolled' ",
+            "SELECT id FROM patients WHERE id = %s AND sites = %s AND status = 'Enrolled' FOR UPDATE",
             (patient_id, user_site)
         )
         existing_patient = cursor.fetchone()
@@ -287,9 +258,12 @@ def record_screen_failure():
         WHERE id = %s
         """
         cursor.execute(update_query, ('Screen Failure', screen_failure_date, patient_id))
+        updated = cursor.rowcount
+        patient_status_changed(cursor, user_site, 'Enrolled', 'Screen Failure', updated)
+        bump(cursor, 'patients', user_site)
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             # This should ideally not happen if existing_patient check passed, but good for robustness
             return jsonify({"message": "No patient updated (unexpected error). Please check logs."}), 500
 
@@ -303,6 +277,39 @@ def record_screen_failure():
         cursor.close()
         conn.close()
 
+@patient_bp.route('/record_screen_failures', methods=['POST'])
+def record_screen_failures():
+    """
+    Records screen failures for a batch of patients in one transaction.
+    Expects JSON: { "username": "...", "items": [{ "patientId": "...", "date": "YYYY-MM-DD" }, ...] }
+    Only patients of the user's site are updated.
+    Returns one result per item plus succeeded/failed counts.
+    """
+    data = request.get_json() or {}
+    items = data.get('items')
+    error = validate_items(items)
+    if error:
+        return jsonify({"error": error}), 400
+    username = data.get('username')
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+    user_site = get_user_site(username)
+    if not user_site:
+        return jsonify({"message": f"User '{username}' not found or has no associated site."}), 401
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    try:
+        results = apply_transition(conn, 'screen_failure', items, user_site)
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        print(f"Error recording batch screen failures: {e}")
+        return jsonify({"message": "Failed to record batch screen failures", "error": str(e)}), 500
+    finally:
+        conn.close()
+
 @patient_bp.route('/code_not_broken', methods=['GET'])
 def get_patients_code_not_broken():
     """
@@ -310,11 +317,18 @@ def get_patients_code_not_broken():
     and belong to the monitor's site.
     The monitor's site is determined using the provided username.
     Expected query parameter: username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
 
     username = request.args.get('username')
     if not username:
         return jsonify({"message": "Username parameter is missing."}), 400
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
 
     conn = get_db_connection()
     if conn is None:
@@ -326,29 +340,18 @@ def get_patients_code_not_broken():
 
     try:
         # Get the user's site
-        site_cursor = conn.cursor(dictionary=True)
-        site_cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-        site_data = site_cursor.fetchone()
-        site_cursor.close()
-
-        if site_data and site_data[0]:
-            user_site = site_data[0]
-        else:
+        user_site = get_user_site(username)
+        if not user_site:
             print(f"Warning: User '{username}' not found or has no associated site for code_not_broken.")
             return jsonify({"patients": [], "message": f"User '{username}' not found or has no associated site."}), 200
 
-        # Fetch patients from the user's site where code_break is NULL and not deleted
-        query = """
-        SELECT id, patient_name, status, enrollment_date, informed_consent_date,
-               date_of_birth, gender, treatment, screen_failure_date, sites,
-               assigned_pack_id, TRT_Completion_Date, code_break
-        FROM patients
-        WHERE sites = %s AND code_break IS NULL
-        """
-        cursor.execute(query, (user_site,))
-        patients = cursor.fetchall()
+        # Fetch patients from the user's site where code_break is NULL
+        if stream_format:
+            query, params = build_query('code_not_broken', user_site, page)
+            return stream_query(query, params, "patients", stream_format, page, row_key('code_not_broken'))
+        patients, page_fields = list_patients(conn, 'code_not_broken', user_site, page)
 
-        return jsonify({"patients": patients}), 200
+        return jsonify({"patients": patients, **page_fields}), 200
     except Exception as e:
         print(f"Error fetching code not broken patients for site {user_site}: {e}")
         return jsonify({"error": "Failed to fetch patients with unbroken code", "details": str(e)}), 500
@@ -358,6 +361,7 @@ def get_patients_code_not_broken():
 
 # New endpoint to get all sites
 @patient_bp.route('/sites', methods=['GET'])
+@conditional(for_tables('sites'))
 def get_all_sites():
     """
     Returns a list of all available sites from the 'sites' table.
@@ -381,17 +385,20 @@ def get_all_sites():
 
 # New endpoint to update user's associated site
 @patient_bp.route('/update_user_site', methods=['POST'])
+@require_session()
 def update_user_site():
     """
-    Updates the 'sites' column for a specific user in the 'users' table.
-    Expects JSON data with 'username' and 'site'.
+    Updates the 'sites' column of the signed-in user in the 'users' table.
+    Expects JSON data with 'site' and optionally 'username', which must be the session's user.
     """
-    data = request.get_json()
-    username = data.get('username')
+    data = request.get_json() or {}
+    username = data.get('username') or current_session()['user']
     site = data.get('site')
 
-    if not all([username, site]):
+    if not site:
         return jsonify({"error": "Missing username or site"}), 400
+    if username != current_session()['user']:
+        return jsonify({"message": "Cannot update another user's site"}), 403
 
     conn = get_db_connection()
     if conn is None:
@@ -403,6 +410,7 @@ def update_user_site():
         update_query = "UPDATE users SET sites = %s WHERE username = %s"
         cursor.execute(update_query, (site, username))
         conn.commit()
+        invalidate_user_site(username)
 
         if cursor.rowcount == 0:
             return jsonify({"message": "User not found or site already set"}), 404
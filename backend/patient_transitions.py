@@ -0,0 +1,148 @@
+from collections import Counter
+from datetime import datetime
+
+from data_versions import bump
+from site_counters import patient_status_changed
+
+# Batch patient status transitions, used for end-of-study closeout.
+# A batch is a list of {"patientId": "...", "date": "YYYY-MM-DD"} items. All
+# patients are locked and validated with one SELECT, and every valid item is
+# applied with one multi-row UPDATE in a single transaction. Each item gets
+# its own result, so one bad patient does not fail the rest of the batch.
+
+MAX_BATCH_SIZE = 1000
+
+
+def _check_screen_failure(patient):
+    if patient['status'] == 'Screen Failure':
+        return "Patient is already marked as screen failure."
+    if patient['status'] != 'Enrolled':
+        return f"Patient exists but has status '{patient['status']}'. Cannot record screen failure."
+    return None
+
+
+def _check_treatment_completion(patient):
+    if patient['status'] != 'Randomized' or patient['assigned_pack_id'] is None:
+        return "Patient is not in 'Randomized' status or has no assigned pack"
+    if patient['TRT_Completion_Date'] is not None:
+        return "Treatment already completed for this patient"
+    return None
+
+
+def _check_code_break(patient):
+    if patient['status'] == 'Code Broken' or patient['Code_break'] is not None:
+        return "Patient is already code broken"
+    if patient['TRT_Completion_Date'] is not None:
+        return "Treatment already completed for this patient"
+    return None
+
+
+# name -> (new status, column that records the date, validation)
+TRANSITIONS = {
+    'screen_failure': ('Screen Failure', 'screen_failure_date', _check_screen_failure),
+    'treatment_completion': ('Treatment Completed', 'TRT_Completion_Date', _check_treatment_completion),
+    'code_break': ('Code Broken', 'Code_break', _check_code_break),
+}
+
+_SELECT_PATIENTS = """
+    SELECT id, status, assigned_pack_id, TRT_Completion_Date, Code_break, sites
+    FROM patients
+    WHERE id IN ({placeholders}) {site_filter}
+    FOR UPDATE
+"""
+
+
+def _valid_date(value):
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def validate_items(items):
+    """Returns an error message if the request body is not a usable list of items, else None."""
+    if not isinstance(items, list) or not items:
+        return "items must be a non-empty list of { patientId, date }"
+    if len(items) > MAX_BATCH_SIZE:
+        return f"At most {MAX_BATCH_SIZE} items can be sent per request"
+    return None
+
+
+def apply_transition(conn, name, items, site=None):
+    """
+    Applies a named transition to a batch of items inside one transaction and
+    commits it. When site is given, patients of other sites are reported as
+    not found. Items without a patient id or with a date that is not
+    YYYY-MM-DD fail on their own. Returns the list of per-item results, in
+    request order.
+    """
+    new_status, date_column, check = TRANSITIONS[name]
+    results = [None] * len(items)
+    pending = {} # patient_id -> (index, date)
+
+    for index, item in enumerate(items):
+        patient_id = item.get('patientId') if isinstance(item, dict) else None
+        item_date = item.get('date') if isinstance(item, dict) else None
+        if not isinstance(patient_id, str) or not patient_id or not item_date:
+            results[index] = {"patient_id": patient_id, "success": False, "message": "Missing patient ID or date"}
+        elif not _valid_date(item_date):
+            results[index] = {"patient_id": patient_id, "success": False, "message": "Invalid date, expected YYYY-MM-DD"}
+        elif patient_id in pending:
+            results[index] = {"patient_id": patient_id, "success": False, "message": "Patient appears more than once in the batch"}
+        else:
+            pending[patient_id] = (index, item_date)
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        found = {}
+        if pending:
+            placeholders = ', '.join(['%s'] * len(pending))
+            params = list(pending)
+            site_filter = ''
+            if site is not None:
+                site_filter = 'AND sites = %s'
+                params.append(site)
+            cursor.execute(_SELECT_PATIENTS.format(placeholders=placeholders, site_filter=site_filter), tuple(params))
+            found = {row['id']: row for row in cursor.fetchall()}
+
+        accepted = []
+        for patient_id, (index, item_date) in pending.items():
+            patient = found.get(patient_id)
+            error = "Patient not found" if patient is None else check(patient)
+            if error:
+                results[index] = {"patient_id": patient_id, "success": False, "message": error}
+            else:
+                accepted.append((patient_id, item_date, patient))
+
+        if accepted:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(accepted))
+            placeholders = ', '.join(['%s'] * len(accepted))
+            params = [new_status] + [value for patient_id, item_date, _ in accepted for value in (patient_id, item_date)]
+            params += [patient_id for patient_id, _, _ in accepted]
+            cursor.execute(
+                f"UPDATE patients SET status = %s, {date_column} = CASE id {cases} END WHERE id IN ({placeholders})",
+                tuple(params)
+            )
+            moves = Counter((patient['sites'], patient['status']) for _, _, patient in accepted)
+            for (patient_site, old_status), count in sorted(moves.items()):
+                patient_status_changed(cursor, patient_site, old_status, new_status, count)
+            bump(cursor, 'patients', *sorted({patient_site for patient_site, _ in moves}))
+            for patient_id, _, _ in accepted:
+                results[pending[patient_id][0]] = {"patient_id": patient_id, "success": True, "new_status": new_status}
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return results
+
+
+def summarize(results):
+    """Response body for a batch: the per-item results plus success and failure counts."""
+    succeeded = sum(1 for result in results if result['success'])
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
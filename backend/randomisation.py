@@ -1,18 +1,36 @@
-import random
 from flask import Blueprint, request, jsonify
 import uuid # For generating unique patient IDs
+from collections import Counter
 from db import get_db_connection # Import from the new db.py file
+from site_resolver import get_user_site
+from pack_allocation import allocate_pack, assign_packs, lock_available_packs
+from randomization_schedule import consume_next_slot, lock_next_slots, record_slots, site_strata, DEFAULT_STRATUM
+from pagination import get_page_args
+from patient_repository import build_query, list_patients, row_key
+from streaming import get_stream_format, stream_query
+from data_versions import bump
+from site_counters import patient_status_changed, packs_available_changed
 
 patient_rd = Blueprint('randomisation',__name__)
 
+# Largest number of patients accepted by one /randomize_patients call
+MAX_RANDOMIZE_BATCH = 500
+
 @patient_rd.route('/patients/enrolled', methods=['GET'])
 def get_enrolled_patients():
     """
     Returns a list of patients with 'Enrolled' status who are not yet randomized.
     Optionally filtered by the 'sites' associated with the provided username.
     Username is expected as a query parameter: /patients/enrolled?username=<username>
+    Optional keyset pagination: &limit=<n>&after=<last patient id of the previous page>
+    Optional streaming: &stream=json or &stream=ndjson
     """
     username = request.args.get('username')
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = get_stream_format()
     conn = get_db_connection()
     if conn is None:
         return jsonify({"patients": []}), 500
@@ -22,22 +40,19 @@ def get_enrolled_patients():
 
     try:
         if username:
-            cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-            site_data = cursor.fetchone()
-            if site_data and site_data['sites']:
-                site = site_data['sites']
-            else:
+            site = get_user_site(username)
+            if not site:
                 print(f"Warning: User '{username}' not found or has no associated site for enrolled patients.")
                 return jsonify({"patients": []}), 200
 
-        if site:
-            query = "SELECT id, patient_name FROM patients WHERE status = 'Enrolled' AND assigned_pack_id IS NULL AND sites = %s"
-            cursor.execute(query, (site,))
-        else:
+        if not site:
             return jsonify({f"error" : "No data Found"}),200
 
-        enrolled_patients = cursor.fetchall()
-        return jsonify({"enrolled_patients": enrolled_patients})
+        if stream_format:
+            query, params = build_query('enrolled_unrandomized', site, page)
+            return stream_query(query, params, "enrolled_patients", stream_format, page, row_key('enrolled_unrandomized'))
+        enrolled_patients, page_fields = list_patients(conn, 'enrolled_unrandomized', site, page)
+        return jsonify({"enrolled_patients": enrolled_patients, **page_fields})
 
     except Exception as e:
         print(f"Error fetching enrolled patients: {e}")
@@ -74,69 +89,80 @@ def get_available_packs():
 def randomize_patient():
     """
     Randomizes an enrolled patient to an available pack.
-    Expects JSON: { "patientId": "..." }
+    Expects JSON: { "patientId": "...", "username": "...", "stratum": "..." }
+    stratum is optional. When the site has a randomization schedule, the stratum
+    must be one of its scheduled strata and the arm comes from its next slot; only
+    a site without any schedule falls back to any available pack.
+    The patient row, schedule slot and chosen pack are locked and updated in one transaction.
     """
     data = request.get_json()
     patient_id = data.get('patientId')
     username = data.get('username')
-    
+    stratum = data.get('stratum', DEFAULT_STRATUM)
 
     if not patient_id:
         return jsonify({"error": "Missing patient ID"}), 400
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    if username:
-        cursor.execute("SELECT sites FROM users WHERE username = %s", (username,))
-        site_data = cursor.fetchone()
-        if site_data and site_data[0]:
-            site = site_data[0]
-        else:
-            print(f"Warning: User '{username}' not found or has no associated site for enrolled patients.")
-            return jsonify({"patients": []}), 200
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+
+    site = get_user_site(username)
+    if not site:
+        print(f"Warning: User '{username}' not found or has no associated site for enrolled patients.")
+        return jsonify({"patients": []}), 200
 
+    conn = get_db_connection()
     if conn is None:
         return jsonify({"message": "Database connection failed"}), 500
 
+    cursor = conn.cursor()
     try:
-        # 1. Check if patient exists and is 'Enrolled' and not yet randomized
-        cursor.execute("SELECT status, assigned_pack_id FROM patients WHERE id = %s and sites =%s and status='Enrolled' ", (patient_id,site,))
+        # 1. Lock the patient row so the same patient cannot be randomized twice concurrently
+        cursor.execute(
+            "SELECT status, assigned_pack_id FROM patients WHERE id = %s and sites = %s FOR UPDATE",
+            (patient_id, site,)
+        )
         patient_data = cursor.fetchone()
 
         if not patient_data:
+            conn.rollback()
             return jsonify({"message": "Patient not found"}), 404
         if patient_data[0] != 'Enrolled': # patient_data[0] is status
+            conn.rollback()
             return jsonify({"message": "Patient is not in 'Enrolled' status and cannot be randomized"}), 400
         if patient_data[1] is not None: # patient_data[1] is assigned_pack_id
+            conn.rollback()
             return jsonify({"message": "Patient is already randomized"}), 400
 
-        # 2. Get available packs
-        cursor.execute("SELECT pack_number FROM packs WHERE status = 'A' and centre =%s",(site,))
-        available_packs = cursor.fetchall() # Returns list of tuples, e.g., [('PACK001',), ('PACK002',)]
+        # 2. Take the arm from the next slot of the site's precomputed schedule
+        strata = site_strata(cursor, site)
+        if strata and stratum not in strata:
+            conn.rollback()
+            return jsonify({"error": f"Unknown stratum '{stratum}' for site {site}"}), 400
+        arm = consume_next_slot(cursor, site, patient_id, stratum) if strata else None
+        if arm is None and strata:
+            conn.rollback()
+            return jsonify({"message": f"Randomization schedule for site {site} and stratum {stratum} is exhausted"}), 409
 
-        if not available_packs:
+        # 3. Lock one available pack of that arm at the site and mark it as allocated to the patient
+        allocated = allocate_pack(cursor, site, patient_id, arm)
+        if allocated is None:
+            conn.rollback()
+            if arm:
+                return jsonify({"message": "No available packs for the scheduled treatment arm"}), 400
             return jsonify({"message": "No available packs for randomization"}), 400
-        # Select a random pack
-        random_pack_tuple = random.choice(available_packs)
-        random_pack_id = random_pack_tuple[0] # Extract the string from the tuple
+        random_pack_id = allocated[0]
 
-        # 3. Update patient status to 'Randomized' and assign pack_id
+        # 4. Update patient status to 'Randomized' and assign pack_id
         update_patient_query = """
         UPDATE patients
         SET status = %s, assigned_pack_id = %s, treatment = %s
         WHERE id = %s
         """
-        # Assuming treatment type is based on pack_type, you might fetch pack_type here
-        # For simplicity, let's just set treatment to 'Assigned Pack' or similar
         cursor.execute(update_patient_query, ('Randomized', random_pack_id, 'Assigned Pack', patient_id))
-
-        # 4. Update pack status to 'Allocated'
-        update_pack_query = """
-        UPDATE packs
-        SET status = %s
-        WHERE pack_number= %s
-        """
-        cursor.execute(update_pack_query, ('Allocated', random_pack_id))
+        patient_status_changed(cursor, site, 'Enrolled', 'Randomized')
+        packs_available_changed(cursor, site, allocated[1], -1)
+        bump(cursor, 'patients', site)
+        bump(cursor, 'packs', site)
 
         conn.commit()
 
@@ -154,3 +180,137 @@ def randomize_patient():
     finally:
         cursor.close()
         conn.close()
+
+
+@patient_rd.route('/randomize_patients', methods=['POST'])
+def randomize_patients():
+    """
+    Randomizes several enrolled patients of the user's site in one transaction.
+    Expects JSON: { "patientIds": ["...", ...], "username": "...", "stratum": "..." }
+    Returns one result per patient: { "patient_id", "success", "assigned_pack_id" or "message" }.
+    Patients are processed in the order given. With a schedule, each patient takes the
+    next slot; if the arm of a slot has no pack left, that patient and the ones after it
+    are not randomized, so slots are never consumed out of order. A stratum the site's
+    schedule does not contain is rejected with 400.
+    """
+    data = request.get_json() or {}
+    patient_ids = data.get('patientIds')
+    username = data.get('username')
+    stratum = data.get('stratum', DEFAULT_STRATUM)
+
+    if not isinstance(patient_ids, list) or not patient_ids or not all(isinstance(p, str) and p for p in patient_ids):
+        return jsonify({"error": "patientIds must be a non-empty list of patient IDs"}), 400
+    if len(patient_ids) > MAX_RANDOMIZE_BATCH:
+        return jsonify({"error": f"At most {MAX_RANDOMIZE_BATCH} patients can be randomized per request"}), 400
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+
+    site = get_user_site(username)
+    if not site:
+        return jsonify({"error": f"User '{username}' not found or has no associated site."}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"message": "Database connection failed"}), 500
+
+    patient_ids = list(dict.fromkeys(patient_ids))
+    results = {}
+
+    def failed(patient_id, message):
+        results[patient_id] = {"patient_id": patient_id, "success": False, "message": message}
+
+    cursor = conn.cursor()
+    try:
+        # 1. Lock every patient row of the batch with one query
+        placeholders = ', '.join(['%s'] * len(patient_ids))
+        cursor.execute(
+            f"SELECT id, status, assigned_pack_id FROM patients WHERE sites = %s AND id IN ({placeholders}) FOR UPDATE",
+            (site, *patient_ids)
+        )
+        found = {row[0]: row for row in cursor.fetchall()}
+        eligible = []
+        for patient_id in patient_ids:
+            row = found.get(patient_id)
+            if row is None:
+                failed(patient_id, "Patient not found")
+            elif row[1] != 'Enrolled':
+                failed(patient_id, "Patient is not in 'Enrolled' status and cannot be randomized")
+            elif row[2] is not None:
+                failed(patient_id, "Patient is already randomized")
+            else:
+                eligible.append(patient_id)
+
+        # 2. Take the arms from the next slots of the site's schedule, if it has one
+        strata = site_strata(cursor, site)
+        if strata and stratum not in strata:
+            conn.rollback()
+            return jsonify({"error": f"Unknown stratum '{stratum}' for site {site}"}), 400
+        scheduled = bool(strata)
+        slots = lock_next_slots(cursor, site, len(eligible), stratum) if eligible and scheduled else []
+        plan = [] # (patient_id, slot, arm)
+        for index, patient_id in enumerate(eligible):
+            if not scheduled:
+                plan.append((patient_id, None, None))
+            elif index < len(slots):
+                plan.append((patient_id, *slots[index]))
+            else:
+                failed(patient_id, f"Randomization schedule for site {site} and stratum {stratum} is exhausted")
+
+        # 3. Lock enough available packs for every arm, one selection per arm
+        needed = Counter(arm for _, _, arm in plan)
+        packs = {arm: lock_available_packs(cursor, site, count, arm) for arm, count in sorted(needed.items(), key=lambda item: str(item[0]))}
+
+        # 4. Hand the packs out in patient order, stopping at the first patient whose arm has run out
+        assignments = [] # (patient_id, slot, pack_number, pack_type)
+        out_of_packs = False
+        for patient_id, slot, arm in plan:
+            if not out_of_packs and packs[arm]:
+                pack_number, pack_type = packs[arm].pop(0)
+                assignments.append((patient_id, slot, pack_number, pack_type))
+                continue
+            out_of_packs = True
+            failed(patient_id, "No available packs for the scheduled treatment arm" if arm else "No available packs for randomization")
+
+        # 5. Apply the batch: one UPDATE for the packs, one for the patients
+        if assignments:
+            assign_packs(cursor, [(pack_number, patient_id) for patient_id, _, pack_number, _ in assignments])
+            cases = ' '.join(['WHEN %s THEN %s'] * len(assignments))
+            placeholders = ', '.join(['%s'] * len(assignments))
+            params = [value for patient_id, _, pack_number, _ in assignments for value in (patient_id, pack_number)]
+            params += [patient_id for patient_id, _, _, _ in assignments]
+            cursor.execute(
+                f"UPDATE patients SET status = 'Randomized', treatment = 'Assigned Pack', assigned_pack_id = CASE id {cases} END "
+                f"WHERE id IN ({placeholders})",
+                tuple(params)
+            )
+            if scheduled:
+                record_slots(cursor, site, [(slot, patient_id) for patient_id, slot, _, _ in assignments], stratum)
+            patient_status_changed(cursor, site, 'Enrolled', 'Randomized', len(assignments))
+            for pack_type, count in sorted(Counter(pack_type for _, _, _, pack_type in assignments).items()):
+                packs_available_changed(cursor, site, pack_type, -count)
+            bump(cursor, 'patients', site)
+            bump(cursor, 'packs', site)
+            for patient_id, _, pack_number, _ in assignments:
+                results[patient_id] = {
+                    "patient_id": patient_id,
+                    "success": True,
+                    "assigned_pack_id": pack_number,
+                    "new_status": "Randomized"
+                }
+
+        conn.commit()
+
+        ordered = [results[patient_id] for patient_id in patient_ids]
+        return jsonify({
+            "results": ordered,
+            "randomized": len(assignments),
+            "failed": len(ordered) - len(assignments)
+        }), 200
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error during batch randomization: {e}")
+        return jsonify({"message": "Failed to randomize patients", "error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,252 @@
+import argparse
+import random
+import time
+from functools import lru_cache
+from math import factorial
+
+from db import get_db_connection
+
+# Treatment arms and their allocation ratio; arm names match packs.pack_type.
+DEFAULT_ARMS = {'PLACEBO': 1, '10_MG': 1}
+DEFAULT_BLOCK_SIZE = 4
+DEFAULT_STRATUM = 'ALL'
+
+# Rows are written in multi-row INSERT batches of this size
+INSERT_BATCH_SIZE = 5000
+
+# Blocks are drawn from the list of distinct block arrangements when it has
+# at most this many entries; larger blocks are permuted one at a time.
+MAX_BLOCK_ARRANGEMENTS = 5000
+
+# The next free slot for a site/stratum is the first row with no patient,
+# which idx_schedule_next (site, stratum, patient_id, slot) serves directly.
+_NEXT_SLOT = """
+    SELECT s.slot, a.pack_type
+    FROM randomization_schedule s
+    JOIN randomization_arms a ON a.arm_code = s.arm_code
+    WHERE s.site = %s AND s.stratum = %s AND s.patient_id IS NULL
+    ORDER BY s.slot
+    LIMIT {limit}
+    FOR UPDATE
+"""
+
+_RECORD_SLOT = "UPDATE randomization_schedule SET patient_id = %s, assigned_at = NOW() WHERE site = %s AND stratum = %s AND slot = %s"
+
+
+def build_block_template(arms, block_size):
+    """
+    Returns one block as a list of arm indices, e.g. [0, 0, 1, 1] for a 1:1
+    ratio with block size 4. block_size must be a multiple of the ratio sum.
+    """
+    ratio = list(arms.values())
+    unit = sum(ratio)
+    if block_size <= 0 or block_size % unit:
+        raise ValueError(f"Block size {block_size} must be a positive multiple of the ratio sum {unit}.")
+    repeat = block_size // unit
+    template = []
+    for index, weight in enumerate(ratio):
+        template.extend([index] * (weight * repeat))
+    return template
+
+
+def _arrangements(counts, length):
+    if not length:
+        yield ()
+        return
+    for arm, count in enumerate(counts):
+        if count:
+            counts[arm] -= 1
+            for rest in _arrangements(counts, length - 1):
+                yield (arm,) + rest
+            counts[arm] += 1
+
+
+@lru_cache(maxsize=None)
+def block_arrangements(template):
+    """
+    Returns every distinct ordering of a block template (a tuple of arm
+    indices), or None if there are more than MAX_BLOCK_ARRANGEMENTS. Drawing
+    one of these uniformly is the same as permuting the block.
+    """
+    counts = [template.count(arm) for arm in range(max(template) + 1)]
+    total = factorial(len(template))
+    for count in counts:
+        total //= factorial(count)
+    if total > MAX_BLOCK_ARRANGEMENTS:
+        return None
+    return list(_arrangements(counts, len(template)))
+
+
+def generate_sequence(template, slot_count, rng):
+    """Returns `slot_count` arm indices made of independently permuted blocks."""
+    block_size = len(template)
+    blocks = -(-slot_count // block_size)
+    arrangements = block_arrangements(tuple(template))
+    sequence = []
+    if arrangements is not None:
+        # All blocks of the stratum in one draw
+        for block in rng.choices(arrangements, k=blocks):
+            sequence.extend(block)
+    else:
+        sample = rng.sample
+        for _ in range(blocks):
+            sequence.extend(sample(template, block_size))
+    del sequence[slot_count:]
+    return sequence
+
+
+def _arm_codes(cursor, arm_names):
+    """Returns {pack_type: arm_code}, registering arms that are not known yet."""
+    cursor.executemany("INSERT IGNORE INTO randomization_arms (pack_type) VALUES (%s)", [(name,) for name in arm_names])
+    placeholders = ', '.join(['%s'] * len(arm_names))
+    cursor.execute(f"SELECT pack_type, arm_code FROM randomization_arms WHERE pack_type IN ({placeholders})", tuple(arm_names))
+    return dict(cursor.fetchall())
+
+
+def generate_schedules(conn, sites, strata=(DEFAULT_STRATUM,), slot_count=1000,
+                       arms=None, block_size=DEFAULT_BLOCK_SIZE, seed=None, progress=None):
+    """
+    Generates block-randomized schedules for every site/stratum pair and stores
+    them in randomization_schedule. Existing schedules are extended: new slots
+    are numbered after the last slot already stored. Returns the number of slots written.
+    A seed makes the generated lists reproducible for audit.
+    """
+    arms = arms or DEFAULT_ARMS
+    template = build_block_template(arms, block_size)
+    rng = random.Random(seed)
+
+    cursor = conn.cursor()
+    try:
+        codes = _arm_codes(cursor, list(arms))
+        code_for_index = [codes[name] for name in arms]
+
+        cursor.execute("SELECT site, stratum, MAX(slot) FROM randomization_schedule GROUP BY site, stratum")
+        last_slots = {(site, stratum): last for site, stratum, last in cursor.fetchall()}
+
+        insert_query = "INSERT INTO randomization_schedule (site, stratum, slot, arm_code) VALUES (%s, %s, %s, %s)"
+        batch = []
+        written = 0
+        for site in sites:
+            for stratum in strata:
+                first = (last_slots.get((site, stratum)) or 0) + 1
+                sequence = generate_sequence(template, slot_count, rng)
+                batch.extend(
+                    (site, stratum, slot, code_for_index[arm])
+                    for slot, arm in enumerate(sequence, start=first)
+                )
+                while len(batch) >= INSERT_BATCH_SIZE:
+                    cursor.executemany(insert_query, batch[:INSERT_BATCH_SIZE])
+                    del batch[:INSERT_BATCH_SIZE]
+                    written += INSERT_BATCH_SIZE
+                    if progress:
+                        progress(written)
+        if batch:
+            cursor.executemany(insert_query, batch)
+            written += len(batch)
+            if progress:
+                progress(written)
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def consume_next_slot(cursor, site, patient_id, stratum=DEFAULT_STRATUM):
+    """
+    Locks the next unused slot of the site/stratum schedule and records the
+    patient against it inside the caller's transaction. Returns the arm
+    (pack_type) of the slot, or None if there is no free slot.
+    """
+    slots = lock_next_slots(cursor, site, 1, stratum)
+    if not slots:
+        return None
+    slot, arm = slots[0]
+    cursor.execute(_RECORD_SLOT, (patient_id, site, stratum, slot))
+    return arm
+
+
+def lock_next_slots(cursor, site, count, stratum=DEFAULT_STRATUM):
+    """
+    Locks the next `count` unused slots of the site/stratum schedule, in slot
+    order, and returns them as (slot, arm) tuples. Fewer are returned if the
+    schedule runs out.
+    """
+    cursor.execute(_NEXT_SLOT.format(limit=int(count)), (site, stratum))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def record_slots(cursor, site, assignments, stratum=DEFAULT_STRATUM):
+    """
+    Records patients against slots locked by lock_next_slots with one UPDATE;
+    assignments is [(slot, patient_id)]. Returns the number of rows updated.
+    """
+    if not assignments:
+        return 0
+    cases = ' '.join(['WHEN %s THEN %s'] * len(assignments))
+    placeholders = ', '.join(['%s'] * len(assignments))
+    params = [value for pair in assignments for value in pair] + [site, stratum] + [slot for slot, _ in assignments]
+    cursor.execute(
+        f"UPDATE randomization_schedule SET patient_id = CASE slot {cases} END, assigned_at = NOW() "
+        f"WHERE site = %s AND stratum = %s AND slot IN ({placeholders})",
+        tuple(params)
+    )
+    return cursor.rowcount
+
+
+def site_strata(cursor, site):
+    """Returns the set of strata that have a schedule at the site (empty if the site has none)."""
+    cursor.execute("SELECT DISTINCT stratum FROM randomization_schedule WHERE site = %s", (site,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def has_schedule(cursor, site, stratum=DEFAULT_STRATUM):
+    """Returns True if any schedule has been generated for the site/stratum."""
+    cursor.execute("SELECT 1 FROM randomization_schedule WHERE site = %s AND stratum = %s LIMIT 1", (site, stratum))
+    return cursor.fetchone() is not None
+
+
+def _parse_arms(value):
+    arms = {}
+    for part in value.split(','):
+        name, _, weight = part.partition(':')
+        arms[name.strip()] = int(weight or 1)
+    return arms
+
+
+if __name__ == '__main__':
+    # Example: python randomization_schedule.py --all-sites --slots 10000 --block-size 4 --arms PLACEBO:1,10_MG:1 --seed 42
+    parser = argparse.ArgumentParser(description="Generate block-randomized schedules per site and stratum.")
+    parser.add_argument('--sites', help="Comma-separated site codes")
+    parser.add_argument('--all-sites', action='store_true', help="Generate for every site in the sites table except the Depot")
+    parser.add_argument('--strata', default=DEFAULT_STRATUM, help="Comma-separated strata (default: ALL)")
+    parser.add_argument('--slots', type=int, default=1000, help="Slots to generate per site and stratum")
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument('--arms', default=','.join(f"{k}:{v}" for k, v in DEFAULT_ARMS.items()), help="Arms with ratio, e.g. PLACEBO:1,10_MG:1")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("Database connection failed")
+
+    if args.all_sites:
+        site_cursor = conn.cursor()
+        site_cursor.execute("SELECT sites FROM sites WHERE sites != 'Depot'")
+        sites = [row[0] for row in site_cursor.fetchall()]
+        site_cursor.close()
+    elif args.sites:
+        sites = [site.strip() for site in args.sites.split(',') if site.strip()]
+    else:
+        parser.error("Provide --sites or --all-sites")
+
+    strata = [stratum.strip() for stratum in args.strata.split(',') if stratum.strip()]
+    started = time.monotonic()
+    written = generate_schedules(
+        conn, sites, strata, args.slots, _parse_arms(args.arms), args.block_size, args.seed,
+        progress=lambda n: print(f"{n} slots written", end='\r')
+    )
+    conn.close()
+    print(f"\nGenerated {written} slots for {len(sites)} sites x {len(strata)} strata in {time.monotonic() - started:.1f}s")
@@ -1,69 +1,95 @@
 from flask import Blueprint,jsonify,request
 from db import get_db_connection
+from pack_loader import load_packs, read_manifest, read_uploaded_manifest
+from data_versions import bump
+from session_tokens import require_session
+from secret_codes import CODE_ROLES, MAX_CODES_PER_REQUEST, provision_codes, save_codes
 
 secret_site = Blueprint('secret_site',__name__)
 
 @secret_site.route('/generate_and_save_codes', methods=['POST'])
+@require_session('Admin')
 def generate_and_save_codes():
+    """
+    Generates and/or saves registration secret codes in a single round trip.
+    Expects JSON, either
+      { "counts": { "Investigator": 10, "Monitor": 2, "Depot": 1 } } to generate codes on the server, or
+      { "codes": [ { "role": "...", "code": "..." }, ... ] } to save codes generated elsewhere.
+    Generated codes are returned in the response; colliding codes are reported.
+    A malformed item or unknown role in "codes" rejects the whole request with 400.
+    """
     data = request.get_json() # Get JSON data from the request body
 
-    if not data or 'codes' not in data:
-        return jsonify({'error': 'Invalid request: "codes" array missing.'}), 400
+    if not data or ('codes' not in data and 'counts' not in data):
+        return jsonify({'error': 'Invalid request: "counts" object or "codes" array missing.'}), 400
 
-    codes_to_save = data['codes']
-    if not isinstance(codes_to_save, list):
-        return jsonify({'error': 'Invalid request: "codes" must be an array.'}), 400
+    if 'counts' in data:
+        counts = data['counts']
+        if not isinstance(counts, dict):
+            return jsonify({'error': 'Invalid request: "counts" must be an object of role: count.'}), 400
+        invalid_roles = [role for role in counts if role not in CODE_ROLES]
+        if invalid_roles:
+            return jsonify({'error': f'Invalid roles: {", ".join(invalid_roles)}. Allowed roles are {", ".join(CODE_ROLES)}.'}), 400
+        try:
+            counts = {role: int(count) for role, count in counts.items() if int(count) > 0}
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid request: counts must be integers.'}), 400
+        if not counts:
+            return jsonify({'error': 'Please request at least one code.'}), 400
+        if sum(counts.values()) > MAX_CODES_PER_REQUEST:
+            return jsonify({'error': f'At most {MAX_CODES_PER_REQUEST} codes can be generated per request.'}), 400
+    else:
+        codes_to_save = data['codes']
+        if not isinstance(codes_to_save, list):
+            return jsonify({'error': 'Invalid request: "codes" must be an array.'}), 400
+        if len(codes_to_save) > MAX_CODES_PER_REQUEST:
+            return jsonify({'error': f'At most {MAX_CODES_PER_REQUEST} codes can be saved per request.'}), 400
+        items = []
+        for index, item in enumerate(codes_to_save):
+            role = item.get('role') if isinstance(item, dict) else None
+            secret_code = item.get('code') if isinstance(item, dict) else None
+            if not isinstance(role, str) or not role or not isinstance(secret_code, str) or not secret_code:
+                return jsonify({'error': f"Invalid item at index {index}: both 'role' and 'code' are required."}), 400
+            if role not in CODE_ROLES:
+                return jsonify({'error': f"Invalid role '{role}' at index {index}. Allowed roles are {', '.join(CODE_ROLES)}."}), 400
+            items.append((role, secret_code))
 
     conn = get_db_connection()
     if not conn:
         return jsonify({'error': 'Database connection failed.'}), 500
 
-    cursor = conn.cursor()
-    saved_count = 0
-    errors = []
-    for item in codes_to_save:
-        role = item.get('role')
-        secret_code = item.get('code')
-
-        if not role or not secret_code:
-            errors.append(f"Skipping invalid item: {item}. Both 'role' and 'code' are required.")
-            continue
-
-        try:
-            # Insert the role and secret code into the database
-            cursor.execute(
-                "INSERT INTO user_secret_code (role, secret_code) VALUES (%s, %s)",
-                (role, secret_code)
-            )
-            saved_count += 1
-        except Exception as err:
-            # Handle duplicate entry error (secret_code is UNIQUE)
-            if err.errno == 1062: # MySQL error code for duplicate entry
-                errors.append(f"Duplicate code '{secret_code}' for role '{role}'. Skipping.")
-            else:
-                errors.append(f"Error saving code '{secret_code}' for role '{role}': {err}")
-            print(f"Database error: {err}") # Log the error for debugging
-
     try:
-        conn.commit() # Commit all changes to the database
+        if 'counts' in data:
+            saved, collisions = provision_codes(conn, counts)
+            response = {
+                'message': f'Successfully saved {len(saved)} codes.',
+                'codes': [{'role': role, 'code': code} for role, code in saved]
+            }
+            if collisions:
+                response['collisions'] = collisions
+                response['details'] = [f"Code '{code}' already existed and was replaced." for code in collisions]
+            return jsonify(response), 200
+
+        saved_count, collisions = save_codes(conn, items)
+        errors = [f"Duplicate code '{code}'. Skipping." for code in collisions]
     except Exception as err:
-        conn.rollback() # Rollback in case of a commit error
-        print(f"Error during commit: {err}")
-        return jsonify({'error': f'Failed to commit changes to database: {err}', 'saved_count': saved_count, 'details': errors}), 500
+        print(f"Error saving secret codes: {err}")
+        return jsonify({'error': f'Failed to commit changes to database: {err}'}), 500
     finally:
-        cursor.close()
         conn.close()
 
     if errors:
         return jsonify({
             'message': f'Successfully saved {saved_count} codes. Some errors occurred:',
-            'details': errors
+            'details': errors,
+            'collisions': collisions
         }), 200
     else:
         return jsonify({'message': f'Successfully saved {saved_count} codes.'}), 200
 
 # NEW: REST API endpoint to save site details
 @secret_site.route('/save_site_details', methods=['POST'])
+@require_session('Admin')
 def save_site_details():
     data = request.get_json()
 
@@ -87,6 +113,7 @@ def save_site_details():
             "INSERT INTO sites (sites, site_name, site_activation, site_act_date) VALUES (%s, %s, %s, %s)",
             (site_code, site_name, activation_status, activation_date)
         )
+        bump(cursor, 'sites')
         conn.commit()
         return jsonify({'message': 'Site details saved successfully!'}), 201 # 201 Created
     except Exception as err:
@@ -98,4 +125,34 @@ def save_site_details():
             return jsonify({'error': f'Failed to save site details: {err}'}), 500
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+@secret_site.route('/admin/load_packs', methods=['POST'])
+@require_session('Admin')
+def load_pack_manifest():
+    """
+    Bulk-loads a kit manifest into the packs table.
+    Accepts a multipart upload in the 'manifest' field (CSV or JSON file), or
+    JSON: { "packs": [ { "pack_number": "...", "pack_type": "...", "depot": "...", "lot": "..." }, ... ] }
+    Returns counts of loaded, invalid and duplicate kits.
+    """
+    if 'manifest' in request.files:
+        records = read_uploaded_manifest(request.files['manifest'])
+    else:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('packs'), list):
+            return jsonify({'error': 'Invalid request: upload a "manifest" file or send a "packs" array.'}), 400
+        records = read_manifest(data['packs'])
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed.'}), 500
+
+    try:
+        summary = load_packs(conn, records)
+        return jsonify({'message': f"Loaded {summary['inserted']} packs.", **summary}), 200
+    except Exception as err:
+        print(f"Error loading pack manifest: {err}")
+        return jsonify({'error': f'Failed to load pack manifest: {err}'}), 500
+    finally:
+        conn.close()
@@ -0,0 +1,123 @@
+import secrets
+import string
+import uuid
+
+# Server-side registration secret codes.
+# Codes are drawn from the OS CSPRNG, de-duplicated in memory, and written
+# with one multi-row INSERT IGNORE. user_secret_code.secret_code is UNIQUE,
+# so a code that already exists is skipped by MySQL; every row carries the
+# batch id of the request that wrote it, which is how codes that collided
+# with an earlier batch are told apart from the ones this batch stored.
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 12
+CODE_ROLES = ('Investigator', 'Monitor', 'Depot')
+MAX_CODES_PER_REQUEST = 10000
+
+# Server-generated codes that collide are replaced and retried this many times
+MAX_REGENERATION_ROUNDS = 3
+
+
+def generate_code():
+    return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+
+def generate_codes(counts, exclude=()):
+    """
+    Generates codes for {role: count}. Returns a list of (role, code) pairs
+    with no code repeated within the list or present in `exclude`.
+    """
+    used = set(exclude)
+    generated = []
+    for role, count in counts.items():
+        for _ in range(count):
+            code = generate_code()
+            while code in used:
+                code = generate_code()
+            used.add(code)
+            generated.append((role, code))
+    return generated
+
+
+def insert_codes(cursor, items, batch_id):
+    """
+    Persists (role, code) pairs with a single multi-row INSERT IGNORE and
+    returns the codes that were not stored because they already existed.
+    """
+    if not items:
+        return []
+    values = ', '.join(['(%s, %s, %s, NOW())'] * len(items))
+    params = []
+    for role, code in items:
+        params.extend((role, code, batch_id))
+    cursor.execute(f"INSERT IGNORE INTO user_secret_code (role, secret_code, batch_id, created_at) VALUES {values}", params)
+    if cursor.rowcount == len(items):
+        return []
+
+    # Only reached when something collided: find which codes belong to another batch
+    placeholders = ', '.join(['%s'] * len(items))
+    cursor.execute(
+        f"SELECT secret_code FROM user_secret_code WHERE secret_code IN ({placeholders}) AND (batch_id IS NULL OR batch_id <> %s)",
+        [code for _, code in items] + [batch_id]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def provision_codes(conn, counts):
+    """
+    Generates and stores codes for {role: count}. Colliding codes are replaced
+    with fresh ones, so the requested number is stored for every role.
+    Returns (saved (role, code) pairs, codes that collided and were replaced).
+    """
+    batch_id = str(uuid.uuid4())
+    pending = generate_codes(counts)
+    saved = []
+    collisions = []
+    cursor = conn.cursor()
+    try:
+        for _ in range(MAX_REGENERATION_ROUNDS):
+            collided = set(insert_codes(cursor, pending, batch_id))
+            saved.extend(item for item in pending if item[1] not in collided)
+            if not collided:
+                break
+            collisions.extend(collided)
+            retry_counts = {}
+            for role, code in pending:
+                if code in collided:
+                    retry_counts[role] = retry_counts.get(role, 0) + 1
+            pending = generate_codes(retry_counts, exclude=[code for _, code in saved] + collisions)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return saved, collisions
+
+
+def save_codes(conn, items):
+    """
+    Stores client-supplied (role, code) pairs in one round trip.
+    Returns (number saved, codes that were duplicates within the request or already existed).
+    """
+    batch_id = str(uuid.uuid4())
+    unique = []
+    seen = set()
+    duplicates = []
+    for role, code in items:
+        if code in seen:
+            duplicates.append(code)
+            continue
+        seen.add(code)
+        unique.append((role, code))
+
+    cursor = conn.cursor()
+    try:
+        collided = insert_codes(cursor, unique, batch_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(unique) - len(collided), duplicates + collided
@@ -0,0 +1,183 @@
+import os
+import threading
+
+from db import open_connection
+
+# Number of values each worker reserves from the sequences table per round trip.
+# Values left in a block when a worker exits are skipped, so ids may have gaps.
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('RTSM_SEQUENCE_BLOCK_SIZE', 20))
+
+# Consignment id format per depot. Numbers are zero-padded to `width` so ids
+# of one format sort correctly as strings; `preallocate` is how many ids a
+# worker reserves per round trip. Only depots listed here may ship kits (see
+# is_depot). DEFAULT_CONSIGNMENT_FORMAT, with the depot code substituted into
+# the prefix, is the template for adding one.
+# Legacy ids (CON-BYL001, CON-BYL002, ...) have fewer digits and sort after
+# the six-digit ids as plain strings (CON-BYL000001 < CON-BYL005), so lists
+# order by (CHAR_LENGTH(consignment_id), consignment_id), which is numeric
+# order for every id of a prefix, old and new.
+CONSIGNMENT_ID_FORMATS = {
+    'Depot': {'prefix': 'CON-BYL', 'width': 6, 'preallocate': 50},
+}
+DEFAULT_CONSIGNMENT_FORMAT = {'prefix': 'CON-{depot}-', 'width': 6, 'preallocate': 50}
+
+# The sequences table stores, per sequence name, the last value handed out.
+# Reserving a block is a single atomic upsert; LAST_INSERT_ID(expr) makes the
+# new high-water mark readable on the same connection without another lock.
+_RESERVE_BLOCK = """
+    INSERT INTO sequences (name, last_value) VALUES (%s, LAST_INSERT_ID(%s))
+    ON DUPLICATE KEY UPDATE last_value = LAST_INSERT_ID(last_value + %s)
+"""
+
+
+class SequenceAllocator:
+    """
+    Hands out increasing integers for named sequences.
+    Blocks of values are reserved from the database and served from memory,
+    so most allocations need no database round trip at all.
+    """
+
+    def __init__(self, block_size=SEQUENCE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+        # Serialises use of the dedicated connection; _lock may be taken inside it, never the reverse
+        self._io_lock = threading.Lock()
+        self._conn = None
+        self._reservations = 0
+        self._allocations = 0
+
+    def _connection(self):
+        if self._conn is None or not self._conn.is_connected():
+            self._conn = open_connection()
+        return self._conn
+
+    def _reserve(self, name, size):
+        """Reserves the next `size` values of a sequence; returns (first, last)."""
+        with self._io_lock:
+            return self._reserve_locked(name, size)
+
+    def _reserve_locked(self, name, size):
+        # Reservations use a dedicated connection outside the pool: the calling
+        # request already holds a pooled connection, so a second checkout could
+        # wait out the checkout timeout under full load. Committing on its own
+        # connection also keeps the reservation even if the request rolls back.
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_RESERVE_BLOCK, (name, size, size))
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            last = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            # The connection is reopened on the next reservation
+            self._conn = None
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise
+        finally:
+            cursor.close()
+        with self._lock:
+            self._reservations += 1
+        return last - size + 1, last
+
+    def _take(self, name):
+        """Takes the next value from the in-memory block, or None if it is used up."""
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] > block[1]:
+                return None
+            value = block[0]
+            block[0] += 1
+            self._allocations += 1
+            return value
+
+    def next_value(self, name, block_size=None):
+        """Returns the next value of the named sequence."""
+        value = self._take(name)
+        if value is not None:
+            return value
+        # Blocks are refilled under _io_lock only, so _lock is never held
+        # during database I/O and threads served from memory never wait on it
+        with self._io_lock:
+            # Another thread may have refilled the block while this one waited
+            value = self._take(name)
+            if value is not None:
+                return value
+            first, last = self._reserve_locked(name, block_size or self.block_size)
+            with self._lock:
+                self._blocks[name] = [first + 1, last]
+                self._allocations += 1
+            return first
+
+    def next_values(self, name, count):
+        """Returns `count` consecutive values of the named sequence in one reservation."""
+        if count <= 0:
+            return []
+        first, last = self._reserve(name, count)
+        with self._lock:
+            self._allocations += count
+        return list(range(first, last + 1))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'block_size': self.block_size,
+                'allocations': self._allocations,
+                'reservations': self._reservations,
+                'sequences': {name: {'next': b[0], 'reserved_until': b[1]} for name, b in self._blocks.items()},
+            }
+
+
+allocator = SequenceAllocator()
+
+
+def _reset_after_fork():
+    # Blocks reserved by the parent process would be handed out twice, and
+    # its dedicated connection's socket belongs to the parent
+    allocator._blocks.clear()
+    allocator._lock = threading.Lock()
+    allocator._io_lock = threading.Lock()
+    allocator._conn = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def next_patient_id():
+    """Returns the next global patient id (PAT001, PAT002, ... PAT1000, ...)."""
+    return f"PAT{allocator.next_value('patient_id'):03d}"
+
+
+def next_patient_name(site):
+    """Returns the next per-site patient name (e.g. SITE5001, SITE5002, ...)."""
+    return f"{site}{allocator.next_value('patient_name:' + site):03d}"
+
+
+def is_depot(depot):
+    """True when kits may be shipped from this centre."""
+    return depot in CONSIGNMENT_ID_FORMATS
+
+
+def _consignment_format(depot):
+    fmt = CONSIGNMENT_ID_FORMATS.get(depot, DEFAULT_CONSIGNMENT_FORMAT)
+    return fmt['prefix'].format(depot=depot), fmt['width'], fmt['preallocate']
+
+
+def next_consignment_id(depot='Depot'):
+    """Returns the next consignment id for a depot (e.g. CON-BYL000001)."""
+    prefix, width, preallocate = _consignment_format(depot)
+    value = allocator.next_value('consignment:' + prefix, block_size=preallocate)
+    return f"{prefix}{value:0{width}d}"
+
+
+def reserve_consignment_ids(depot, count):
+    """Reserves `count` consignment ids for a depot with a single round trip."""
+    prefix, width, _ = _consignment_format(depot)
+    return [f"{prefix}{value:0{width}d}" for value in allocator.next_values('consignment:' + prefix, count)]
+
+
+def sequence_stats():
+    return allocator.stats()
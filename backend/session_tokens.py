@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import wraps
+
+from flask import g, has_request_context, jsonify, request
+
+# Stateless signed session tokens.
+# /login issues a token carrying the user, role, site and expiry, signed with
+# HMAC-SHA256. Clients send it back as `Authorization: Bearer <token>` and it
+# is verified with one hash and a constant-time compare, without touching the
+# users table. While a request carries a valid token, site_resolver answers
+# from the token and only for the user it was issued to, so a request can no
+# longer act as another user by changing the username parameter.
+#
+# secret: RTSM_TOKEN_SECRET must be set, and be the same on every worker and
+#   host. The app refuses to start without it.
+# ttl: seconds a token stays valid (default 8 hours, one shift).
+# required: every endpoint except the public ones rejects requests without a
+#   token. RTSM_REQUIRE_TOKEN=0 restores the username-based lookup for
+#   requests without a token, for older clients during a rollout only.
+#   Routes wrapped in require_session() need a token either way.
+TOKEN_CONFIG = {
+    'secret': os.environ.get('RTSM_TOKEN_SECRET', ''),
+    'ttl': int(os.environ.get('RTSM_TOKEN_TTL', 8 * 3600)),
+    'required': os.environ.get('RTSM_REQUIRE_TOKEN', '1') != '0',
+}
+
+if not TOKEN_CONFIG['secret']:
+    raise RuntimeError("RTSM_TOKEN_SECRET is not set; refusing to start without a session token secret.")
+
+_KEY = TOKEN_CONFIG['secret'].encode('utf-8')
+
+# Endpoints reachable without a token even when tokens are required
+PUBLIC_ENDPOINTS = {'home', 'metrics', 'static', 'auth.login_user', 'auth.register_user', 'auth.get_sites', 'depot.get_sites'}
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _encode(hmac.new(_KEY, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue_token(username, role, site, ttl=None):
+    """Returns (token, expiry as a unix timestamp) for the user."""
+    expires_at = int(time.time()) + (ttl or TOKEN_CONFIG['ttl'])
+    claims = {'u': username, 'r': role, 's': site, 'exp': expires_at}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{_sign(payload)}", expires_at
+
+
+def verify_token(token):
+    """
+    Returns the token's claims as {"user", "role", "site", "exp"}, or None if
+    the token is malformed, its signature does not match or it has expired.
+    """
+    if not token or token.count('.') != 1:
+        return None
+    payload, signature = token.split('.')
+    try:
+        if not hmac.compare_digest(_sign(payload), signature):
+            return None
+        claims = json.loads(_decode(payload))
+    except (ValueError, TypeError):
+        # Undecodable payloads and non-ASCII signatures
+        return None
+    if not isinstance(claims, dict) or not isinstance(claims.get('exp'), int) or claims['exp'] <= time.time():
+        return None
+    return {'user': claims.get('u'), 'role': claims.get('r'), 'site': claims.get('s'), 'exp': claims['exp']}
+
+
+def bearer_token(authorization):
+    """Extracts the token from an Authorization header value, or None."""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
+
+
+def current_session():
+    """The verified claims of the current request, or None outside a request or without a token."""
+    if not has_request_context():
+        return None
+    return g.get('session')
+
+
+def load_session():
+    """before_request hook: verifies the bearer token and stores its claims on g."""
+    g.session = None
+    if request.method == 'OPTIONS':
+        # CORS preflights never carry credentials
+        return None
+
+    token = bearer_token(request.headers.get('Authorization'))
+    if token is not None:
+        g.session = verify_token(token)
+        if g.session is None:
+            return jsonify({"message": "Invalid or expired session token"}), 401
+    elif TOKEN_CONFIG['required'] and request.endpoint not in PUBLIC_ENDPOINTS:
+        return jsonify({"message": "Authentication required"}), 401
+    return None
+
+
+def require_session(*roles):
+    """
+    Route decorator: rejects requests without a valid token (401) and, when
+    roles are given, tokens whose role is not one of them (403).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            session = current_session()
+            if session is None:
+                return jsonify({"message": "Authentication required"}), 401
+            if roles and session['role'] not in roles:
+                return jsonify({"message": "Not permitted for this role"}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Verifies the session token before every request."""
+    app.before_request(load_session)
@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from consignment_state import ARRIVAL_PACK_STATUS, ARRIVAL_STATES, PENDING_STATES
+from data_versions import bump
+from site_counters import packs_available_changed
+
+# Shipment receipt at a site.
+# A shipment is identified by its consignment id; receiving it records a
+# shipments row, moves the consignment out of its pending state and gives
+# every kit listed in consignment_items the matching pack status. A batch of
+# shipments is resolved with one joined query and applied with one INSERT,
+# one consignment UPDATE and one pack UPDATE, whatever its size.
+
+MAX_RECEIPT_BATCH = 500
+
+_RESOLVE = """
+    SELECT c.consignment_id, c.center_id, c.status, s.shipment_id
+    FROM consignments c
+    LEFT JOIN shipments s ON s.shipment_id = c.consignment_id
+    WHERE c.consignment_id IN ({placeholders})
+    FOR UPDATE
+"""
+
+_AVAILABLE_BY_TYPE = """
+    SELECT i.consignment_id, p.pack_type, COUNT(*)
+    FROM consignment_items i
+    JOIN packs p ON p.pack_number = i.pack_id
+    WHERE i.consignment_id IN ({placeholders})
+    GROUP BY i.consignment_id, p.pack_type
+"""
+
+
+def _case(column, pairs):
+    """Returns (CASE sql, params) mapping column values to new values."""
+    return f"CASE {column} " + ' '.join(['WHEN %s THEN %s'] * len(pairs)) + " END", [v for pair in pairs for v in pair]
+
+
+def receive_shipments(conn, shipments, username=None, site=None):
+    """
+    Records a batch of arrivals in one transaction and commits it.
+    shipments is a list of { "shipmentId", "status", "arrivalDate", "notes" }.
+    When site is given, shipments addressed to another site are 'Invalid'.
+    Returns one result per shipment, in order, with status 'Received',
+    'Duplicate' (already received) or 'Invalid'.
+    """
+    results = [None] * len(shipments)
+    pending = {} # shipment_id -> (index, item)
+    for index, item in enumerate(shipments):
+        shipment_id = item.get('shipmentId') if isinstance(item, dict) else None
+        if not isinstance(shipment_id, str) or not shipment_id or not item.get('arrivalDate'):
+            results[index] = {"shipment_id": shipment_id, "status": "Invalid", "message": "Missing shipment ID or arrival date"}
+        elif item.get('status') not in ARRIVAL_STATES:
+            results[index] = {"shipment_id": shipment_id, "status": "Invalid",
+                              "message": "Invalid shipment status. Must be 'Arrived', 'Damaged', or 'Quarantined'"}
+        elif shipment_id in pending:
+            results[index] = {"shipment_id": shipment_id, "status": "Duplicate", "message": "Shipment appears more than once in the batch"}
+        else:
+            pending[shipment_id] = (index, item)
+
+    cursor = conn.cursor()
+    try:
+        # 1. Resolve consignments and earlier receipts with one joined query
+        found = {}
+        if pending:
+            placeholders = ', '.join(['%s'] * len(pending))
+            cursor.execute(_RESOLVE.format(placeholders=placeholders), tuple(pending))
+            found = {row[0]: row for row in cursor.fetchall()}
+
+        accepted = [] # (shipment_id, item, center_id)
+        for shipment_id, (index, item) in pending.items():
+            row = found.get(shipment_id)
+            if row is None:
+                results[index] = {"shipment_id": shipment_id, "status": "Invalid", "message": "Invalid Shipment Id"}
+            elif site is not None and row[1] != site:
+                results[index] = {"shipment_id": shipment_id, "status": "Invalid", "message": "Shipment is not addressed to your site"}
+            elif row[3] is not None or row[2] not in PENDING_STATES:
+                results[index] = {"shipment_id": shipment_id, "status": "Duplicate", "message": "Shipment has already been received"}
+            else:
+                accepted.append((shipment_id, item, row[1]))
+
+        if accepted:
+            ids = [shipment_id for shipment_id, _, _ in accepted]
+            placeholders = ', '.join(['%s'] * len(ids))
+
+            # 2. Shipment records
+            cursor.executemany(
+                "INSERT INTO shipments (shipment_id, status, arrival_date, notes, received_by_user_id) VALUES (%s, %s, %s, %s, %s)",
+                [(shipment_id, item['status'], item['arrivalDate'], item.get('notes', ''), username) for shipment_id, item, _ in accepted]
+            )
+
+            # 3. Consignment states, guarded so a concurrent receipt cannot apply twice
+            case_sql, case_params = _case('consignment_id', [(shipment_id, ARRIVAL_STATES[item['status']]) for shipment_id, item, _ in accepted])
+            state_placeholders = ', '.join(['%s'] * len(PENDING_STATES))
+            cursor.execute(
+                f"UPDATE consignments SET status = {case_sql} WHERE consignment_id IN ({placeholders}) AND status IN ({state_placeholders})",
+                (*case_params, *ids, *PENDING_STATES)
+            )
+
+            # 4. Every kit of every shipment in one UPDATE
+            case_sql, case_params = _case('i.consignment_id', [(shipment_id, ARRIVAL_PACK_STATUS[item['status']]) for shipment_id, item, _ in accepted])
+            cursor.execute(
+                f"UPDATE packs p JOIN consignment_items i ON i.pack_id = p.pack_number SET p.status = {case_sql} "
+                f"WHERE i.consignment_id IN ({placeholders})",
+                (*case_params, *ids)
+            )
+
+            # 5. Kits that arrived in good condition are now available at the site
+            centers = {shipment_id: center_id for shipment_id, _, center_id in accepted}
+            arrived = [shipment_id for shipment_id, item, _ in accepted if item['status'] == 'Arrived']
+            if arrived:
+                cursor.execute(_AVAILABLE_BY_TYPE.format(placeholders=', '.join(['%s'] * len(arrived))), tuple(arrived))
+                available = defaultdict(int)
+                for shipment_id, pack_type, count in cursor.fetchall():
+                    available[(centers[shipment_id], pack_type)] += count
+                for (center_id, pack_type), count in sorted(available.items()):
+                    packs_available_changed(cursor, center_id, pack_type, count)
+            sites = sorted({center_id for center_id in centers.values() if center_id})
+            bump(cursor, 'consignments', *sites)
+            bump(cursor, 'packs', *sites)
+
+            for shipment_id, item, _ in accepted:
+                results[pending[shipment_id][0]] = {"shipment_id": shipment_id, "status": "Received", "arrival_status": item['status']}
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return results
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from collections import Counter
+
+from db import get_pooled_connection
+
+# Running per-site counts for dashboards and monitoring.
+# site_counters holds one row per (site, counter):
+#   patients:<status>           patients at the site in that status
+#   packs_available:<pack_type> packs at the site (or depot) with status 'A'
+# Every route that changes a patient's status or a pack's availability
+# adjusts the matching counters in the same transaction, so reading a site's
+# counts touches only that site's handful of rows. reconcile() recomputes the
+# counts from patients and packs and repairs any drift (manual SQL edits,
+# changes made before the table existed).
+
+PATIENT_COUNTER = 'patients:'
+PACK_COUNTER = 'packs_available:'
+
+# Seconds between in-process reconciliations; 0 disables the background thread
+# (run `python site_counters.py` from cron instead).
+RECONCILE_INTERVAL = int(os.environ.get('RTSM_COUNTER_RECONCILE_INTERVAL', 0))
+
+_ADJUST = """
+    INSERT INTO site_counters (site, counter, value) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+"""
+
+# Every site or depot that has counters, patients or packs
+_COUNTED_SITES = """
+    SELECT site FROM site_counters
+    UNION SELECT sites FROM patients WHERE sites IS NOT NULL
+    UNION SELECT centre FROM packs WHERE centre IS NOT NULL
+"""
+
+# Both are answered from the (site, status ...) indexes of patients and packs
+_PATIENT_STATUS_COUNTS = "SELECT status, COUNT(*) FROM patients WHERE sites = %s GROUP BY status"
+
+_AVAILABLE_PACK_COUNTS = """
+    SELECT pack_type, COUNT(*)
+    FROM packs
+    WHERE centre = %s AND status = 'A'
+    GROUP BY pack_type
+"""
+
+_stats_lock = threading.Lock()
+_stats = {'reconciliations': 0, 'last_reconciled_at': None, 'last_drift': 0, 'total_drift': 0}
+
+
+def adjust(cursor, site, counter, delta):
+    """Adds delta to one counter inside the caller's transaction."""
+    if site and delta:
+        cursor.execute(_ADJUST, (site, counter, delta))
+
+
+def patient_status_changed(cursor, site, old_status, new_status, count=1):
+    """Moves `count` patients at the site from old_status (None for a new patient) to new_status."""
+    if old_status == new_status:
+        return
+    changes = []
+    if old_status is not None:
+        changes.append((PATIENT_COUNTER + old_status, -count))
+    if new_status is not None:
+        changes.append((PATIENT_COUNTER + new_status, count))
+    # Always lock counter rows in the same order so concurrent transitions cannot deadlock
+    for counter, delta in sorted(changes):
+        adjust(cursor, site, counter, delta)
+
+
+def packs_available_changed(cursor, site, pack_type, delta):
+    """Adds delta to the number of available packs of a type at a site or depot."""
+    adjust(cursor, site, PACK_COUNTER + str(pack_type), delta)
+
+
+def read_counts_query(site):
+    """Returns (sql, params) reading a site's counters as (counter, value) rows."""
+    return "SELECT counter, value FROM site_counters WHERE site = %s AND value != 0", (site,)
+
+
+def split_counts(rows):
+    """(counter, value) rows -> ({status: patients}, {pack_type: available packs})."""
+    patients, packs = {}, {}
+    for counter, value in rows:
+        if counter.startswith(PATIENT_COUNTER):
+            patients[counter[len(PATIENT_COUNTER):]] = value
+        elif counter.startswith(PACK_COUNTER):
+            packs[counter[len(PACK_COUNTER):]] = value
+    return patients, packs
+
+
+def read_counts(cursor, site):
+    """Returns ({status: patients}, {pack_type: available packs}) for the site."""
+    cursor.execute(*read_counts_query(site))
+    return split_counts(cursor.fetchall())
+
+
+def _actual_counts(cursor, site):
+    actual = Counter()
+    cursor.execute(_PATIENT_STATUS_COUNTS, (site,))
+    for status, count in cursor.fetchall():
+        if status is not None:
+            actual[PATIENT_COUNTER + str(status)] = count
+    cursor.execute(_AVAILABLE_PACK_COUNTS, (site,))
+    for pack_type, count in cursor.fetchall():
+        if pack_type is not None:
+            actual[PACK_COUNTER + str(pack_type)] = count
+    return actual
+
+
+def reconcile_site(cursor, site):
+    """
+    Recomputes one site's counters from its patients and packs and corrects
+    the ones that drifted, inside the caller's transaction.
+    Returns a list of {site, counter, stored, actual}.
+    """
+    cursor.execute("SELECT counter, value FROM site_counters WHERE site = %s FOR UPDATE", (site,))
+    stored = dict(cursor.fetchall())
+    actual = _actual_counts(cursor, site)
+
+    drift = []
+    for counter in sorted(set(stored) | set(actual)):
+        if stored.get(counter, 0) != actual.get(counter, 0):
+            drift.append({"site": site, "counter": counter, "stored": stored.get(counter, 0), "actual": actual.get(counter, 0)})
+    if drift:
+        cursor.executemany(
+            "INSERT INTO site_counters (site, counter, value) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE value = VALUES(value)",
+            [(site, item['counter'], item['actual']) for item in drift]
+        )
+    cursor.execute("DELETE FROM site_counters WHERE site = %s AND value = 0", (site,))
+    return drift
+
+
+def reconcile(conn):
+    """
+    Recomputes every counter from patients and packs and corrects the ones
+    that drifted. Returns a list of {site, counter, stored, actual}.
+
+    Each site is reconciled in its own short transaction. Its counter rows
+    are locked before counting, so routes at that site that are mid-way
+    through a change wait for the reconciliation and then apply their delta
+    on top of the recomputed value; their uncommitted changes are not in the
+    count. Other sites are not blocked meanwhile.
+    """
+    cursor = conn.cursor()
+    drift = []
+    try:
+        cursor.execute(_COUNTED_SITES)
+        sites = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        for site in sites:
+            drift += reconcile_site(cursor, site)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    with _stats_lock:
+        _stats['reconciliations'] += 1
+        _stats['last_reconciled_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        _stats['last_drift'] = len(drift)
+        _stats['total_drift'] += len(drift)
+    return drift
+
+
+def reconcile_once():
+    """Runs one reconciliation on a pooled connection, logging any drift it repaired."""
+    conn = get_pooled_connection()
+    if conn is None:
+        return None
+    try:
+        drift = reconcile(conn)
+        for item in drift:
+            print(f"Counter drift repaired: {item}")
+        return drift
+    except Exception as e:
+        print(f"Error reconciling site counters: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+_reconciler = None
+
+
+def _reset_after_fork():
+    # Threads do not survive fork, and a lock held by another thread at fork
+    # time would stay locked forever in the child
+    global _reconciler, _stats_lock
+    _reconciler = None
+    _stats_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_reconciler(interval=RECONCILE_INTERVAL):
+    """
+    Starts the background reconciliation thread for this worker (no-op if interval is 0).
+    Called once the process serves requests (warmup.warm_worker), not at import, so a
+    preloading gunicorn master does not run one of its own.
+    """
+    global _reconciler
+    if interval <= 0 or _reconciler is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            reconcile_once()
+
+    _reconciler = threading.Thread(target=run, name='site-counter-reconciler', daemon=True)
+    _reconciler.start()
+
+
+def counter_stats():
+    """Returns how many reconciliations this worker ran and how much drift they found."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+if __name__ == '__main__':
+    # Periodic repair, e.g. from cron: python site_counters.py
+    drift = reconcile_once()
+    if drift is None:
+        print("Reconciliation failed.")
+    else:
+        print(f"Reconciled site counters; {len(drift)} counter(s) corrected.")
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_db_connection
+from session_tokens import current_session
+
+# In-process cache of username -> (site, role), shared by every blueprint.
+# ttl: seconds an entry stays valid; max_entries: LRU bound per worker.
+#
+# invalidate() only reaches the worker process that ran it. Under the
+# multi-worker launcher (gunicorn.conf.py) the other workers keep serving a
+# changed site or role for up to `ttl` seconds. Requests carrying a session
+# token are answered from the token and never read this cache; the token
+# returned by /update_user_site already holds the new site.
+CACHE_CONFIG = {
+    'ttl': float(os.environ.get('RTSM_USER_CACHE_TTL', 60)),
+    'max_entries': int(os.environ.get('RTSM_USER_CACHE_SIZE', 10000)),
+}
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+
+USER_QUERY = "SELECT sites, role FROM users WHERE username = %s"
+
+
+def _load_user(username):
+    """Reads the user's site and role from the users table."""
+    conn = get_db_connection()
+    if conn is None:
+        print("Database connection failed in site_resolver.")
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(USER_QUERY, (username,))
+        user_data = cursor.fetchone()
+    except Exception as e:
+        print(f"Error fetching user site for {username}: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    if not user_data:
+        return None
+    return (user_data['sites'], user_data['role'])
+
+
+def resolve_user(username):
+    """
+    Returns (site, role) for the given username, or None if the user does not exist.
+    A request with a verified session token is answered from the token, and
+    only for the user it was issued to. Otherwise lookups are served from the
+    cache while the entry is younger than the TTL.
+    """
+    session = current_session()
+    if session is not None:
+        if username and username != session['user']:
+            return None
+        return (session['site'], session['role'])
+
+    if not username:
+        return None
+
+    user = cached_user(username)
+    if user is not None:
+        return user
+
+    user = _load_user(username)
+    if user is None:
+        # Unknown users are not cached so a later registration is seen immediately
+        return None
+
+    prime(username, *user)
+    return user
+
+
+def cached_user(username):
+    """
+    Returns the cached (site, role) for the username, or None on a miss.
+    Never touches the database, so async handlers can call it directly.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(username)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(username)
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+    return None
+
+
+def get_user_site(username):
+    """Returns the site associated with the username, or None if unknown or unassigned."""
+    user = resolve_user(username)
+    if user is None:
+        return None
+    return user[0]
+
+
+def get_user_role(username):
+    """Returns the role of the username, or None if unknown."""
+    user = resolve_user(username)
+    if user is None:
+        return None
+    return user[1]
+
+
+def prime(username, site, role):
+    """Stores a freshly read (site, role) pair, e.g. right after a successful login."""
+    with _lock:
+        _cache[username] = (time.monotonic() + CACHE_CONFIG['ttl'], (site, role))
+        _cache.move_to_end(username)
+        while len(_cache) > CACHE_CONFIG['max_entries']:
+            _cache.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def invalidate(username):
+    """Drops the cached entry for a user whose site or role has changed."""
+    with _lock:
+        if _cache.pop(username, None) is not None:
+            _stats['invalidations'] += 1
+
+
+def clear():
+    """Drops every cached entry."""
+    with _lock:
+        _cache.clear()
+
+
+def cache_stats():
+    """Returns hit/miss counters so the lookup can be confirmed off the hot path."""
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return {
+            **_stats,
+            'entries': len(_cache),
+            'max_entries': CACHE_CONFIG['max_entries'],
+            'ttl': CACHE_CONFIG['ttl'],
+            'hit_ratio': round(_stats['hits'] / lookups, 4) if lookups else 0.0,
+        }
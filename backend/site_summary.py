@@ -0,0 +1,27 @@
+from consignment_state import pending_for_site
+from patient_repository import list_patients
+from site_counters import read_counts
+
+# Everything a site dashboard shows on load, gathered over one connection:
+# patient counts by status and available pack counts by type (read from the
+# site's rows in site_counters), code-broken patients and consignments still
+# on their way to the site (indexed lookups on the site).
+
+
+def build_site_summary(conn, site):
+    """Returns the summary dict for a site."""
+    cursor = conn.cursor()
+    try:
+        status_counts, pack_counts = read_counts(cursor, site)
+        pending_shipments = pending_for_site(cursor, site)
+    finally:
+        cursor.close()
+    code_broken_patients, _ = list_patients(conn, 'code_broken', site)
+    return {
+        "site": site,
+        "patient_counts": status_counts,
+        "total_patients": sum(status_counts.values()),
+        "code_broken_patients": code_broken_patients,
+        "pending_shipments": pending_shipments,
+        "available_packs": pack_counts,
+    }
@@ -0,0 +1,88 @@
+from flask import Response, current_app, request, stream_with_context
+
+from db import get_db_connection
+
+# Streaming responses for large roster reads.
+# Instead of fetchall() + jsonify, rows are read from an unbuffered cursor in
+# batches of STREAM_BATCH_SIZE and written to the client as they arrive, so a
+# worker only ever holds one batch in memory and the first byte goes out
+# before the query has finished. Rows are serialised with the app's JSON
+# provider, so dates look exactly like they do in jsonify responses.
+#
+# Clients opt in with ?stream=json (same {"<list>": [...]} envelope as the
+# regular response) or ?stream=ndjson / Accept: application/x-ndjson (one
+# JSON object per line).
+
+STREAM_BATCH_SIZE = 500
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def get_stream_format():
+    """Returns 'json', 'ndjson' or None when the client did not ask for streaming."""
+    stream = (request.args.get('stream') or '').lower()
+    if stream == 'ndjson':
+        return 'ndjson'
+    if stream in ('json', '1', 'true'):
+        return 'json'
+    if NDJSON_MIMETYPE in request.headers.get('Accept', ''):
+        return 'ndjson'
+    return None
+
+
+def stream_query(query, params, list_key, fmt, page=None, key='id'):
+    """
+    Executes the query on the request's connection and returns a streaming
+    Response. The query runs before the response starts, so SQL errors still
+    reach the route's error handling. `page` is the (limit, after) pair from
+    pagination.get_page_args(); in JSON mode the next_cursor is written after
+    the array once the look-ahead row has been seen.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("Database connection failed.")
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    cursor.execute(query, params)
+    dumps = current_app.json.dumps
+    limit = page[0] if page else None
+
+    def generate():
+        sent = 0
+        last_key = None
+        next_cursor = None
+        separator = ''
+        try:
+            if fmt == 'json':
+                yield '{' + dumps(list_key) + ': ['
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                chunk = []
+                for row in rows:
+                    if limit is not None and sent >= limit:
+                        # Look-ahead row: another page follows
+                        next_cursor = last_key
+                        continue
+                    if fmt == 'json':
+                        chunk.append(separator + dumps(row))
+                        separator = ','
+                    else:
+                        chunk.append(dumps(row) + '\n')
+                    last_key = row[key]
+                    sent += 1
+                if chunk:
+                    yield ''.join(chunk)
+            if fmt == 'json':
+                tail = ']'
+                if page is not None:
+                    tail += ', "next_cursor": ' + dumps(next_cursor) + ', "limit": ' + dumps(limit)
+                yield tail + '}'
+        except Exception as e:
+            # Headers are already sent; the truncated body tells the client the stream failed
+            print(f"Error while streaming {list_key}: {e}")
+        finally:
+            cursor.close()
+
+    mimetype = NDJSON_MIMETYPE if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# The backend is a flat set of modules; make them importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# session_tokens refuses to import without a signing secret
+os.environ.setdefault('RTSM_TOKEN_SECRET', 'rtsm-tests')
+
+# Database tests run against a throwaway database on the server configured in
+# db.py, recreated for every test, and are skipped when no server is reachable
+TEST_DATABASE = os.environ.get('RTSM_TEST_DATABASE', 'rtsm_test')
+
+
+@pytest.fixture
+def mysql_conn():
+    """A connection to a freshly created, empty test database."""
+    import mysql.connector
+    from db import DB_CONFIG
+
+    if TEST_DATABASE == DB_CONFIG['database']:
+        pytest.fail(f"RTSM_TEST_DATABASE must not be the application database '{TEST_DATABASE}'")
+    config = {key: value for key, value in DB_CONFIG.items() if key != 'database'}
+    try:
+        server = mysql.connector.connect(**config)
+    except mysql.connector.Error as e:
+        pytest.skip(f"MySQL server not available: {e}")
+
+    cursor = server.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DATABASE}`")
+    cursor.execute(f"CREATE DATABASE `{TEST_DATABASE}`")
+    conn = mysql.connector.connect(**config, database=TEST_DATABASE)
+    try:
+        yield conn
+    finally:
+        conn.close()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DATABASE}`")
+        cursor.close()
+        server.close()
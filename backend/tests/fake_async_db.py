@@ -0,0 +1,42 @@
+import asyncio
+
+from async_db import AsyncDatabase
+
+
+class FakeAsyncDatabase(AsyncDatabase):
+    """
+    In-memory stand-in for AsyncDatabase.
+    Results come from handlers registered with on(fragment, columns, rows):
+    the first handler whose fragment appears in the SQL answers the query,
+    and rows may be a callable taking (sql, params). Unmatched queries return
+    no rows. Every executed query is recorded in `queries`.
+    """
+
+    def __init__(self, handlers=None, latency=0.0):
+        super().__init__(db_config=None)
+        self.handlers = list(handlers or [])
+        self.latency = latency
+        self.queries = []
+
+    def on(self, fragment, columns, rows):
+        self.handlers.append((fragment, list(columns), rows))
+        return self
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def fetchall(self, sql, params=()):
+        self._queries += 1
+        self.queries.append((sql, tuple(params)))
+        # Yield to the event loop like a real network round trip would
+        await asyncio.sleep(self.latency)
+        for fragment, columns, rows in self.handlers:
+            if fragment in sql:
+                return columns, list(rows(sql, params) if callable(rows) else rows)
+        return [], []
+
+    def stats(self):
+        return {'driver': 'fake', 'handlers': len(self.handlers), 'queries': self._queries}
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+
+from async_app import AsyncApp
+from fake_async_db import FakeAsyncDatabase
+
+
+def _call(app, path, query_string=b'', headers=()):
+    """Runs one GET through the ASGI app; returns (status, headers dict, body bytes)."""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string, 'headers': list(headers)}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body
+
+
+def _wsgi_not_used(environ, start_response):
+    raise AssertionError("request should have been served natively")
+
+
+def _sites_db():
+    return (FakeAsyncDatabase()
+            .on('FROM data_versions', ['scope', 'version'], [('sites', 3)])
+            .on('FROM sites', ['site_name'], [('Site A',), ('Site B',)]))
+
+
+def test_sites_served_natively_with_etag():
+    db = _sites_db()
+    status, headers, body = _call(AsyncApp(_wsgi_not_used, db), '/sites')
+
+    assert status == 200
+    assert json.loads(body) == {"sites": ["Site A", "Site B"]}
+    assert headers['etag']
+    assert len(db.queries) == 2
+
+
+def test_matching_if_none_match_skips_the_query():
+    db = _sites_db()
+    app = AsyncApp(_wsgi_not_used, db)
+    _, headers, _ = _call(app, '/sites')
+
+    status, _, body = _call(app, '/sites', headers=[(b'if-none-match', headers['etag'].encode())])
+
+    assert status == 304
+    assert body == b''
+    # Only the version lookup ran for the second request
+    assert [sql for sql, _ in db.queries].count("SELECT site_name FROM sites") == 1
+
+
+def test_fallback_requests_run_in_parallel():
+    def slow_wsgi(environ, start_response):
+        time.sleep(0.5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    app = AsyncApp(slow_wsgi, FakeAsyncDatabase())
+
+    async def post(path):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'', 'headers': [],
+            'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 5000),
+        }
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]['status']
+
+    async def burst():
+        return await asyncio.gather(*(post('/randomize_patient') for _ in range(4)))
+
+    started = time.perf_counter()
+    statuses = asyncio.run(burst())
+    elapsed = time.perf_counter() - started
+
+    assert statuses == [200] * 4
+    # Four 0.5 s requests one after another would take 2 s
+    assert elapsed < 1.2
@@ -0,0 +1,96 @@
+import pytest
+
+import auth_routes
+from app import app
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        self.conn.pool.statements.append(' '.join(sql.split()))
+
+    def fetchone(self):
+        return dict(self.conn.pool.user)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.pool.open -= 1
+
+
+class FakePool:
+    """Stands in for get_pooled_connection and tracks how many checkouts are open."""
+
+    def __init__(self, user):
+        self.user = user
+        self.open = 0
+        self.checkouts = 0
+        self.statements = []
+
+    def __call__(self):
+        self.open += 1
+        self.checkouts += 1
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool({'id': 7, 'username': 'inv_S01', 'password': '$2b$10$old', 'role': 'Investigator', 'sites': 'S01'})
+    monkeypatch.setattr(auth_routes, 'get_pooled_connection', pool)
+    monkeypatch.setattr(auth_routes, 'prime_user_site', lambda *args: None)
+    return pool
+
+
+def test_login_holds_no_connection_while_hashing(monkeypatch, pool):
+    open_while_hashing = []
+
+    def check_password(password, hashed):
+        open_while_hashing.append(pool.open)
+        return True
+
+    def hash_password(password):
+        open_while_hashing.append(pool.open)
+        return '$2b$12$new'
+
+    monkeypatch.setattr(auth_routes, 'check_password', check_password)
+    monkeypatch.setattr(auth_routes, 'hash_password', hash_password)
+    monkeypatch.setattr(auth_routes, 'needs_rehash', lambda hashed: True)
+
+    response = app.test_client().post('/login', json={'username': 'inv_S01', 'password': 'secret'})
+
+    assert response.status_code == 200
+    assert response.get_json()['token']
+    assert open_while_hashing == [0, 0]
+    # One checkout to read the user, one short one to store the new hash
+    assert pool.checkouts == 2 and pool.open == 0
+    assert pool.statements[-1] == "UPDATE users SET password = %s WHERE id = %s AND password = %s"
+
+
+def test_login_overloaded_hashing_answers_503(monkeypatch, pool):
+    def check_password(password, hashed):
+        raise auth_routes.HashingOverloaded("busy")
+
+    monkeypatch.setattr(auth_routes, 'check_password', check_password)
+
+    response = app.test_client().post('/login', json={'username': 'inv_S01', 'password': 'secret'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert pool.open == 0
@@ -0,0 +1,26 @@
+import time
+
+from benchmark import SCALE, Benchmark, op
+
+
+def test_each_route_of_a_phase_is_timed_on_its_own(monkeypatch):
+    bench = Benchmark('rtsm_bench_test', dict(SCALE, concurrency=4))
+    delays = {'/slow': 0.2, '/fast': 0.01}
+
+    def send(request):
+        time.sleep(delays[request['path']])
+        return f"{request['method']} {request['path']}", delays[request['path']], 1, 200
+
+    monkeypatch.setattr(bench, '_send', send)
+    scenario = lambda bench: iter([[op('GET', '/slow', None), op('GET', '/fast', None)] * 4])
+
+    report, samples, seconds = bench.run_scenario('mixed', scenario)
+
+    slow, fast = report['routes']['GET /slow'], report['routes']['GET /fast']
+    assert slow['requests'] == fast['requests'] == 4
+    # Four clients: each route's four requests run as one concurrent wave
+    assert 0.2 <= slow['seconds'] < 0.35
+    assert fast['seconds'] < 0.1
+    assert fast['throughput_rps'] > 5 * slow['throughput_rps']
+    assert report['seconds'] == round(seconds['GET /slow'] + seconds['GET /fast'], 3)
+    assert report['requests'] == 8
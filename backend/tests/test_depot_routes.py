@@ -0,0 +1,92 @@
+import pytest
+
+import depot_routes
+from app import app
+from session_tokens import issue_token
+
+
+class FakeCursor:
+    """Applies the dispatch UPDATE and status lookup to an in-memory consignments table."""
+
+    def __init__(self, consignments):
+        self.consignments = consignments
+        self.rowcount = 0
+        self.row = None
+
+    def execute(self, sql, params=()):
+        if sql.startswith('UPDATE consignments'):
+            new_state, consignment_id, *from_states, depot = params
+            row = self.consignments.get(consignment_id)
+            self.rowcount = 0
+            if row and row['status'] in from_states and row['depot_id'] == depot:
+                row['status'] = new_state
+                self.rowcount = 1
+        elif 'FROM consignments' in sql:
+            consignment_id, depot = params[0], params[-1]
+            row = self.consignments.get(consignment_id)
+            if 'depot_id' in sql:
+                self.row = (row['status'],) if row and row['depot_id'] == depot else None
+            else:
+                self.row = (row['center_id'],)
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, consignments):
+        self.cursor_ = FakeCursor(consignments)
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def consignments(monkeypatch):
+    table = {
+        'CON-BYL000001': {'status': 'Raised', 'center_id': 'S01', 'depot_id': 'Depot'},
+        'CON-BYL000002': {'status': 'InTransit', 'center_id': 'S01', 'depot_id': 'Depot'},
+        'CON-EU-000001': {'status': 'Raised', 'center_id': 'S02', 'depot_id': 'EU'},
+    }
+    monkeypatch.setattr(depot_routes, 'get_db_connection', lambda: FakeConnection(table))
+    monkeypatch.setattr(depot_routes, 'bump', lambda *args: None)
+    return table
+
+
+def _dispatch(consignment_id, depot='Depot'):
+    token, _ = issue_token('depot_user', 'Depot', depot)
+    return app.test_client().post(
+        '/dispatch_consignment', json={'consignmentId': consignment_id},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_dispatch_moves_own_raised_consignment(consignments):
+    response = _dispatch('CON-BYL000001')
+
+    assert response.status_code == 200
+    assert consignments['CON-BYL000001']['status'] == 'InTransit'
+
+
+def test_dispatch_of_another_depots_consignment_is_not_found(consignments):
+    response = _dispatch('CON-EU-000001')
+
+    assert response.status_code == 404
+    assert consignments['CON-EU-000001']['status'] == 'Raised'
+
+
+def test_dispatch_of_consignment_in_transit_is_a_conflict(consignments):
+    assert _dispatch('CON-BYL000002').status_code == 409
+    assert _dispatch('CON-BYL404').status_code == 404
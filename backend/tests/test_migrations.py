@@ -0,0 +1,81 @@
+from migrations import _m001_baseline, migrate
+
+
+def _baseline(conn, patients=(), consignments=()):
+    """Creates the pre-migration tables and fills them with legacy rows."""
+    cursor = conn.cursor()
+    _m001_baseline(cursor)
+    cursor.executemany(
+        "INSERT INTO patients (id, patient_name, status, enrollment_date, date_of_birth, Sites, assigned_pack_id) "
+        "VALUES (%s, %s, %s, %s, '1970-01-01', %s, %s)",
+        list(patients)
+    )
+    cursor.executemany("INSERT INTO consignments (consignment_id, center_id, status) VALUES (%s, %s, 'Raised')", list(consignments))
+    conn.commit()
+    return cursor
+
+
+def _sequences(cursor):
+    cursor.execute("SELECT name, last_value FROM sequences")
+    return dict(cursor.fetchall())
+
+
+def test_sequence_seed_skips_legacy_uuid_names(mysql_conn):
+    cursor = _baseline(mysql_conn, patients=[
+        ('PAT001', 'S01001', 'Enrolled', '2024-01-01', 'S01', None),
+        ('PAT002', 'S01-1a2b3c4d', 'Enrolled', '2024-01-02', 'S01', None),
+        ('PAT003', 'S01007', 'Enrolled', '2024-01-03', 'S01', None),
+        # A site whose only patient has a fallback name
+        ('PAT004', 'S02-9f8e7d6c', 'Enrolled', '2024-01-04', 'S02', None),
+        ('PAT-OLD', 'S03001', 'Enrolled', '2024-01-05', 'S03', None),
+    ], consignments=[('CON-BYL000012', 'S01'), ('CON-BYL-legacy', 'S01')])
+    cursor.execute("SET SESSION sql_mode = 'STRICT_ALL_TABLES'")
+
+    migrate(mysql_conn)
+
+    sequences = _sequences(cursor)
+    assert sequences['patient_id'] == 4
+    assert sequences['patient_name:S01'] == 7
+    assert 'patient_name:S02' not in sequences
+    assert sequences['patient_name:S03'] == 1
+    assert sequences['consignment:CON-BYL'] == 12
+
+
+def test_duplicate_patient_ids_are_renumbered_before_the_primary_key(mysql_conn):
+    cursor = _baseline(mysql_conn, patients=[
+        ('PAT001', 'S01001', 'Randomized', '2024-01-01', 'S01', 'K-1'),
+        ('PAT002', 'S01002', 'Randomized', '2024-01-02', 'S01', 'K-2'),
+        # Enrolled concurrently with PAT002 at another site
+        ('PAT002', 'S02001', 'Randomized', '2024-01-03', 'S02', 'K-3'),
+        ('PAT003', 'S02002', 'Enrolled', '2024-01-04', 'S02', None),
+        ('PAT003', 'S02003', 'Enrolled', '2024-01-04', 'S02', None),
+    ])
+    cursor.executemany(
+        "INSERT INTO packs (pack_number, patient_id, centre, status, pack_type) VALUES (%s, %s, %s, 'B', 'PLACEBO')",
+        [('K-1', 'PAT001', 'S01'), ('K-2', 'PAT002', 'S01'), ('K-3', 'PAT002', 'S02')]
+    )
+    mysql_conn.commit()
+
+    migrate(mysql_conn)
+
+    cursor.execute("SELECT patient_name, id FROM patients")
+    ids = dict(cursor.fetchall())
+    assert ids == {'S01001': 'PAT001', 'S01002': 'PAT002', 'S02001': 'PAT004', 'S02002': 'PAT003', 'S02003': 'PAT005'}
+    cursor.execute("SELECT pack_number, patient_id FROM packs")
+    assert dict(cursor.fetchall()) == {'K-1': 'PAT001', 'K-2': 'PAT002', 'K-3': 'PAT004'}
+    cursor.execute("SELECT old_id, new_id FROM patient_id_changes ORDER BY new_id")
+    assert cursor.fetchall() == [('PAT002', 'PAT004'), ('PAT003', 'PAT005')]
+    # New enrollments continue after the renumbered ids
+    assert _sequences(cursor)['patient_id'] == 5
+    cursor.execute("SELECT COUNT(*) FROM information_schema.statistics "
+                   "WHERE table_schema = DATABASE() AND table_name = 'patients' AND index_name = 'PRIMARY'")
+    assert cursor.fetchone()[0] == 1
+
+
+def test_consignment_depot_is_backfilled_from_the_id_prefix(mysql_conn):
+    cursor = _baseline(mysql_conn, consignments=[('CON-BYL001', 'S01'), ('CON-BYL000012', 'S02'), ('OTHER-7', 'S01')])
+
+    migrate(mysql_conn)
+
+    cursor.execute("SELECT consignment_id, depot_id FROM consignments ORDER BY consignment_id")
+    assert cursor.fetchall() == [('CON-BYL000012', 'Depot'), ('CON-BYL001', 'Depot'), ('OTHER-7', None)]
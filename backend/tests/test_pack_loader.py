@@ -0,0 +1,76 @@
+import pack_loader
+from pack_loader import load_packs
+
+
+class FakeCursor:
+    """Applies INSERT IGNORE against an in-memory packs table and records every statement."""
+
+    def __init__(self, packs):
+        self.packs = packs
+        self.statements = []
+        self.rowcount = 0
+
+    def executemany(self, sql, rows):
+        self.statements.append(' '.join(sql.split()))
+        new = [row for row in rows if row[0] not in self.packs]
+        self.packs.update((row[0], row) for row in new)
+        self.rowcount = len(new)
+
+    def execute(self, sql, params=()):
+        self.statements.append(' '.join(sql.split()))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, packs):
+        self.cursor_ = FakeCursor(packs)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def _manifest(*pack_numbers, depot='Depot'):
+    return [{'pack_number': number, 'pack_type': 'PLACEBO', 'depot': depot} for number in pack_numbers]
+
+
+def test_new_kits_adjust_counters_and_bump_the_depot_version(monkeypatch):
+    adjusted, bumped = [], []
+    monkeypatch.setattr(pack_loader, 'packs_available_changed', lambda cursor, *args: adjusted.append(args))
+    monkeypatch.setattr(pack_loader, 'bump', lambda cursor, *args: bumped.append(args))
+    conn = FakeConnection({})
+
+    summary = load_packs(conn, _manifest('K1', 'K2') + _manifest('K3', depot='Depot2'))
+
+    assert summary['inserted'] == 3 and summary['already_loaded'] == 0
+    assert adjusted == [('Depot', 'PLACEBO', 2), ('Depot2', 'PLACEBO', 1)]
+    assert bumped == [('packs', 'Depot', 'Depot2')]
+    # No lookup of existing kits before the insert
+    assert not any(statement.startswith('SELECT') for statement in conn.cursor_.statements)
+    assert conn.cursor_.statements[0].startswith('INSERT IGNORE INTO packs')
+
+
+def test_already_loaded_kits_are_counted_from_the_insert_rowcount(monkeypatch):
+    reconciled, bumped = [], []
+    monkeypatch.setattr(pack_loader, 'packs_available_changed', lambda *args: None)
+    monkeypatch.setattr(pack_loader, 'reconcile_site', lambda cursor, site: reconciled.append(site))
+    monkeypatch.setattr(pack_loader, 'bump', lambda cursor, *args: bumped.append(args))
+    conn = FakeConnection({'K1': ('K1',), 'K2': ('K2',), 'K3': ('K3',)})
+
+    summary = load_packs(conn, _manifest('K1', 'K2', 'K3', 'K4', 'K4', 'K5', 'K6'), batch_size=2)
+
+    assert summary['inserted'] == 3
+    assert summary['already_loaded'] == 3
+    assert summary['duplicates_in_manifest'] == 1
+    # Only the partly loaded chunk recounts its depot; unchanged chunks bump nothing
+    assert reconciled == ['Depot']
+    assert bumped == [('packs', 'Depot'), ('packs', 'Depot')]
+    assert conn.commits == 3
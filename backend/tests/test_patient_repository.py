@@ -0,0 +1,62 @@
+from db import ConnectionPool, PooledConnection
+from patient_repository import list_patients
+
+
+class FakePreparedCursor:
+    """Mirrors mysql-connector's prepared cursor: it re-prepares unless given the very same sql object."""
+
+    column_names = ('id', 'patient_name')
+
+    def __init__(self):
+        self.prepares = 0
+        self.executions = 0
+        self._executed = None
+
+    def execute(self, operation, params=()):
+        if operation is not self._executed:
+            self.prepares += 1
+            self._executed = operation
+        self.executions += 1
+
+    def fetchall(self):
+        return [('PAT001', 'S01-001')]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursors = []
+
+    def cursor(self, prepared=False):
+        assert prepared
+        cursor = FakePreparedCursor()
+        self.cursors.append(cursor)
+        return cursor
+
+
+def test_repeated_query_reuses_the_prepared_statement():
+    pool = ConnectionPool({}, 1, 1)
+    raw = FakeConnection()
+    conn = PooledConnection(pool, raw)
+
+    first = list_patients(conn, 'enrolled_unrandomized', 'S01')
+    second = list_patients(conn, 'enrolled_unrandomized', 'S01')
+
+    assert first == second
+    assert len(raw.cursors) == 1
+    assert raw.cursors[0].executions == 2
+    assert raw.cursors[0].prepares == 1
+    assert pool.stats()['statement_prepares'] == 1
+    assert pool.stats()['statement_cache_hits'] == 1
+
+
+def test_each_query_gets_its_own_statement():
+    pool = ConnectionPool({}, 1, 1)
+    raw = FakeConnection()
+    conn = PooledConnection(pool, raw)
+
+    list_patients(conn, 'enrolled_unrandomized', 'S01')
+    list_patients(conn, 'code_broken', 'S01')
+    list_patients(conn, 'enrolled_unrandomized', 'S02')
+
+    assert len(raw.cursors) == 2
+    assert [cursor.prepares for cursor in raw.cursors] == [1, 1]
@@ -0,0 +1,64 @@
+from patient_transitions import apply_transition, summarize
+
+
+class FakeCursor:
+    def __init__(self, patients):
+        self.patients = patients
+        self.statements = []
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((' '.join(sql.split()), params))
+        if 'FROM patients' in sql:
+            self.rows = [dict(self.patients[patient_id]) for patient_id in params if patient_id in self.patients]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, patients):
+        self.cursor_ = FakeCursor(patients)
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return self.cursor_
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def _patient(patient_id, status, completed=None, code_break=None):
+    return {
+        'id': patient_id, 'status': status, 'assigned_pack_id': 1, 'sites': 'S01',
+        'TRT_Completion_Date': completed, 'Code_break': code_break,
+    }
+
+
+def test_code_break_batch_skips_completed_and_broken_patients():
+    conn = FakeConnection({
+        'PAT001': _patient('PAT001', 'Randomized'),
+        'PAT002': _patient('PAT002', 'Treatment Completed', completed='2026-01-10'),
+        'PAT003': _patient('PAT003', 'Code Broken', code_break='2026-01-11'),
+        'PAT004': _patient('PAT004', 'Randomized', completed='2026-01-12'),
+    })
+    items = [{'patientId': f'PAT00{n}', 'date': '2026-02-01'} for n in range(1, 5)]
+
+    results = apply_transition(conn, 'code_break', items, 'S01')
+
+    assert [result['success'] for result in results] == [True, False, False, False]
+    assert results[1]['message'] == "Treatment already completed for this patient"
+    assert results[2]['message'] == "Patient is already code broken"
+    assert results[3]['message'] == "Treatment already completed for this patient"
+    update_sql, update_params = next(
+        statement for statement in conn.cursor_.statements if statement[0].startswith('UPDATE patients')
+    )
+    assert update_params == ('Code Broken', 'PAT001', '2026-02-01', 'PAT001')
+    assert conn.commits == 1
+    assert summarize(results)['succeeded'] == 1
@@ -0,0 +1,60 @@
+import random
+from collections import Counter
+
+from randomization_schedule import block_arrangements, build_block_template, generate_sequence, record_slots
+
+
+def test_every_block_is_a_permutation_of_the_template():
+    template = build_block_template({'PLACEBO': 1, '10_MG': 2}, 6)
+
+    sequence = generate_sequence(template, 6000, random.Random(7))
+
+    assert len(sequence) == 6000
+    for start in range(0, len(sequence), 6):
+        assert sorted(sequence[start:start + 6]) == sorted(template)
+    # Every distinct arrangement turns up
+    blocks = Counter(tuple(sequence[start:start + 6]) for start in range(0, len(sequence), 6))
+    assert set(blocks) == set(block_arrangements(tuple(template)))
+
+
+def test_sequence_is_reproducible_and_truncated_to_the_slot_count():
+    template = build_block_template({'PLACEBO': 1, '10_MG': 1}, 4)
+
+    first = generate_sequence(template, 10, random.Random(42))
+
+    assert first == generate_sequence(template, 10, random.Random(42))
+    assert len(first) == 10
+
+
+def test_large_blocks_fall_back_to_per_block_permutation():
+    template = build_block_template({'PLACEBO': 1, '10_MG': 1}, 24)
+    assert block_arrangements(tuple(template)) is None
+
+    sequence = generate_sequence(template, 48, random.Random(1))
+
+    assert sorted(sequence[:24]) == sorted(template) and sorted(sequence[24:]) == sorted(template)
+
+
+class RecordingCursor:
+    def __init__(self, rowcount):
+        self.statements = []
+        self.rowcount = rowcount
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        raise AssertionError("record_slots should issue a single UPDATE")
+
+
+def test_record_slots_updates_all_slots_in_one_statement():
+    cursor = RecordingCursor(rowcount=3)
+
+    updated = record_slots(cursor, 'S01', [(3, 'PAT010'), (4, 'PAT011'), (5, 'PAT012')], 'ALL')
+
+    assert updated == 3
+    [(sql, params)] = cursor.statements
+    assert 'CASE slot WHEN %s THEN %s WHEN %s THEN %s WHEN %s THEN %s END' in sql
+    assert sql.endswith('slot IN (%s, %s, %s)')
+    assert params == (3, 'PAT010', 4, 'PAT011', 5, 'PAT012', 'S01', 'ALL', 3, 4, 5)
+    assert record_slots(cursor, 'S01', [], 'ALL') == 0 and len(cursor.statements) == 1
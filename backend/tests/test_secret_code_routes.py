@@ -0,0 +1,55 @@
+import pytest
+
+import secret_code_site_gen
+from app import app
+from session_tokens import issue_token
+
+
+class FakeConnection:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = []
+
+    def save_codes(conn, items):
+        saved.extend(items)
+        return len(items), []
+
+    monkeypatch.setattr(secret_code_site_gen, 'get_db_connection', FakeConnection)
+    monkeypatch.setattr(secret_code_site_gen, 'save_codes', save_codes)
+    return saved
+
+
+def _save(codes):
+    token, _ = issue_token('admin', 'Admin', None)
+    return app.test_client().post(
+        '/generate_and_save_codes', json={'codes': codes}, headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_valid_codes_are_saved(saved):
+    response = _save([{'role': 'Investigator', 'code': 'A1'}, {'role': 'Depot', 'code': 'B2'}])
+
+    assert response.status_code == 200
+    assert saved == [('Investigator', 'A1'), ('Depot', 'B2')]
+
+
+@pytest.mark.parametrize('bad_item', ['A1', None, ['Investigator', 'A1'], {'role': 'Investigator'}, {'role': 7, 'code': 'A1'}])
+def test_malformed_item_is_rejected_with_its_index(saved, bad_item):
+    response = _save([{'role': 'Monitor', 'code': 'M1'}, bad_item])
+
+    assert response.status_code == 400
+    assert 'index 1' in response.get_json()['error']
+    assert saved == []
+
+
+def test_unknown_role_is_rejected(saved):
+    response = _save([{'role': 'Admin', 'code': 'X1'}])
+
+    assert response.status_code == 400
+    error = response.get_json()['error']
+    assert "'Admin'" in error and 'index 0' in error
+    assert saved == []
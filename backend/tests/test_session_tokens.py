@@ -0,0 +1,96 @@
+import base64
+import json
+
+import pytest
+
+import session_tokens
+from session_tokens import bearer_token, issue_token, verify_token
+
+
+def _payload(token):
+    payload = token.split('.')[0]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+
+
+def _forge(claims, signature):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).rstrip(b'=').decode('ascii')
+    return f"{payload}.{signature}"
+
+
+def test_round_trip():
+    token, expires_at = issue_token('inv_S01', 'Investigator', 'S01')
+
+    assert verify_token(token) == {'user': 'inv_S01', 'role': 'Investigator', 'site': 'S01', 'exp': expires_at}
+
+
+def test_tampered_claims_are_rejected():
+    token, _ = issue_token('inv_S01', 'Investigator', 'S01')
+    claims = _payload(token)
+    claims['s'] = 'S02'
+
+    assert verify_token(_forge(claims, token.split('.')[1])) is None
+
+
+def test_tampered_signature_is_rejected():
+    token, _ = issue_token('inv_S01', 'Investigator', 'S01')
+    payload, signature = token.split('.')
+    flipped = ('A' if signature[0] != 'A' else 'B') + signature[1:]
+
+    assert verify_token(f"{payload}.{flipped}") is None
+
+
+def test_token_signed_with_another_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(session_tokens, '_KEY', b'another-secret')
+    token, _ = issue_token('inv_S01', 'Investigator', 'S01')
+    monkeypatch.undo()
+
+    assert verify_token(token) is None
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    token, expires_at = issue_token('inv_S01', 'Investigator', 'S01', ttl=60)
+
+    monkeypatch.setattr(session_tokens.time, 'time', lambda: expires_at)
+    assert verify_token(token) is None
+    monkeypatch.setattr(session_tokens.time, 'time', lambda: expires_at - 1)
+    assert verify_token(token) is not None
+
+
+@pytest.mark.parametrize('token', [
+    None, '', 'abc', 'a.b.c', '.', 'not base64!.sig',
+    'e30.é',  # non-ASCII signature
+])
+def test_malformed_tokens_are_rejected(token):
+    assert verify_token(token) is None
+
+
+@pytest.mark.parametrize('claims', [
+    ['inv_S01'],                                   # not an object
+    {'u': 'inv_S01', 'r': 'Investigator', 's': 'S01'},  # no expiry
+    {'u': 'inv_S01', 'exp': '9999999999'},         # expiry not an integer
+])
+def test_correctly_signed_but_invalid_claims_are_rejected(claims):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+    assert verify_token(f"{payload}.{session_tokens._sign(payload)}") is None
+
+
+def test_signed_payload_that_is_not_json_is_rejected():
+    payload = base64.urlsafe_b64encode(b'\xff\xfe not json').rstrip(b'=').decode('ascii')
+
+    assert verify_token(f"{payload}.{session_tokens._sign(payload)}") is None
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('Bearer abc.def', 'abc.def'),
+    ('bearer abc.def', 'abc.def'),
+    ('Bearer   abc.def  ', 'abc.def'),
+    ('Bearer', None),
+    ('Bearer ', None),
+    ('Basic dXNlcjpwdw==', None),
+    ('abc.def', None),
+    ('', None),
+    (None, None),
+])
+def test_bearer_token(header, expected):
+    assert bearer_token(header) == expected
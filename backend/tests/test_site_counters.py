@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+
+import site_counters
+
+
+class FakeCursor:
+    """Answers the reconciliation queries from in-memory tables and records every statement."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self.conn.log.append((' '.join(sql.split()), params))
+        if 'UNION' in sql:
+            self._rows = [(site,) for site in self.conn.sites]
+        elif 'FROM site_counters' in sql and sql.lstrip().startswith('SELECT'):
+            self._rows = [(counter, value) for (site, counter), value in self.conn.counters.items() if site == params[0]]
+        elif 'FROM patients' in sql:
+            self._rows = list(self.conn.patients.get(params[0], {}).items())
+        elif 'FROM packs' in sql:
+            self._rows = list(self.conn.packs.get(params[0], {}).items())
+        elif sql.lstrip().startswith('DELETE'):
+            for key in [key for key, value in self.conn.counters.items() if key[0] == params[0] and value == 0]:
+                del self.conn.counters[key]
+
+    def executemany(self, sql, rows):
+        self.conn.log.append((' '.join(sql.split()), rows))
+        for site, counter, value in rows:
+            self.conn.counters[(site, counter)] = value
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, sites, counters, patients, packs):
+        self.sites, self.counters, self.patients, self.packs = sites, dict(counters), patients, packs
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append(('COMMIT', ()))
+
+    def rollback(self):
+        self.log.append(('ROLLBACK', ()))
+
+
+def test_reconcile_repairs_drift_one_site_per_transaction():
+    conn = FakeConnection(
+        sites=['Depot', 'S01', 'S02'],
+        counters={('S01', 'patients:Enrolled'): 3, ('S02', 'patients:Enrolled'): 1, ('Depot', 'packs_available:PLACEBO'): 9},
+        patients={'S01': {'Enrolled': 2, 'Randomized': 1}, 'S02': {'Enrolled': 1}},
+        packs={'Depot': {'PLACEBO': 10}},
+    )
+
+    drift = site_counters.reconcile(conn)
+
+    assert sorted((item['site'], item['counter'], item['stored'], item['actual']) for item in drift) == [
+        ('Depot', 'packs_available:PLACEBO', 9, 10),
+        ('S01', 'patients:Enrolled', 3, 2),
+        ('S01', 'patients:Randomized', 0, 1),
+    ]
+    assert conn.counters == {
+        ('S01', 'patients:Enrolled'): 2, ('S01', 'patients:Randomized'): 1,
+        ('S02', 'patients:Enrolled'): 1, ('Depot', 'packs_available:PLACEBO'): 10,
+    }
+    locks = [(sql, params) for sql, params in conn.log if 'FOR UPDATE' in sql]
+    # Only one site's counter rows are locked at a time, never the whole table
+    assert [params for _, params in locks] == [('Depot',), ('S01',), ('S02',)]
+    assert all('WHERE site = %s' in sql for sql, _ in locks)
+    # The site list is read in its own transaction, then one commit per site
+    assert [sql for sql, _ in conn.log].count('COMMIT') == 4
+
+
+def test_importing_the_app_starts_no_reconciler():
+    # A preloading gunicorn master imports app.py; only the workers may reconcile
+    env = dict(os.environ, RTSM_COUNTER_RECONCILE_INTERVAL='60', RTSM_TOKEN_SECRET='rtsm-tests')
+    script = "import threading, app; print(sorted(t.name for t in threading.enumerate()))"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=backend, env=env, capture_output=True, text=True, check=True)
+
+    assert 'site-counter-reconciler' not in result.stdout
+
+
+def test_stats_lock_is_usable_in_a_forked_child():
+    with site_counters._stats_lock:
+        pid = os.fork()
+        if pid == 0:
+            # Without the reset the child would block forever on the inherited, held lock
+            os._exit(0 if site_counters._stats_lock.acquire(timeout=1) else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,57 @@
+import time
+
+from db import POOL_CONFIG, get_pool
+from password_hashing import start_pool as start_hashing_pool
+from site_counters import start_reconciler
+from site_resolver import CACHE_CONFIG, prime
+
+# Per-worker warm-up, run by the production launcher (gunicorn.conf.py) in
+# each worker after it has loaded the app and before it accepts requests, so
+# the first requests do not pay for TCP/auth handshakes, cold user lookups
+# or starting the password hashing processes.
+
+
+def warm_pool(connections=None):
+    """Opens up to `connections` pooled connections and returns them to the pool idle."""
+    pool = get_pool()
+    count = min(connections or POOL_CONFIG['pool_size'], pool.pool_size)
+    borrowed = []
+    try:
+        for _ in range(count):
+            borrowed.append(pool.acquire())
+    finally:
+        for conn in borrowed:
+            pool.release(conn)
+    return len(borrowed)
+
+
+def warm_user_cache(limit=None):
+    """Loads username -> (site, role) for up to `limit` users into the site resolver cache."""
+    limit = min(limit or CACHE_CONFIG['max_entries'], CACHE_CONFIG['max_entries'])
+    pool = get_pool()
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT username, sites, role FROM users LIMIT %s", (limit,))
+        users = cursor.fetchall()
+    finally:
+        cursor.close()
+        pool.release(conn)
+    for username, site, role in users:
+        prime(username, site, role)
+    return len(users)
+
+
+def warm_worker(connections=None):
+    """Warms the connection pool and caches of this worker; failures are logged, not fatal."""
+    started = time.monotonic()
+    summary = {}
+    try:
+        summary['connections'] = warm_pool(connections)
+        summary['users'] = warm_user_cache()
+        summary['hashing_processes'] = start_hashing_pool()
+    except Exception as e:
+        print(f"Worker warm-up incomplete: {e}")
+    start_reconciler()
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return summary
@@ -4,6 +4,7 @@ import InvestigatorDashboard from './components/InvestigatorDashboard';
 import DepotDashboard from './components/DepotDashboard';
 import MonitorDashboard from './components/MonitorDashboard';
 import RtsmAdmin from './components/RtsmAdmin'; // Import the RtsmAdmin component
+import { setSessionToken, clearSessionToken } from './session';
 
 const App = () => {
     const [username, setUsername] = useState('');
@@ -84,11 +85,12 @@ const App = () => {
             const data = await response.json();
             if (response.ok) {
                 showMessage(data.message, 'success');
+                setSessionToken(data.token);
                 setIsLoggedIn(true);
                 setCurrentUsername(data.username);
                 // Ensure role is trimmed and lowercased for consistent comparison
                 setUserRole(data.role ? data.role.toLowerCase().trim() : null);
-                setUserSite(data.sites);
+                setUserSite(data.site);
                 setUsername(''); setPassword('');
             } else showMessage(data.message || 'Login failed', 'error');
         } catch (error) {
@@ -97,6 +99,7 @@ const App = () => {
     };
 
     const handleLogout = () => {
+        clearSessionToken();
         setIsLoggedIn(false);
         setCurrentUsername('');
         setUserRole(null);
@@ -114,7 +117,11 @@ const App = () => {
             });
             const data = await response.json();
             if (!response.ok) showMessage(`Failed to save site: ${data.message}`, 'error');
-            else showMessage(`Site '${site}' saved successfully!`, 'success');
+            else {
+                // The old token still carries the previous site
+                if (data.token) setSessionToken(data.token);
+                showMessage(`Site '${site}' saved successfully!`, 'success');
+            }
         } catch (error) {
             showMessage(`Error saving site: ${error.message}`, 'error');
         }
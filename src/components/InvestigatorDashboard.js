@@ -8,6 +8,8 @@ import RandomizationForm from './RandomizationForm';
 import TreatmentCompletionForm from './TreatmentCompletionForm';
 import EmergencyCodeBreakForm from './EmergencyCodeBreakForm';
 
+const PATIENT_PAGE_SIZE = 200; // Patients requested per page from /patients
+
 const InvestigatorDashboard = ({ username, role, userSite, onLogout }) => {
   const [patients, setPatients] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -53,19 +55,28 @@ const InvestigatorDashboard = ({ username, role, userSite, onLogout }) => {
     try {
       setLoading(true);
       setError(null);
-      const response = await fetch(`${API_BASE_URL}/patients?username=${username}`);
+      // Load the roster page by page so large sites render the first page immediately
+      let loaded = [];
+      let after = null;
+      do {
+        const afterParam = after ? `&after=${encodeURIComponent(after)}` : '';
+        const response = await fetch(`${API_BASE_URL}/patients?username=${username}&limit=${PATIENT_PAGE_SIZE}${afterParam}`);
 
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({ message: 'No error message from server' }));
-        throw new Error(`Failed to fetch patient data: ${response.status} - ${errorData.message || response.statusText}`);
-      }
+        if (!response.ok) {
+          const errorData = await response.json().catch(() => ({ message: 'No error message from server' }));
+          throw new Error(`Failed to fetch patient data: ${response.status} - ${errorData.message || response.statusText}`);
+        }
 
-      const data = await response.json();
-      if (data && Array.isArray(data.patients)) {
-        setPatients(data.patients);
-      } else {
-        throw new Error("Received data is not in the expected format (missing 'patients' array).");
-      }
+        const data = await response.json();
+        if (data && Array.isArray(data.patients)) {
+          loaded = loaded.concat(data.patients);
+          setPatients(loaded);
+          setLoading(false);
+          after = data.next_cursor;
+        } else {
+          throw new Error("Received data is not in the expected format (missing 'patients' array).");
+        }
+      } while (after);
     } catch (err) {
       console.error("Failed to fetch patient data:", err);
       setError(`Failed to load patient data: ${err.message}. Please check server and network connection.`);
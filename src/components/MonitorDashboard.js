@@ -2,6 +2,8 @@ import React, { useState, useEffect, useCallback } from 'react';
 import './MonitorDashboard.css';
 import EmergencyCodeBreakForm from './MonitorEmergencyCodeBreakForm';
 
+const PATIENT_PAGE_SIZE = 200; // Patients requested per page from /monitor/patients
+
 const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout }) => {
   const [patients, setPatients] = useState([]);
   const [codeBrokenPatients, setCodeBrokenPatients] = useState([]);
@@ -9,6 +11,7 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
   const [loadingCodeBroken, setLoadingCodeBroken] = useState(true);
   const [patientsError, setPatientsError] = useState(null);
   const [codeBrokenError, setCodeBrokenError] = useState(null);
+  const [summary, setSummary] = useState(null);
   const [localUserSite, setLocalUserSite] = useState(userSiteProp);
   const [activeView, setActiveView] = useState('dashboard');
   const [message, setMessage] = useState('');
@@ -22,8 +25,8 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
     setTimeout(() => {
       setMessage('');
       setActiveView('dashboard');
+      fetchSiteSummary();
       fetchPatients();
-      fetchCodeBrokenPatients();
     }, 5000);
   };
 
@@ -38,49 +41,47 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
     setMessage('');
   };
 
-  const fetchUserSite = useCallback(async () => {
+  // One request returns the user's site, status counts, code-broken patients,
+  // pending shipments and available packs.
+  const fetchSiteSummary = useCallback(async () => {
     if (!username) {
-      console.warn("MonitorDashboard: Cannot fetch user site: username is missing.");
-      setPatientsError("Authentication error: Username missing. Please relogin.");
-      setLocalUserSite(null);
+      console.warn("MonitorDashboard: Cannot fetch site summary: username is missing.");
+      setPatientsError("Authentication error: User information missing. Please log in.");
+      setCodeBrokenError("Authentication error: User information missing. Please log in.");
+      setLoadingPatients(false);
+      setLoadingCodeBroken(false);
       return;
     }
 
     try {
-      console.log(`MonitorDashboard: userSiteProp not available or invalid, attempting to fetch user site for ${username}...`);
-      const response = await fetch(`${API_BASE_URL}/monitor/get_user_site?username=${username}`);
+      setLoadingCodeBroken(true);
+      setCodeBrokenError(null);
+      console.log(`MonitorDashboard: Fetching site summary for ${username}...`);
+      const response = await fetch(`${API_BASE_URL}/site_summary?username=${username}`);
 
       if (!response.ok) {
-        const errorText = await response.text();
-        console.error("MonitorDashboard: Raw response for get_user_site:", errorText);
-        let errorMsg = `Failed to fetch user site: status ${response.status}`;
-        try {
-            const errorData = JSON.parse(errorText);
-            errorMsg = errorData.message || errorData.error || errorMsg;
-        } catch (jsonParseError) {
-            errorMsg = `Failed to fetch user site: Backend returned non-JSON response. Status: ${response.status}. ` +
-                       `Content starts with: "${errorText.substring(0, 100)}..."`;
-            console.error("MonitorDashboard: JSON parse error during fetchUserSite:", jsonParseError);
+        const errorData = await response.json();
+        const errorMsg = errorData.message || `HTTP error! status: ${response.status}`;
+        if (response.status === 404) {
+          setLocalUserSite(null);
+          setPatientsError(`No site found for user ${username}. Data cannot be displayed.`);
+          setLoadingPatients(false);
+          setPatients([]);
         }
         throw new Error(errorMsg);
       }
-
       const data = await response.json();
-      if (data.userSite) {
-        console.log(`MonitorDashboard: Fetched user site: ${data.userSite} for ${username}`);
-        setLocalUserSite(data.userSite);
-        setPatientsError(null);
-        setCodeBrokenError(null);
-      } else {
-        setLocalUserSite(null);
-        setPatientsError(`No site found for user ${username}. Data cannot be displayed.`);
-        setCodeBrokenError(`No site found for user ${username}. Data cannot be displayed.`);
-        console.warn(`MonitorDashboard: No site found for user ${username} from backend. Data:`, data);
-      }
+      setSummary(data);
+      setLocalUserSite(data.site);
+      setCodeBrokenPatients(data.code_broken_patients || []);
+      console.log(`MonitorDashboard: Fetched site summary for ${data.site}.`);
     } catch (err) {
-      console.error("MonitorDashboard: Error during fetchUserSite:", err);
-      setPatientsError(`Failed to determine user site: ${err.message}. Data cannot be displayed.`);
-      setLocalUserSite(null);
+      console.error("MonitorDashboard: Failed to fetch site summary:", err);
+      setCodeBrokenError(err.message || "Failed to load site summary. Please try again later.");
+      setSummary(null);
+      setCodeBrokenPatients([]);
+    } finally {
+      setLoadingCodeBroken(false);
     }
   }, [username]);
 
@@ -97,15 +98,24 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
       setLoadingPatients(true);
       setPatientsError(null);
       console.log(`MonitorDashboard: Fetching all patients for site ${localUserSite} (user: ${username})...`);
-      const response = await fetch(`${API_BASE_URL}/monitor/patients?username=${username}`);
+      // Load the roster page by page so large sites render the first page immediately
+      let loaded = [];
+      let after = null;
+      do {
+        const afterParam = after ? `&after=${encodeURIComponent(after)}` : '';
+        const response = await fetch(`${API_BASE_URL}/monitor/patients?username=${username}&limit=${PATIENT_PAGE_SIZE}${afterParam}`);
 
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
-      setPatients(data.patients || []);
-      console.log(`MonitorDashboard: Fetched ${data.patients.length} all patients.`);
+        if (!response.ok) {
+          const errorData = await response.json();
+          throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
+        }
+        const data = await response.json();
+        loaded = loaded.concat(data.patients || []);
+        setPatients(loaded);
+        setLoadingPatients(false);
+        after = data.next_cursor;
+      } while (after);
+      console.log(`MonitorDashboard: Fetched ${loaded.length} all patients.`);
     } catch (err) {
       console.error("MonitorDashboard: Failed to fetch patient data:", err);
       setPatientsError(err.message || "Failed to load patient data. Please try again later.");
@@ -115,75 +125,19 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
     }
   }, [localUserSite, username]); // Dependencies for fetchPatients are correct
 
-  const fetchCodeBrokenPatients = useCallback(async () => {
-    if (localUserSite === undefined || localUserSite === null) {
-      console.warn("MonitorDashboard: fetchCodeBrokenPatients: userSite is null/undefined, skipping fetch.");
-      setCodeBrokenError("User site not assigned. Cannot fetch code broken patient data.");
-      setLoadingCodeBroken(false); // Ensure loading is false if skipped
-      setCodeBrokenPatients([]);
-      return;
-    }
-
-    try {
-      setLoadingCodeBroken(true);
-      setCodeBrokenError(null);
-      console.log(`MonitorDashboard: Fetching code-broken patients for site ${localUserSite} (user: ${username})...`);
-      const response = await fetch(`${API_BASE_URL}/monitor/code_broken_by_site?username=${username}`);
-
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
-      setCodeBrokenPatients(data.code_broken_patients || []);
-      console.log(`MonitorDashboard: Fetched ${data.code_broken_patients.length} code-broken patients.`);
-    } catch (err) {
-      console.error("MonitorDashboard: Failed to fetch code broken patient data:", err);
-      setCodeBrokenError(err.message || "Failed to load code broken patient data. Please try again later.");
-      setCodeBrokenPatients([]);
-    } finally {
-      setLoadingCodeBroken(false);
-    }
-  }, [localUserSite, username]); // Dependencies for fetchCodeBrokenPatients are correct
-
-  // Effect for determining and setting user site (runs once or when prop/username changes)
+  // Effect for loading the site summary (site, counts and code broken patients)
   useEffect(() => {
-    if (userSiteProp !== undefined && userSiteProp !== null) {
-      if (localUserSite !== userSiteProp) {
-        console.log(`MonitorDashboard: Using userSite from prop: ${userSiteProp}`);
-        setLocalUserSite(userSiteProp);
-        setPatientsError(null);
-        setCodeBrokenError(null);
-      }
-    } else if (username && (localUserSite === undefined || localUserSite === null)) {
-      console.log(`MonitorDashboard: userSiteProp not available or invalid, attempting to fetch user site for ${username}...`);
-      fetchUserSite();
+    if (activeView === 'dashboard') {
+      fetchSiteSummary();
     }
-  }, [userSiteProp, username, localUserSite, fetchUserSite]);
+  }, [activeView, fetchSiteSummary]);
 
-  // Effect for fetching patients and code broken patients when dependencies change
-  // Removed loadingPatients and loadingCodeBroken from dependencies to prevent infinite loop
+  // Effect for fetching the patient roster once the site is known
   useEffect(() => {
-    if (activeView === 'dashboard') {
-      if (localUserSite !== undefined && localUserSite !== null) {
-        fetchPatients();
-        fetchCodeBrokenPatients();
-      } else if (username) { // Only check username here, loading states are handled by fetch functions
-        // If localUserSite is still null/undefined after fetchUserSite tried, show errors
-        if (!loadingPatients && !loadingCodeBroken) { // Only set error if fetches have completed
-            setPatientsError("User is not assigned to a site. Data cannot be displayed. (Failed to retrieve site information)");
-            setCodeBrokenError("User is not assigned to a site. Data cannot be displayed. (Failed to retrieve site information)");
-            setPatients([]);
-            setCodeBrokenPatients([]);
-        }
-      } else if (!username) {
-          setPatientsError("Authentication error: User information missing. Please log in.");
-          setCodeBrokenError("Authentication error: User information missing. Please log in.");
-          setPatients([]);
-          setCodeBrokenPatients([]);
-      }
+    if (activeView === 'dashboard' && localUserSite !== undefined && localUserSite !== null) {
+      fetchPatients();
     }
-  }, [activeView, localUserSite, username, fetchPatients, fetchCodeBrokenPatients]); // FIXED: Removed loadingPatients, loadingCodeBroken
+  }, [activeView, localUserSite, fetchPatients]);
 
   const handleCodeBreakSuccess = (patientId) => {
     handleSuccess(`Emergency Code Break recorded successfully for Patient ID: ${patientId}`);
@@ -220,6 +174,20 @@ const MonitorDashboard = ({ username, role, userSite: userSiteProp, onLogout })
 
         {activeView === 'dashboard' && (
           <div className="dashboard-content">
+            {summary && (
+              <div className="site-summary">
+                <h2>Site Summary</h2>
+                <p>Total patients: {summary.total_patients}</p>
+                <ul>
+                  {Object.entries(summary.patient_counts).map(([status, count]) => (
+                    <li key={status}>{status}: {count}</li>
+                  ))}
+                </ul>
+                <p>Pending shipments: {summary.pending_shipments.length}</p>
+                <p>Available packs: {Object.entries(summary.available_packs).map(([type, count]) => `${type}: ${count}`).join(', ') || 'None'}</p>
+              </div>
+            )}
+
             <h2>All Patients</h2>
             {loadingPatients ? (
               <p>Loading all patients...</p>
@@ -20,47 +20,35 @@ function RtsmAdmin() { // Renamed from App to RtsmAdmin
     const [currentView, setCurrentView] = useState('secretCode'); // 'secretCode' or 'siteGeneration'
 
     // --- Secret Code Generation Logic ---
-    const generateSecretCode = () => {
-        // Simple 12-character alphanumeric code
-        return Math.random().toString(36).substring(2, 14).toUpperCase();
-    };
-
+    // Codes are generated and stored by the backend in one request
     const handleGenerateAndSaveCodes = async () => {
         setGeneratedCodes([]);
         setMessage('');
         setError('');
 
-        const codesToGenerate = [];
+        const counts = {};
+        if (investigatorCount > 0) counts.Investigator = Number(investigatorCount);
+        if (depotCount > 0) counts.Depot = Number(depotCount);
+        if (monitorCount > 0) counts.Monitor = Number(monitorCount);
 
-        for (let i = 0; i < investigatorCount; i++) {
-            codesToGenerate.push({ role: 'Investigator', code: generateSecretCode() });
-        }
-        for (let i = 0; i < depotCount; i++) {
-            codesToGenerate.push({ role: 'Depot', code: generateSecretCode() });
-        }
-        for (let i = 0; i < monitorCount; i++) {
-            codesToGenerate.push({ role: 'Monitor', code: generateSecretCode() });
-        }
-
-        if (codesToGenerate.length === 0) {
+        if (Object.keys(counts).length === 0) {
             setError('Please enter a number of users for at least one role.');
             return;
         }
 
-        setGeneratedCodes(codesToGenerate); // Display codes immediately
-
         try {
             const response = await fetch('http://localhost:5000/generate_and_save_codes', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ codes: codesToGenerate }),
+                body: JSON.stringify({ counts }),
             });
 
             const data = await response.json();
 
             if (response.ok) {
+                setGeneratedCodes(data.codes || []);
                 setMessage(data.message);
                 if (data.details) {
                     setError(data.details.join('\n'));
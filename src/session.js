@@ -0,0 +1,29 @@
+// Session token issued by /login. It is kept for the browser tab and sent as
+// "Authorization: Bearer <token>" on every call to the backend, so the server
+// reads the user's site and role from the token instead of the users table.
+const TOKEN_KEY = 'rtsmSessionToken';
+const API_ORIGINS = ['http://127.0.0.1:5000', 'http://localhost:5000'];
+
+export const getSessionToken = () => sessionStorage.getItem(TOKEN_KEY);
+
+export const setSessionToken = (token) => {
+    if (token) sessionStorage.setItem(TOKEN_KEY, token);
+    else sessionStorage.removeItem(TOKEN_KEY);
+};
+
+export const clearSessionToken = () => sessionStorage.removeItem(TOKEN_KEY);
+
+// Wraps window.fetch once so every component's backend calls carry the token
+export const installSessionFetch = () => {
+    const baseFetch = window.fetch.bind(window);
+    window.fetch = (input, init = {}) => {
+        const url = typeof input === 'string' ? input : input.url;
+        const token = getSessionToken();
+        if (!token || !API_ORIGINS.some((origin) => url.startsWith(origin))) {
+            return baseFetch(input, init);
+        }
+        const headers = new Headers(init.headers || (typeof input === 'string' ? undefined : input.headers));
+        if (!headers.has('Authorization')) headers.set('Authorization', `Bearer ${token}`);
+        return baseFetch(input, { ...init, headers });
+    };
+};